@@ -0,0 +1,90 @@
+# 两阶段文档路由的基准：全局 chunk 检索 vs 先路由到 top-M 文档再检索，比较延迟与 recall@k
+# 用合成的聚类向量（每个文档一个主题中心，chunk 在中心附近抖动），不需要模型权重：
+#   python benchmarks/bench_doc_routing.py --docs 50,200,1000 --chunks-per-doc 200
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from policy_rag.index.doc_router import DocRouter, route_documents
+from policy_rag.index.numpy_store import NumpyStore
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+def build_corpus(root: Path, n_docs: int, chunks_per_doc: int, dim: int, spread: float, seed: int):
+    rng = np.random.default_rng(seed)
+    centers = _unit(rng.standard_normal((n_docs, dim)))
+    store = NumpyStore(root / "store", "bench")
+    router = DocRouter(root / "router", "bench")
+    for d in range(n_docs):
+        did = f"doc{d:05d}"
+        emb = _unit(centers[d] + spread * rng.standard_normal((chunks_per_doc, dim)))
+        ids = [f"{did}:{i}" for i in range(chunks_per_doc)]
+        store.upsert(ids=ids, documents=ids, embeddings=emb, metadatas=[{"doc_id": did}] * chunks_per_doc)
+        router.upsert_doc(did, emb)
+    return store, router, centers
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", default="50,200,1000")
+    ap.add_argument("--chunks-per-doc", type=int, default=200)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--spread", type=float, default=0.08, help="Per-dim noise around each doc's topic center")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=8)
+    ap.add_argument("--top-m", type=int, default=3)
+    ap.add_argument("--min-score", type=float, default=0.5)
+    ap.add_argument("--min-margin", type=float, default=0.02)
+    args = ap.parse_args()
+
+    print(
+        f"chunks/doc={args.chunks_per_doc} dim={args.dim} queries={args.queries} "
+        f"top_k={args.top_k} top_m={args.top_m}"
+    )
+    print(f"{'docs':>6}{'chunks':>9}{'flat ms':>10}{'routed ms':>11}{'speedup':>9}{'recall@k':>10}{'fallback':>10}")
+
+    for n_docs in [int(x) for x in args.docs.split(",") if x.strip()]:
+        with tempfile.TemporaryDirectory() as tmp:
+            store, router, centers = build_corpus(
+                Path(tmp), n_docs, args.chunks_per_doc, args.dim, args.spread, seed=n_docs
+            )
+            rng = np.random.default_rng(0)
+            topics = rng.integers(0, n_docs, size=args.queries)
+            queries = _unit(centers[topics] + args.spread * rng.standard_normal((args.queries, args.dim)))
+
+            flat_ms: list[float] = []
+            routed_ms: list[float] = []
+            recalls: list[float] = []
+            n_fallback = 0
+            for q in queries:
+                t0 = time.perf_counter()
+                truth = store.query(q[None, :], n_results=args.top_k)["ids"][0]
+                flat_ms.append((time.perf_counter() - t0) * 1000)
+
+                t0 = time.perf_counter()
+                picked, _ = route_documents(
+                    router.scores(q), top_m=args.top_m, min_score=args.min_score, min_margin=args.min_margin
+                )
+                where = {"doc_id": {"$in": picked}} if picked is not None else None
+                got = store.query(q[None, :], n_results=args.top_k, where=where)["ids"][0]
+                if len(got) < args.top_k:
+                    got = store.query(q[None, :], n_results=args.top_k)["ids"][0]
+                routed_ms.append((time.perf_counter() - t0) * 1000)
+
+                n_fallback += picked is None
+                recalls.append(len(set(got) & set(truth)) / max(1, len(truth)))
+
+            flat = float(np.median(flat_ms))
+            routed = float(np.median(routed_ms))
+            print(
+                f"{n_docs:>6}{n_docs * args.chunks_per_doc:>9}{flat:>10.2f}{routed:>11.2f}"
+                f"{flat / max(routed, 1e-9):>9.2f}{float(np.mean(recalls)):>10.3f}{n_fallback:>10}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# 多进程 embedding 池的吞吐基准：chunks/sec 随 worker 数的变化
+# 用法（需要本地已缓存 embedding 模型权重）：
+#   python benchmarks/bench_embed_pool.py --chunks 2000 --workers 1,2,4,8
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from policy_rag.llm.embed_pool import EmbeddingPool
+from policy_rag.llm.embeddings import embed_texts_np
+
+_PHRASES = [
+    "申请国家奖学金的学生应当具备以下条件",
+    "学分绩点排名位于本专业前百分之十",
+    "本办法自发布之日起施行，由学生工作部负责解释",
+    "申请材料包括申请表、成绩单及获奖证明复印件",
+    "评审结果在学院网站公示五个工作日",
+    "有下列情形之一者，取消当年评选资格",
+    "第十二条 研究生在学期间受到纪律处分的",
+]
+
+def make_chunks(n: int, chars: int, seed: int = 0) -> list[str]:
+    rnd = random.Random(seed)
+    out: list[str] = []
+    for i in range(n):
+        parts: list[str] = [f"第{i}段："]
+        while sum(len(p) for p in parts) < chars:
+            parts.append(rnd.choice(_PHRASES) + "。")
+        out.append("".join(parts)[:chars])
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="BAAI/bge-small-zh-v1.5")
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--chars", type=int, default=500)
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--cores-per-worker", type=int, default=0)
+    args = ap.parse_args()
+
+    texts = make_chunks(args.chunks, args.chars)
+
+    # 基线：单进程（和不开 --embed-pool 的 ingest 一样）
+    embed_texts_np(texts[: args.batch_size], args.model, batch_size=args.batch_size)  # 预热模型
+    t0 = time.perf_counter()
+    base = embed_texts_np(texts, args.model, batch_size=args.batch_size)
+    base_s = time.perf_counter() - t0
+    base_rate = len(texts) / base_s
+
+    print(f"chunks={len(texts)} chars/chunk={args.chars} batch_size={args.batch_size}")
+    print(f"{'mode':<22}{'seconds':>10}{'chunks/s':>12}{'speedup':>10}{'max|diff|':>12}")
+    print(f"{'in-process':<22}{base_s:>10.2f}{base_rate:>12.1f}{1.0:>10.2f}{0.0:>12.2e}")
+
+    for w in [int(x) for x in args.workers.split(",") if x.strip()]:
+        with EmbeddingPool(args.model, workers=w, cores_per_worker=args.cores_per_worker) as pool:
+            pool.warmup()
+            t0 = time.perf_counter()
+            vecs = pool.encode(texts, batch_size=args.batch_size)
+            sec = time.perf_counter() - t0
+
+        # 行序必须与单进程一致
+        diff = float(np.abs(vecs - base).max())
+        rate = len(texts) / sec
+        label = f"pool workers={w}"
+        print(f"{label:<22}{sec:>10.2f}{rate:>12.1f}{rate / base_rate:>10.2f}{diff:>12.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# 各 embedding 后端（torch / onnx / onnx-int8）的 CPU 延迟与吞吐基准，附带与 torch 的 cosine 一致性
+# 用法（需要本地已缓存模型权重；onnx 后端首次运行会从本地权重导出）：
+#   python benchmarks/bench_embedding_backends.py --backends torch,onnx,onnx-int8
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from policy_rag.llm.embedding_backends import load_backend, parity_check
+
+_QUERIES = [
+    "国家奖学金申请条件",
+    "研究生学业奖学金评定办法",
+    "学分绩点如何计算",
+    "申请材料需要提交哪些",
+    "评审结果公示期多长",
+    "受到纪律处分还能评奖学金吗",
+    "第十二条规定了什么",
+    "奖学金发放时间",
+]
+
+_CHUNK = (
+    "第十二条 申请国家奖学金的学生应当具备以下条件：热爱社会主义祖国，拥护中国共产党的领导；"
+    "遵守宪法和法律，遵守学校规章制度；诚实守信，道德品质优良；在校期间学习成绩优异，"
+    "学分绩点排名位于本专业前百分之十。申请材料包括申请表、成绩单及获奖证明复印件，"
+    "评审结果在学院网站公示五个工作日。"
+)
+
+def _pct(xs: list[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="BAAI/bge-small-zh-v1.5")
+    ap.add_argument("--backends", default="torch,onnx,onnx-int8")
+    ap.add_argument("--onnx-dir", default="data/models/onnx")
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--chunks", type=int, default=256)
+    ap.add_argument("--batch-size", type=int, default=32)
+    args = ap.parse_args()
+
+    chunks = [f"{i}. {_CHUNK}" for i in range(args.chunks)]
+    backends = {
+        name: load_backend(args.model, name, onnx_dir=Path(args.onnx_dir), num_threads=args.threads)
+        for name in [b.strip() for b in args.backends.split(",") if b.strip()]
+    }
+    ref = backends.get("torch")
+
+    print(f"model={args.model} rounds={args.rounds} chunks={args.chunks} batch_size={args.batch_size}")
+    print(f"{'backend':<12}{'q p50 ms':>10}{'q p95 ms':>10}{'chunks/s':>11}{'mean_cos':>10}{'min_cos':>10}")
+
+    for name, b in backends.items():
+        b.encode(_QUERIES[:1], batch_size=1)  # 预热
+
+        lat: list[float] = []
+        for _ in range(args.rounds):
+            for q in _QUERIES:
+                t0 = time.perf_counter()
+                b.encode([q], batch_size=1)
+                lat.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        b.encode(chunks, batch_size=args.batch_size)
+        rate = len(chunks) / (time.perf_counter() - t0)
+
+        mean_cos = min_cos = float("nan")
+        if ref is not None and b is not ref:
+            rep = parity_check(ref, b, _QUERIES + chunks[:32])
+            mean_cos, min_cos = rep["mean_cos"], rep["min_cos"]
+        elif b is ref:
+            mean_cos = min_cos = 1.0
+
+        print(
+            f"{name:<12}{statistics.median(lat):>10.2f}{_pct(lat, 95):>10.2f}"
+            f"{rate:>11.1f}{mean_cos:>10.4f}{min_cos:>10.4f}"
+        )
+
+if __name__ == "__main__":
+    main()
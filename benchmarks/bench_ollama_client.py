@@ -0,0 +1,78 @@
+# OllamaClient 单次调用开销：每次新建连接（旧实现的 urllib 方式）vs keep-alive 连接池
+# 对着本地假 Ollama（benchmarks/fake_ollama.py）测，排除模型生成时间，只看 HTTP 层：
+#   python benchmarks/bench_ollama_client.py --calls 500 --threads 1,8
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_ollama import FakeOllama
+
+from policy_rag.llm.llm_client import ChatMessage, OllamaClient
+
+_MESSAGES = [
+    ChatMessage(role="system", content="只输出 JSON。"),
+    ChatMessage(role="user", content="国家奖学金的申请条件是什么？"),
+]
+
+def legacy_chat(base_url: str) -> str:
+    # 旧实现：每次调用 build_opener + 新 TCP 连接
+    payload = {
+        "model": "fake",
+        "messages": [{"role": m.role, "content": m.content} for m in _MESSAGES],
+        "stream": False,
+    }
+    req = urllib.request.Request(
+        url=f"{base_url}/api/chat",
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    with opener.open(req, timeout=240) as resp:
+        return json.loads(resp.read().decode("utf-8"))["message"]["content"]
+
+def run(fn, calls: int, threads: int) -> tuple[float, list[float]]:
+    lat: list[float] = []
+
+    def one(_i: int) -> None:
+        t0 = time.perf_counter()
+        fn()
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(one, range(calls)))
+    return time.perf_counter() - t0, lat
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=500)
+    ap.add_argument("--threads", default="1,8")
+    ap.add_argument("--delay-ms", type=float, default=0.0, help="Simulated generation time on the fake server")
+    ap.add_argument("--pool-size", type=int, default=8)
+    args = ap.parse_args()
+
+    print(f"calls={args.calls} delay_ms={args.delay_ms} pool_size={args.pool_size}")
+    print(f"{'client':<12}{'threads':>8}{'calls/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'conns':>7}")
+    for threads in [int(x) for x in args.threads.split(",") if x.strip()]:
+        for name in ("legacy", "pooled"):
+            with FakeOllama(delay_ms=args.delay_ms) as srv:
+                client = OllamaClient(srv.url, model="fake", pool_size=args.pool_size)
+                fn = (lambda: legacy_chat(srv.url)) if name == "legacy" else (lambda: client.chat(_MESSAGES))
+                fn() # 预热
+                sec, lat = run(fn, args.calls, threads)
+                lat.sort()
+                p95 = lat[int(0.95 * (len(lat) - 1))]
+                print(
+                    f"{name:<12}{threads:>8}{args.calls / sec:>10.0f}{statistics.median(lat):>9.2f}"
+                    f"{p95:>9.2f}{srv.connections:>7}"
+                )
+                client.close()
+
+if __name__ == "__main__":
+    main()
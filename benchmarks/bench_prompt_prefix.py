@@ -0,0 +1,123 @@
+# prompt 前缀稳定性：连续请求之间有多少 prompt 是逐字节相同的前缀（llama.cpp 可以直接复用这部分 KV cache）
+# 对着本地假 Ollama（benchmarks/fake_ollama.py，记录每个请求体）依次发一组问题，按 Qwen 的 chat 模板
+# 把 messages 渲染成模型实际看到的文本，统计每个请求与上一个请求的公共前缀占比：
+# - legacy：旧排布，问题在最前面，规则后半段与 JSON 格式说明排在 SOURCES 之后
+# - current：规则 + 格式说明固定在 system 消息里，SOURCES 与问题在后
+#   python benchmarks/bench_prompt_prefix.py --queries 20 --top-k 8
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+
+from fake_ollama import FakeOllama
+
+from policy_rag.llm.llm_client import ChatMessage, OllamaClient
+from policy_rag.prompts.context_packer import estimate_tokens, pack_sources
+from policy_rag.prompts.qa_prompt import INSTRUCTIONS, OUTPUT_SPEC, SYSTEM_PROMPT, USER_TEMPLATE
+
+_TOPICS = ["国家奖学金", "助学金", "学业奖学金", "转专业", "缓考", "休学", "学籍异动", "宿舍调整", "勤工助学", "评优评先"]
+_ASKS = ["申请条件是什么？", "需要提交哪些材料？", "什么时候截止？", "流程是怎样的？", "有哪些例外情况？"]
+_CLAUSES = [
+    "申请者须为全日制在读学生，且上一学年无违纪处分。",
+    "学院评审小组应在每年{d}月{d2}日前完成初审并报学校审核。",
+    "评审结果在学院网站公示{n}个工作日，公示无异议后报批。",
+    "申请材料包括申请表、成绩单、获奖证明及相关佐证材料。",
+    "学习成绩排名须位于本专业前{n}0%，综合测评排名前{n}0%。",
+    "因病或其他特殊原因不能参加考试的，应提前提交书面申请。",
+    "同一学年内不得同时获得{n}项及以上同类奖励。",
+    "具体事宜由学生工作处负责解释，咨询电话见学院通知。",
+]
+
+def _legacy_messages(question: str, sources: str) -> list[ChatMessage]:
+    # 旧排布（复刻改动前的 USER_TEMPLATE）：问题在 user 消息开头，格式说明在 SOURCES 之后
+    user = f"问题：\n{question}\n\n【SOURCES】（每条都有 source_id，引用时只能引用这些 source_id）：\n{sources}\n\n{OUTPUT_SPEC}"
+    return [ChatMessage(role="system", content=INSTRUCTIONS), ChatMessage(role="user", content=user)]
+
+def _current_messages(question: str, sources: str) -> list[ChatMessage]:
+    return [
+        ChatMessage(role="system", content=SYSTEM_PROMPT),
+        ChatMessage(role="user", content=USER_TEMPLATE.format(question=question, sources=sources)),
+    ]
+
+def _render(payload: dict) -> str:
+    # Qwen2.5 的 chat 模板（ChatML）；Ollama 把 messages 渲染成这样再交给 llama.cpp
+    parts = [f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in payload["messages"]]
+    return "".join(parts) + "<|im_start|>assistant\n"
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def _make_queries(n: int, top_k: int, seed: int) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        q = rng.choice(_TOPICS) + rng.choice(_ASKS)
+        srcs = []
+        for _ in range(top_k):
+            text = "".join(
+                rng.choice(_CLAUSES).format(d=rng.randint(1, 12), d2=rng.randint(1, 28), n=rng.randint(2, 9))
+                for _ in range(rng.randint(3, 8))
+            )
+            srcs.append((text, {"doc_id": f"doc{rng.randint(1, 40)}", "page_number": rng.randint(1, 30)}))
+        out.append((q, pack_sources(srcs, budget_tokens=3000, max_tokens_per_source=600).text))
+    return out
+
+def run(layout: str, queries: list[tuple[str, str]], num_ctx: int, keep_alive: str) -> dict:
+    build = _legacy_messages if layout == "legacy" else _current_messages
+    with FakeOllama(record=True) as srv:
+        client = OllamaClient(srv.url, model="fake", num_ctx=num_ctx, keep_alive=keep_alive)
+        for q, sources in queries:
+            client.chat(build(q, sources))
+        client.close()
+        payloads = srv.payloads
+
+    prompts = [_render(p) for p in payloads]
+    ratios: list[float] = []
+    shared_tokens: list[int] = []
+    total_tokens: list[int] = []
+    for prev, cur in zip(prompts, prompts[1:]):
+        k = _common_prefix(prev, cur)
+        shared, total = estimate_tokens(cur[:k]), estimate_tokens(cur)
+        ratios.append(shared / total)
+        shared_tokens.append(shared)
+        total_tokens.append(total)
+
+    opts = payloads[-1].get("options", {})
+    return {
+        "layout": layout,
+        "requests": len(prompts),
+        "mean_prompt_tokens": statistics.mean(total_tokens),
+        "mean_shared_prefix_tokens": statistics.mean(shared_tokens),
+        "shared_prefix_ratio": statistics.mean(ratios),
+        "min_shared_prefix_ratio": min(ratios),
+        "num_ctx": opts.get("num_ctx"),
+        "keep_alive": payloads[-1].get("keep_alive"),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=int, default=20)
+    ap.add_argument("--top-k", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--num-ctx", type=int, default=8192)
+    ap.add_argument("--keep-alive", default="30m")
+    args = ap.parse_args()
+
+    queries = _make_queries(args.queries, args.top_k, args.seed)
+    print(f"queries={args.queries} top_k={args.top_k} (tokens are estimates, ChatML rendering)")
+    print(f"{'layout':<8} {'prompt_tok':>10} {'shared_tok':>10} {'shared%':>8} {'min%':>6}  options")
+    for layout in ("legacy", "current"):
+        r = run(layout, queries, args.num_ctx, args.keep_alive)
+        print(
+            f"{r['layout']:<8} {r['mean_prompt_tokens']:>10.0f} {r['mean_shared_prefix_tokens']:>10.0f} "
+            f"{100 * r['shared_prefix_ratio']:>7.1f}% {100 * r['min_shared_prefix_ratio']:>5.1f}%  "
+            f"num_ctx={r['num_ctx']} keep_alive={r['keep_alive']}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# OllamaClient 连接池的边界行为检查：对着本地假 Ollama 走三条平时难以触发的路径，结果不符时以非零状态退出
+#   1) 复用的空闲连接已被服务端关闭（_STALE_ERRORS）：换新连接重试一次，调用本身成功
+#   2) 池里的连接全被占用：等待 pool_wait_timeout 后抛 PoolExhaustedError（TimeoutError），而不是无限阻塞
+#   3) chat_stream 只读了一部分就被关闭：这条连接上还有未读数据，不能放回池里
+#   python benchmarks/check_ollama_pool.py
+from __future__ import annotations
+
+import argparse
+import time
+
+from fake_ollama import FakeOllama
+
+from policy_rag.llm.llm_client import ChatMessage, OllamaClient, PoolExhaustedError
+
+_MESSAGES = [
+    ChatMessage(role="system", content="只输出 JSON。"),
+    ChatMessage(role="user", content="国家奖学金的申请条件是什么？"),
+]
+
+# 流式回复足够长，读完第一块时服务端还在继续输出
+_LONG_REPLY = "奖学金" * 200
+
+def check_stale_retry() -> None:
+    with FakeOllama() as srv:
+        client = OllamaClient(srv.url, model="fake", pool_size=1)
+        try:
+            srv.drop_after_response = True
+            assert client.chat(_MESSAGES), "first call returned nothing"
+            time.sleep(0.05) # 等服务端的 FIN 到达，池里那条空闲连接此时已失效
+            srv.drop_after_response = False
+
+            assert client.chat(_MESSAGES), "call on a stale connection returned nothing"
+            st = client.stats()
+            assert st["stale_retries"] == 1, st
+            assert st["connections_created"] == 2, st
+            assert srv.requests == 2, f"server saw {srv.requests} requests"
+        finally:
+            client.close()
+
+def check_pool_exhaustion(timeout_s: float) -> None:
+    with FakeOllama(token_ms=20, token_chars=1, reply=lambda _p: _LONG_REPLY) as srv:
+        client = OllamaClient(srv.url, model="fake", pool_size=1, pool_wait_timeout=timeout_s)
+        stream = client.chat_stream(_MESSAGES)
+        try:
+            next(stream) # 唯一的连接被这条流占着
+            t0 = time.perf_counter()
+            try:
+                client.chat(_MESSAGES)
+            except PoolExhaustedError:
+                waited = time.perf_counter() - t0
+                assert waited >= timeout_s * 0.9, f"gave up after {waited:.3f}s, expected ~{timeout_s}s"
+            else:
+                raise AssertionError("chat() succeeded although the pool was exhausted")
+            st = client.stats()
+            assert st["in_use"] == 1 and st["exhausted"] == 1, st
+        finally:
+            stream.close()
+            client.close()
+
+def check_partial_stream_discarded() -> None:
+    with FakeOllama(token_ms=5, token_chars=1, reply=lambda _p: _LONG_REPLY) as srv:
+        client = OllamaClient(srv.url, model="fake", pool_size=2)
+        try:
+            stream = client.chat_stream(_MESSAGES)
+            next(stream)
+            stream.close() # 调用方提前停止迭代（例如 SSE 客户端断开）
+            st = client.stats()
+            assert st["idle"] == 0 and st["in_use"] == 0, st
+            assert st["discarded"] == 1, st
+
+            # 之后的调用在新连接上拿到完整回复，而不是读到上一条流的残留数据
+            assert client.chat(_MESSAGES) == _LONG_REPLY
+            st = client.stats()
+            assert st["connections_created"] == 2 and st["connections_reused"] == 0, st
+        finally:
+            client.close()
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--timeout-s", type=float, default=0.3, help="pool_wait_timeout used for the pool exhaustion check")
+    args = ap.parse_args()
+
+    checks = [
+        ("stale connection retry", check_stale_retry),
+        ("pool exhaustion -> PoolExhaustedError", lambda: check_pool_exhaustion(args.timeout_s)),
+        ("partial stream not pooled", check_partial_stream_discarded),
+    ]
+    failed = 0
+    for name, fn in checks:
+        try:
+            fn()
+        except Exception as e:
+            failed += 1
+            print(f"FAIL  {name}: {type(e).__name__}: {e}")
+        else:
+            print(f"ok    {name}")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# 本地假 Ollama 服务：实现 /api/chat 的最小子集（含 stream=true 的 NDJSON 分块输出），
+# 用来测客户端的单次调用开销、连接复用、首 token 时间，也可以在没有 GPU / 模型的机器上把 API 跑通。
+#   python benchmarks/fake_ollama.py --port 11435 --delay-ms 50 --token-ms 5
+#   OLLAMA_BASE_URL=http://127.0.0.1:11435 uvicorn policy_rag.api.app:app
+# 代码里用作 fixture：
+#   with FakeOllama(delay_ms=0) as srv:
+#       client = OllamaClient(srv.url, model="fake")
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+# 默认回复：一个合法的 Refusal JSON，/chat 与 ask 的解析链路都能走通
+DEFAULT_REPLY = json.dumps(
+    {"refusal": True, "reason": "fake ollama", "follow_up_questions": [], "warnings": []},
+    ensure_ascii=False,
+)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # 支持 keep-alive
+    server: "_Server"
+
+    def setup(self) -> None:
+        super().setup()
+        # 和真实 Ollama（Go net/http 默认开启）一致：关掉 Nagle，否则响应头与正文分两次写会等 delayed ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, obj: dict[str, Any]) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已取消（超时 / 断开）
+            self.close_connection = True
+
+    def do_POST(self) -> None:
+        n = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(n) or b"{}")
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.last_payload = payload
+            if self.server.payloads is not None:
+                self.server.payloads.append(payload)
+
+        if self.path != "/api/chat":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        if self.server.delay_ms > 0:
+            time.sleep(self.server.delay_ms / 1000)
+        content = self.server.reply(payload)
+        if payload.get("stream"):
+            try:
+                self._stream(payload, content)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True # 客户端中途断开（例如 SSE 的浏览器关闭了页面）
+        else:
+            self._send_json(
+                200,
+                {
+                    "model": payload.get("model", "fake"),
+                    "message": {"role": "assistant", "content": content},
+                    "done": True,
+                },
+            )
+        if self.server.drop_after_response:
+            # 模拟 keep-alive 超时：响应里没有 Connection: close，但回完就断开，客户端池里留下一条失效连接
+            self.close_connection = True
+
+    def _stream(self, payload: dict[str, Any], content: str) -> None:
+        # 和 Ollama 一样：chunked 传输，每行一个 JSON，最后一行 done=true
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(obj: dict[str, Any]) -> None:
+            line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+        model = payload.get("model", "fake")
+        step = max(1, self.server.token_chars)
+        for i in range(0, len(content), step):
+            if self.server.token_ms > 0:
+                time.sleep(self.server.token_ms / 1000)
+            chunk({"model": model, "message": {"role": "assistant", "content": content[i : i + step]}, "done": False})
+        chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        addr: tuple[str, int],
+        delay_ms: float,
+        reply: Callable[[dict[str, Any]], str],
+        token_ms: float = 0.0,
+        token_chars: int = 4,
+        record: bool = False,
+        drop_after_response: bool = False,
+    ):
+        super().__init__(addr, _Handler)
+        self.lock = threading.Lock()
+        self.delay_ms = float(delay_ms)
+        self.token_ms = float(token_ms)
+        self.token_chars = int(token_chars)
+        self.reply = reply
+        self.drop_after_response = bool(drop_after_response)
+        self.connections = 0
+        self.requests = 0
+        self.last_payload: dict[str, Any] | None = None
+        self.payloads: list[dict[str, Any]] | None = [] if record else None
+
+class FakeOllama:
+    """在后台线程里跑一个假 Ollama；port=0 时自动分配空闲端口。"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        delay_ms: float = 0.0,
+        reply: Callable[[dict[str, Any]], str] | None = None,
+        token_ms: float = 0.0,
+        token_chars: int = 4,
+        record: bool = False,
+        drop_after_response: bool = False,
+    ):
+        """
+        delay_ms：收到请求到开始输出的时间；token_ms / token_chars：流式输出时每个分块的间隔与字符数；
+        record：保留收到的每个请求体（.payloads），用于检查 prompt 排布；
+        drop_after_response：每次响应后直接关闭连接（不发 Connection: close），用于测失效连接重试。
+        """
+        self._server = _Server(
+            (host, port),
+            delay_ms,
+            reply or (lambda _payload: DEFAULT_REPLY),
+            token_ms=token_ms,
+            token_chars=token_chars,
+            record=record,
+            drop_after_response=drop_after_response,
+        )
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    @property
+    def requests(self) -> int:
+        return self._server.requests
+
+    @property
+    def drop_after_response(self) -> bool:
+        return self._server.drop_after_response
+
+    @drop_after_response.setter
+    def drop_after_response(self, value: bool) -> None:
+        self._server.drop_after_response = bool(value)
+
+    @property
+    def last_payload(self) -> dict[str, Any] | None:
+        return self._server.last_payload
+
+    @property
+    def payloads(self) -> list[dict[str, Any]]:
+        return list(self._server.payloads or [])
+
+    def start(self) -> "FakeOllama":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOllama":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--delay-ms", type=float, default=0.0, help="Simulated time before the first token")
+    ap.add_argument("--token-ms", type=float, default=0.0, help="Simulated time per streamed chunk")
+    args = ap.parse_args()
+
+    srv = FakeOllama(args.host, args.port, delay_ms=args.delay_ms, token_ms=args.token_ms)
+    print(f"fake ollama listening on {srv.url} (delay={args.delay_ms}ms token={args.token_ms}ms)")
+    try:
+        srv._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,49 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
+from fastapi import Depends, FastAPI
+
+from policy_rag.api.deps import AppResources, build_resources, get_resources, warmup
 from policy_rag.api.routes_chat import router as chat_router
 from policy_rag.api.routes_ingest import router as ingest_router
 from policy_rag.api.routes_summary import router as summary_router
+from policy_rag.llm.embed_pool import close_embedding_pool
+from policy_rag.llm.embeddings import disable_query_batchers, enable_query_batcher, get_query_batcher, get_query_cache
+from policy_rag.retrieval.rerank import get_reranker
+
+# lifespan：应用启动时执行 yield 之前的部分，关闭时执行 yield 之后的部分
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 进程级共享资源：一份 Settings、一个向量库（VectorStore）、一个 OllamaClient
+    res = build_resources()
+    settings = res.settings
+    app.state.resources = res
+
+    if settings.api_warmup:
+        warmup(res)
+
+    if settings.query_batch_enabled:
+        enable_query_batcher(
+            settings.embedding_model,
+            max_batch=settings.query_batch_max_size,
+            max_wait_ms=settings.query_batch_max_wait_ms,
+        )
+    yield
+    disable_query_batchers()
+    await res.llm.aclose()
+    # /ingest?use_embed_pool=1 会起一组 worker 进程；不关掉的话 uvicorn 退出 / reload 后它们还留着
+    close_embedding_pool()
+    if res.embed_cache is not None:
+        res.embed_cache.flush()
+    if res.answers is not None:
+        res.answers.close()
 
 app = FastAPI(
     title="Policy RAG Assistant",
     version="0.2.1",
-    description="Campus policy RAG asssistant (Phase 2 API)"
+    description="Campus policy RAG asssistant (Phase 2 API)",
+    lifespan=lifespan,
 )
 
 # 将子路由集合接到主APP上，让它们真正生效
@@ -19,4 +53,21 @@ app.include_router(summary_router)
 
 @app.get("/health")
 def health():
-    return {"ok": True}
\ No newline at end of file
+    return {"ok": True}
+
+# 运行时缓存/队列等指标，便于按命中率调参（例如 QUERY_CACHE_SIZE）
+@app.get("/stats")
+def stats(res: AppResources = Depends(get_resources)):
+    batcher = get_query_batcher(res.settings.embedding_model)
+    return {
+        "startup": res.startup_stats,
+        "query_embedding_cache": get_query_cache().stats(),
+        "query_batcher": batcher.stats() if batcher is not None else None,
+        "doc_router": res.router.stats(),
+        "answer_cache": res.answers.stats() if res.answers is not None else None,
+        "ollama": res.llm.stats(),
+        "llm_completion_cache": res.llm.completion_stats(),
+        "semantic_cache": res.semantic.stats() if res.semantic is not None else None,
+        "coalescing": res.flights.stats() if res.flights is not None else None,
+        "rerank_score_cache": get_reranker(res.settings).cache.stats() if res.settings.rerank_enabled else None,
+    }
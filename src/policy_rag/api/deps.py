@@ -0,0 +1,138 @@
+# 应用级（进程级）共享资源：在 lifespan 里创建一次，通过 FastAPI 依赖注入给各路由
+# 避免每个请求都重新读 Settings、打开 chromadb.PersistentClient、新建 OllamaClient
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+from rich.console import Console
+
+from policy_rag.config.settings import Settings
+from policy_rag.index.adjacency import AdjacencyIndex, open_adjacency_index
+from policy_rag.index.base import VectorStore, open_vector_store
+from policy_rag.index.doc_router import DocRouter, open_doc_router
+from policy_rag.index.lexical_index import LexicalIndex, open_lexical_index
+from policy_rag.llm.answer_cache import AnswerCache, open_answer_cache
+from policy_rag.llm.async_client import AsyncOllamaClient, LLMBusyError, open_async_ollama_client
+from policy_rag.llm.embedding_cache import EmbeddingCache, open_embedding_cache
+from policy_rag.llm.embeddings import warmup_embeddings
+from policy_rag.llm.semantic_cache import SemanticAnswerCache, open_semantic_cache
+from policy_rag.llm.single_flight import SingleFlight, open_single_flight
+from policy_rag.retrieval.rerank import get_reranker
+
+console = Console()
+
+T = TypeVar("T")
+
+@dataclass
+class AppResources:
+    settings: Settings
+    store: VectorStore
+    llm: AsyncOllamaClient
+    lexical: LexicalIndex
+    adjacency: AdjacencyIndex
+    router: DocRouter
+    answers: AnswerCache | None
+    semantic: SemanticAnswerCache | None
+    flights: SingleFlight | None
+    # /ingest 共用一个 embedding 缓存实例（进程内由实例自己的锁互斥，跨进程由文件锁互斥）
+    embed_cache: EmbeddingCache | None = None
+    # 启动/预热耗时，便于观察部署后的冷启动成本
+    startup_stats: dict[str, Any] = field(default_factory=dict)
+
+def build_resources(settings: Settings | None = None) -> AppResources:
+    settings = settings or Settings.from_repo_root()
+
+    t0 = time.perf_counter()
+    store = open_vector_store(settings)
+    lexical = open_lexical_index(settings)
+    adjacency = open_adjacency_index(settings)
+    router = open_doc_router(settings)
+    answers = open_answer_cache(settings)
+    semantic = open_semantic_cache(settings)
+    flights = open_single_flight(settings)
+    embed_cache = open_embedding_cache(settings)
+    t1 = time.perf_counter()
+
+    llm = open_async_ollama_client(settings)
+
+    return AppResources(
+        settings=settings,
+        store=store,
+        llm=llm,
+        lexical=lexical,
+        adjacency=adjacency,
+        router=router,
+        answers=answers,
+        semantic=semantic,
+        flights=flights,
+        embed_cache=embed_cache,
+        startup_stats={"store_open_ms": (t1 - t0) * 1000},
+    )
+
+def warmup(res: AppResources) -> None:
+    """
+    预热：加载 embedding 模型并跑一次编码、触发 collection 的首次读取，
+    让部署后的第一个真实请求不用承担模型加载时间。
+    """
+    t0 = time.perf_counter()
+    warmup_embeddings(res.settings.embedding_model)
+    t1 = time.perf_counter()
+    count = res.store.count()
+    t2 = time.perf_counter()
+    if res.settings.rerank_enabled:
+        get_reranker(res.settings).warmup()
+        res.startup_stats["rerank_warmup_ms"] = (time.perf_counter() - t2) * 1000
+
+    res.startup_stats.update(
+        {
+            "embedding_warmup_ms": (t1 - t0) * 1000,
+            "store_count_ms": (t2 - t1) * 1000,
+            "collection_count": count,
+        }
+    )
+    console.print(f"[dim]warmup: {res.startup_stats}[/dim]")
+
+def get_resources(request: Request) -> AppResources:
+    return request.app.state.resources
+
+def llm_http_error(e: Exception) -> HTTPException:
+    """
+    准入拒绝 / 超过期限 转成对应的 HTTP 错误（429 / 503 带 Retry-After，504）；
+    模型输出解析 / 校验失败（ValueError，含 pydantic ValidationError）与其它异常（Ollama 返回错误、连接失败等）是 502。
+    调用方负责 `raise ... from e` 保留原始异常。
+    """
+    if isinstance(e, LLMBusyError):
+        return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+    if isinstance(e, TimeoutError):
+        # LLMDeadlineError（超过请求期限）、LLMReadTimeoutError（Ollama 长时间无输出），或等待合并请求的结果超时
+        return HTTPException(status_code=504, detail=str(e) or "Timed out waiting for the answer")
+    if isinstance(e, ValueError):
+        return HTTPException(status_code=502, detail=f"Malformed model output: {str(e)[:500]}")
+    return HTTPException(status_code=502, detail=f"LLM call failed: {e}")
+
+async def run_llm(request: Request, aw: Awaitable[T], poll_s: float = 0.5) -> T:
+    """
+    等待一次 LLM 调用；期间轮询客户端是否已断开，断开就取消它（释放名额、断开与 Ollama 的连接）。
+    普通（非流式）路由里 uvicorn 不会因为客户端断开而取消处理函数，所以需要自己盯着。
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_s)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Ollama 没起 / 连接被重置 / 返回错误、模型输出不合格等都不应该变成裸的 500
+        raise llm_http_error(e) from e
+    finally:
+        if not task.done():
+            task.cancel()
@@ -14,6 +14,8 @@ class ChatRequest(BaseModel):
     category: Optional[str] = None
     show_sources: bool = True
     max_chars_per_source: int = Field(900, ge=200, le=2000)
+    # 每个命中前后各接几个相邻 chunk（None = 使用服务端 NEIGHBOR_EXPAND 配置）
+    expand_neighbors: Optional[int] = Field(None, ge=0, le=3)
 
 class EvidenceGateInfo(BaseModel):
     ok: bool
@@ -24,7 +26,9 @@ class EvidenceGateInfo(BaseModel):
 class Source(BaseModel):
     source_id: int
     chunk_id: str
-    distance: float
+    distance: Optional[float] = None # 混合检索中只被 BM25 召回的 chunk 没有向量距离
+    fused_score: Optional[float] = None
+    rerank_score: Optional[float] = None
     doc_id: str
     title: str = ""
     category: str = ""
@@ -39,11 +43,24 @@ class RefusalPayload(BaseModel):
     follow_up_questions: list[str] = Field(default_factory=list)
     warnings: list[str] = Field(default_factory=list)
 
+class SemanticCacheHit(BaseModel):
+    # 本次回答复用的是哪个“近似问题”的回答，以及两者的 cosine 相似度
+    matched_query: str
+    similarity: float
+
 class ChatResponse(BaseModel):
     gate: EvidenceGateInfo
     refusal: Optional[RefusalPayload] = None
     answer: Optional[StructuredAnswer] = None
     sources: list[Source] = Field(default_factory=list)
+    # 检索各阶段耗时（retrieve_ms、rerank.elapsed_ms / timed_out 等）
+    retrieval: dict[str, Any] = Field(default_factory=dict)
+    # 是否直接取自答案缓存（此时 retrieval 是首次生成时的检索记录）
+    cached: bool = False
+    # 语义缓存命中时非空：回答来自一个措辞不同但语义相近的问题
+    semantic_hit: Optional[SemanticCacheHit] = None
+    # 是否与同时到达的相同问题共享了同一次检索 + 生成（single-flight 的 follower）
+    coalesced: bool = False
 
 class IngestResponse(BaseModel):
     doc_id: str
@@ -68,5 +85,12 @@ class DocSummaryResponse(BaseModel):
 
     sources: list[Source] = Field(default_factory=list)
     warnings: list[str] = Field(default_factory=list)
+    # 发给 LLM 的 SOURCES 打包情况（tokens / budget / 放入与丢弃的 source 数等；map_reduce 时是每组的情况与合并统计）
+    context: dict[str, Any] = Field(default_factory=dict)
+    # "single" | "map_reduce"；map_reduce 时 coverage 给出 map 成功的组覆盖了多少 chunk / 页
+    mode: str = "single"
+    coverage: dict[str, Any] = Field(default_factory=dict)
+    # 各阶段耗时（prepare_ms / llm_ms，或 prepare_ms / map_ms / reduce_ms 与每组 map 调用耗时）
+    timings: dict[str, Any] = Field(default_factory=dict)
 
     
\ No newline at end of file
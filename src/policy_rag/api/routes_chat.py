@@ -1,49 +1,33 @@
 from __future__ import annotations
 
-from typing import Any, Optional
+import json
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator, Optional
 
-from fastapi import APIRouter, HTTPException
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from rich.console import Console
 
+from policy_rag.api.deps import AppResources, get_resources, llm_http_error, run_llm
 from policy_rag.api.models import ChatRequest, ChatResponse, EvidenceGateInfo, RefusalPayload, Source
-from policy_rag.config.settings import Settings
-from policy_rag.index.chroma_store import ChromaStore
-from policy_rag.llm.llm_client import ChatMessage, OllamaClient
-from policy_rag.prompts.qa_prompt import SYSTEM_PROMPT, USER_TEMPLATE
+from policy_rag.llm.answer_cache import answer_cache_key, answer_scope_key
+from policy_rag.llm.embeddings import embed_query
+from policy_rag.llm.llm_client import ChatMessage
+from policy_rag.prompts.context_packer import context_signature, pack_for_prompt
+from policy_rag.prompts.qa_prompt import PROMPT_VERSION, SYSTEM_PROMPT, USER_TEMPLATE
 from policy_rag.retrieval.evidence_gate import assess_evidence
-from policy_rag.retrieval.retriever import retrieve_top_k
-from policy_rag.schemas.structured_answer import StructuredAnswer
-from policy_rag.utils.json_extract import extract_first_json
+from policy_rag.retrieval.pipeline import retrieval_signature, retrieve_traced
+from policy_rag.retrieval.retriever import RetrievedChunk, build_where
+from policy_rag.schemas.structured_answer import ITEM_SECTIONS, Item, StructuredAnswer
+from policy_rag.utils.json_extract import IncrementalJSONParser, extract_first_json
 
 console = Console()
 router = APIRouter()
 
-def _build_where(doc_id: Optional[str], category: Optional[str]) -> Optional[dict[str, Any]]:
-    if doc_id and category:
-        return {"$and": [{"doc_id": doc_id}, {"category": category}]}
-    if doc_id:
-        return {"doc_id": doc_id}
-    if category:
-        return {"category": category}
-    return None
-
-def _format_sources_for_llm(hits, max_chars_per_source: int = 900) -> str:
-    blocks = []
-    for i, h in enumerate(hits, start=1):
-        md = h.metadata or {}
-        title = str(md.get("title", "") or "")
-        did = str(md.get("doc_id", "") or "")
-        page = md.get("page_number", "")
-        sec = str(md.get("section_path", "") or "")
-
-        text = (h.text or "").strip()
-        if len(text) > max_chars_per_source:
-            text = text[:max_chars_per_source].rstrip() + "..."
-        
-        header = f"[{i}] doc_id={did} title={title} page={page} section={sec}".strip()
-        blocks.append(header + "\n" + text)
-    return "\n\n---\n\n".join(blocks)
-
 def _hits_to_sources(hits, max_chars: int) -> list[Source]:
     out: list[Source] = []
     for i, h in enumerate(hits, start=1):
@@ -62,7 +46,9 @@ def _hits_to_sources(hits, max_chars: int) -> list[Source]:
             Source(
                 source_id=i,
                 chunk_id=h.chunk_id,
-                distance=float(h.distance),
+                distance=None if math.isnan(h.distance) else float(h.distance),
+                fused_score=h.fused_score,
+                rerank_score=h.rerank_score,
                 doc_id=str(md.get("doc_id", "") or ""),
                 title=str(md.get("title", "") or ""),
                 category=str(md.get("category", "") or ""),
@@ -74,26 +60,93 @@ def _hits_to_sources(hits, max_chars: int) -> list[Source]:
 
     return out
 
-@router.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest) -> ChatResponse:
-    settings = Settings.from_repo_root()
+@dataclass
+class _CacheCtx:
+    key: str
+    scope_key: str
+    q_emb: Optional[np.ndarray]
 
-    store = ChromaStore(
-        persist_dir=settings.index_dir / "chroma",
-        collection_name=settings.chroma_collection,
+def _cache_lookup(
+    req: ChatRequest,
+    res: AppResources,
+    where: Optional[dict[str, Any]],
+) -> tuple[Optional[ChatResponse], Optional[_CacheCtx]]:
+    """
+    先查精确答案缓存，再查语义缓存。未命中时返回的 ctx 带着本次请求的 key，
+    写缓存与合并相同的并发请求（single-flight）都用它。
+    """
+    settings = res.settings
+    scope = dict(
+        endpoint="chat",
+        where=where,
+        top_k=req.top_k,
+        model=settings.ollama_model,
+        prompt_version=PROMPT_VERSION,
+        generation=res.store.generation(),
+        params={
+            "show_sources": req.show_sources,
+            "max_chars_per_source": req.max_chars_per_source,
+            "expand_neighbors": req.expand_neighbors,
+            "temperature": settings.ollama_temperature,
+            "retrieval": retrieval_signature(settings),
+            "context": context_signature(settings),
+        },
     )
+    key = answer_cache_key(query=req.query, **scope)
+    if res.answers is not None:
+        cached = res.answers.get(key)
+        if cached is not None:
+            return ChatResponse.model_validate({**cached, "cached": True}), None
 
-    if store.count() == 0:
-        raise HTTPException(status_code=400, detail="Chroma collection is empty. Run ingest/index-chunks first.")
-    
-    where = _build_where(doc_id=req.doc_id, category=req.category)
+    # 精确缓存未命中：再查语义缓存（query 向量随后检索也要用，embed_query 有进程内缓存，不会重复编码）
+    ctx = _CacheCtx(key=key, scope_key=answer_scope_key(**scope), q_emb=None)
+    if res.semantic is not None:
+        ctx.q_emb = embed_query(req.query, settings.embedding_model)
+        hit = res.semantic.lookup(ctx.scope_key, ctx.q_emb)
+        if hit is not None:
+            payload, info = hit
+            return ChatResponse.model_validate({**payload, "cached": True, "semantic_hit": info}), None
+    return None, ctx
 
-    hits = retrieve_top_k(
-        store=store,
-        query=req.query,
-        model_name=settings.embedding_model,
+def _cache_store(
+    req: ChatRequest,
+    res: AppResources,
+    ctx: Optional[_CacheCtx],
+    resp: ChatResponse,
+    hits: list[RetrievedChunk],
+) -> None:
+    if ctx is None:
+        return
+    payload = resp.model_dump(mode="json")
+    if res.answers is not None:
+        # 记下回答依据的文档（以及过滤条件里的文档），重新 ingest 这些文档时条目会被立即删除
+        doc_ids = {str((h.metadata or {}).get("doc_id", "")) for h in hits} | {req.doc_id or ""}
+        res.answers.put(ctx.key, payload, doc_ids=doc_ids)
+    if res.semantic is not None and resp.answer is not None and ctx.q_emb is not None:
+        # 只把模型真正给出的结构化回答放进语义缓存：拒答往往是这一种问法检索不到证据，换个说法可能就能答
+        res.semantic.put(ctx.scope_key, req.query, ctx.q_emb, payload)
+
+def _prepare(
+    req: ChatRequest,
+    res: AppResources,
+    where: Optional[dict[str, Any]],
+) -> tuple[ChatResponse, list[RetrievedChunk], Optional[list[ChatMessage]]]:
+    """
+    检索 + 证据门控。返回 (响应, 命中, 发给 LLM 的 messages)：
+    门控不通过时响应里已经带上 refusal，messages 为 None。
+    """
+    settings = res.settings
+
+    hits, trace = retrieve_traced(
+        settings,
+        res.store,
+        req.query,
         top_k=req.top_k,
         where=where,
+        lexical=res.lexical,
+        adjacency=res.adjacency,
+        expand_neighbors=req.expand_neighbors,
+        router=res.router,
     )
 
     decision = assess_evidence(
@@ -102,6 +155,7 @@ def chat(req: ChatRequest) -> ChatResponse:
         good_hit_max_dist=settings.evidence_good_hit_max_dist,
         min_good_hits=settings.evidence_min_good_hits,
         min_gap=settings.evidence_min_gap,
+        min_fused_top1=settings.evidence_min_fused_top1,
     )
 
     gate_info = EvidenceGateInfo(
@@ -112,47 +166,171 @@ def chat(req: ChatRequest) -> ChatResponse:
     )
 
     sources = _hits_to_sources(hits=hits, max_chars=req.max_chars_per_source) if req.show_sources else []
+    resp = ChatResponse(gate=gate_info, refusal=None, answer=None, sources=sources, retrieval=trace)
 
     if not decision.ok:
-        refusal = RefusalPayload(
+        resp.refusal = RefusalPayload(
             question=req.query,
             reason="证据不足，无法给出确定性结论：" + ("；".join(decision.reasons) if decision.reasons else "未命中可靠条款"),
             follow_up_questions=decision.suggestions,
             warnings=["请以学校官方最新现行版本为准；如制度有更新/补充，请上传或指定最新文件。"],
         )
-        return ChatResponse(gate=gate_info, refusal=refusal, answer=None, sources=sources)
-    
+        return resp, hits, None
+
     if settings.llm_provider != "ollama":
         raise HTTPException(status_code=400, detail="Only ollama provider is implemented in Step 2.1.")
-    
-    llm_sources = _format_sources_for_llm(hits=hits, max_chars_per_source=req.max_chars_per_source)
-    user_prompt = USER_TEMPLATE.format(question=req.query, sources=llm_sources)
 
-    client = OllamaClient(
-        base_url=settings.ollama_base_url,
-        model=settings.ollama_model,
-        temperature=settings.ollama_temperature,
-        num_predict=settings.ollama_num_predict,
-    )
+    packed = pack_for_prompt(settings, [(h.text, h.metadata) for h in hits], SYSTEM_PROMPT, USER_TEMPLATE, req.query)
+    resp.retrieval["context"] = packed.info()
+    user_prompt = USER_TEMPLATE.format(question=req.query, sources=packed.text)
+    messages = [
+        ChatMessage(role="system", content=SYSTEM_PROMPT),
+        ChatMessage(role="user", content=user_prompt),
+    ]
+    return resp, hits, messages
+
+def _finish(resp: ChatResponse, raw: str, query: str) -> ChatResponse:
+    """把模型输出解析成 StructuredAnswer 或 Refusal，填进 _prepare 返回的响应；输出不合格时是 502。"""
+    try:
+        obj = extract_first_json(raw)
+        if not isinstance(obj, dict):
+            raise ValueError(f"Expected a JSON object, got {type(obj).__name__}")
+        if obj.get("refusal") is True:
+            resp.refusal = RefusalPayload(
+                question=query,
+                reason=str(obj.get("reason", "模型判断证据不足，拒绝回答")),
+                follow_up_questions=list(obj.get("follow_up_questions", []) or []),
+                warnings=list(obj.get("warnings", []) or []) or ["请以学校官方最新现行版本为准。"],
+            )
+        else:
+            resp.answer = StructuredAnswer.model_validate(obj)
+    except ValueError as e:
+        raise llm_http_error(e) from e
+    return resp
+
+def _check_store(res: AppResources) -> None:
+    if res.store.count() == 0:
+        raise HTTPException(status_code=400, detail="Vector store is empty. Run ingest/index-chunks first.")
 
-    raw = client.chat(
-        [
-            ChatMessage(role="system", content=SYSTEM_PROMPT),
-            ChatMessage(role="user", content=user_prompt),
-        ]
+@router.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, request: Request, res: AppResources = Depends(get_resources)) -> ChatResponse:
+    # 检索、缓存读写是阻塞调用，放到线程池；LLM 生成在事件循环里排队，不占线程池
+    deadline = time.monotonic() + res.settings.llm_deadline_s
+    await run_in_threadpool(_check_store, res)
+    where = build_where(doc_id=req.doc_id, category=req.category)
+
+    cached, ctx = await run_in_threadpool(_cache_lookup, req, res, where)
+    if cached is not None:
+        return cached
+
+    async def generate() -> ChatResponse:
+        resp, hits, messages = await run_in_threadpool(_prepare, req, res, where)
+        if messages is not None:
+            resp = _finish(resp, await res.llm.chat(messages, deadline=deadline, endpoint="chat"), req.query)
+        await run_in_threadpool(_cache_store, req, res, ctx, resp, hits)
+        return resp
+
+    if res.flights is None:
+        return await run_llm(request, generate())
+
+    # 同一 key 的并发请求共享一次检索 + 生成；每个请求按自己的期限等待
+    resp, shared = await run_llm(
+        request, res.flights.do(ctx.key, generate, timeout=max(0.0, deadline - time.monotonic()))
     )
+    if shared:
+        resp = resp.model_copy(deep=True, update={"coalesced": True})
+    return resp
 
-    obj = extract_first_json(raw)
+def _sse(event: str, data: Any) -> str:
+    # 每个事件一行 JSON；浏览器 EventSource 按 event 名分发
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    if obj.get("refusal") is True:
-        refusal = RefusalPayload(
-            question=req.query,
-            reason=str(obj.get("reason", "模型判断证据不足，拒绝回答")),
-            follow_up_questions=list(obj.get("follow_up_questions", []) or []),
-            warnings=list(obj.get("warnings", []) or []) or ["请以学校官方最新现行版本为准。"],
-        )
-        return ChatResponse(gate=gate_info, refusal=refusal, answer=None, sources=sources)
-    
-    answer = StructuredAnswer.model_validate(obj)
+def _final_events(resp: ChatResponse) -> Iterator[str]:
+    if resp.answer is not None:
+        yield _sse("answer", resp.answer.model_dump(mode="json"))
+    elif resp.refusal is not None:
+        yield _sse("refusal", resp.refusal.model_dump(mode="json"))
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest, res: AppResources = Depends(get_resources)) -> StreamingResponse:
+    """
+    SSE 版的 /chat。事件顺序：
+    - evidence：证据门控结果、sources、检索 trace（检索完成即发出）
+    - delta：模型输出的增量文本（{"text": ...}），可能有很多条
+    - item：某个要点列表里新闭合的一条 Item（{"section", "index", "item"}），夹在 delta 之间；仅供提前渲染
+    - answer / refusal：校验后的 StructuredAnswer，或拒答
+    - error：生成或解析失败（随后直接结束）
+    - done：结束标记与耗时
+    """
+    deadline = time.monotonic() + res.settings.llm_deadline_s
+    await run_in_threadpool(_check_store, res)
+    where = build_where(doc_id=req.doc_id, category=req.category)
+
+    # 检索、门控与 LLM 准入都在响应开始前完成：出错或排不上队时仍能返回正常的 HTTP 错误码（429 / 503），
+    # 首字节时间 ≈ 检索耗时
+    stream = None
+    cached, ctx = await run_in_threadpool(_cache_lookup, req, res, where)
+    if cached is None:
+        resp, hits, messages = await run_in_threadpool(_prepare, req, res, where)
+        if messages is not None:
+            try:
+                stream = await res.llm.chat_stream(messages, deadline=deadline, endpoint="chat_stream")
+            except Exception as e:
+                raise llm_http_error(e) from e
 
-    return ChatResponse(gate=gate_info, refusal=None, answer=answer, sources=sources)
\ No newline at end of file
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for ev in _events():
+                yield ev
+        finally:
+            # 客户端断开时 StreamingResponse 会取消这个生成器：aclose 归还名额并断开与 Ollama 的连接
+            if stream is not None:
+                await stream.aclose()
+
+    async def _events() -> AsyncIterator[str]:
+        if cached is not None:
+            yield _sse("evidence", cached.model_dump(mode="json", include={"gate", "sources", "retrieval", "cached", "semantic_hit"}))
+            for ev in _final_events(cached):
+                yield ev
+            yield _sse("done", {"cached": True})
+            return
+
+        yield _sse("evidence", resp.model_dump(mode="json", include={"gate", "sources", "retrieval"}))
+        if stream is None:
+            for ev in _final_events(resp):
+                yield ev
+            await run_in_threadpool(_cache_store, req, res, ctx, resp, hits)
+            yield _sse("done", {"cached": False})
+            return
+
+        t0 = time.perf_counter()
+        ttft_ms: Optional[float] = None
+        parser = IncrementalJSONParser(ITEM_SECTIONS)
+        try:
+            async for delta in stream:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - t0) * 1000
+                yield _sse("delta", {"text": delta})
+                for section, index, obj in parser.feed(delta):
+                    try:
+                        item = Item.model_validate(obj)
+                    except ValueError:
+                        continue # 不合格的条目不提前下发，最终以 answer 事件为准
+                    yield _sse("item", {"section": section, "index": index, "item": item.model_dump(mode="json")})
+            final = _finish(resp, parser.text(), req.query)
+        except Exception as e:
+            console.print(f"[bold red]chat/stream failed[/bold red]: {e}")
+            yield _sse("error", {"detail": e.detail if isinstance(e, HTTPException) else str(e)})
+            return
+
+        for ev in _final_events(final):
+            yield ev
+        await run_in_threadpool(_cache_store, req, res, ctx, final, hits)
+        yield _sse("done", {"cached": False, "ttft_ms": ttft_ms, "llm_ms": (time.perf_counter() - t0) * 1000})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 关掉反向代理（nginx）的缓冲，否则事件会被攒起来一起发
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
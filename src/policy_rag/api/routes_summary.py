@@ -1,14 +1,29 @@
 from __future__ import annotations
 
+import asyncio
+import time
 from typing import Any, Optional
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 
+from policy_rag.api.deps import AppResources, get_resources, llm_http_error, run_llm
 from policy_rag.api.models import DocSummaryResponse, RefusalPayload, Source
-from policy_rag.config.settings import Settings
-from policy_rag.index.chroma_store import ChromaStore
 from policy_rag.ingestion.indexing import load_docs_meta
-from policy_rag.llm.llm_client import OllamaClient, ChatMessage
+from policy_rag.llm.async_client import LLMBusyError
+from policy_rag.llm.llm_client import ChatMessage
+from policy_rag.prompts.context_packer import pack_for_prompt
+from policy_rag.prompts.map_reduce import (
+    MapGroup,
+    MapResult,
+    cited_positions,
+    coverage,
+    merge_partials,
+    order_chunks,
+    parse_partial,
+    plan_groups,
+    stage_timings,
+)
 from policy_rag.prompts.policy_card_prompt import SYSTEM_PROMPT, USER_TEMPLATE
 from policy_rag.schemas.structured_answer import StructuredAnswer
 from policy_rag.utils.json_extract import extract_first_json
@@ -55,26 +70,9 @@ def _pick_representative_sources(
     
     return fallback[:max_sources]
 
-def _format_sources_for_llm(picked: list[dict], max_chars_per_source: int = 900) -> str:
-    blocks = []
-    for i, it in enumerate(picked, start=1):
-        md = it["md"] or {}
-        did = str(md.get("doc_id", "") or "")
-        title = str(md.get("title", "") or "")
-        page = md.get("page_number", "")
-        sec = str(md.get("section_path", "") or "")
-
-        text = (it["text"] or "").strip()
-        if len(text) > max_chars_per_source:
-            text = text[:max_chars_per_source].rstrip() + "…"
-
-        header = f"[{i}] doc_id={did} title={title} page={page} section={sec}".strip()
-        blocks.append(header + "\n" + text)
-    return "\n\n---\n\n".join(blocks)
-
-def _picked_to_sources(picked: list[dict], max_char: int) -> list[Source]:
+def _picked_to_sources(picked: list[dict], max_char: int, source_ids: Optional[list[int]] = None) -> list[Source]:
     out: list[Source] = []
-    for i, it in enumerate(picked, start=1):
+    for i, it in zip(source_ids or range(1, len(picked) + 1), picked):
         md = it["md"] or {}
         text = (it["text"] or "").strip()
         if len(text) > max_char:
@@ -101,26 +99,18 @@ def _picked_to_sources(picked: list[dict], max_char: int) -> list[Source]:
         )
     return out
 
-@router.get("/doc/{doc_id}/summary", response_model=DocSummaryResponse)
-def doc_summary(
-    doc_id: str,
-    max_sources: int = Query(32, ge=4, le=40),
-    show_sources: bool = Query(True),
-    max_chars_per_source: int = Query(1800, ge=200, le=2000)
-) -> DocSummaryResponse:
-    settings = Settings.from_repo_root()
+def _load_doc(res: AppResources, doc_id: str):
+    """读 docs.csv 并取出该文档的全部 chunk（阻塞调用）。"""
+    settings = res.settings
 
     docs_meta = load_docs_meta(settings.docs_csv_path)
     meta = docs_meta.get(doc_id)
     if meta is None:
         raise HTTPException(status_code=404, detail=f"doc_id not found in docs.csv: {doc_id}")
     
-    store = ChromaStore(
-        persist_dir=settings.index_dir / "chroma",
-        collection_name=settings.chroma_collection,
-    )
+    store = res.store
     if store.count() == 0:
-        raise HTTPException(status_code=400, detail="Chroma collection is empty. Run ingest first.")
+        raise HTTPException(status_code=400, detail="Vector store is empty. Run ingest first.")
     
     got = store.get(where={"doc_id": doc_id}, limit=5000)
     ids = got.get("ids") or []
@@ -129,15 +119,27 @@ def doc_summary(
 
     if not docs:
         raise HTTPException(status_code=404, detail=f"No chunks found for doc_id={doc_id}. Did you ingest/index it?")
+
+    if settings.llm_provider != "ollama":
+        raise HTTPException(status_code=400, detail="Only ollama provider is implemented in Step 2.3.")
+    return meta, ids, docs, metas
+
+def _prepare_summary(
+    res: AppResources,
+    doc_id: str,
+    max_sources: int,
+    show_sources: bool,
+    max_chars_per_source: int,
+):
+    """读 docs.csv、取该文档的 chunk 并组装 prompt（阻塞调用，在线程池里跑）。"""
+    settings = res.settings
+    meta, ids, docs, metas = _load_doc(res, doc_id)
     
     picked = _pick_representative_sources(ids=ids, documents=docs, metadatas=metas, max_sources=max_sources)
 
     sources = _picked_to_sources(picked=picked, max_char=max_chars_per_source) if show_sources else []
-
-    if settings.llm_provider != "ollama":
-        raise HTTPException(status_code=400, detail="Only ollama provider is implemented in Step 2.3.")
     
-    llm_sources = _format_sources_for_llm(picked, max_chars_per_source)
+    packed = pack_for_prompt(settings, [(it["text"], it["md"]) for it in picked], SYSTEM_PROMPT, USER_TEMPLATE, meta.title)
 
     user_prompt = USER_TEMPLATE.format(
         doc_id=meta.doc_id,
@@ -146,24 +148,145 @@ def doc_summary(
         publish_date=meta.publish_date,
         effective_date=meta.effective_date,
         status=meta.status,
-        sources=llm_sources,
+        sources=packed.text,
     )
+    messages = [
+        ChatMessage(role="system", content=SYSTEM_PROMPT),
+        ChatMessage(role="user", content=user_prompt),
+    ]
+    return meta, sources, messages, packed.info()
+
+def _prepare_map_reduce(res: AppResources, doc_id: str):
+    """全部 chunk 按原文顺序排好并切成 map 组（阻塞调用，在线程池里跑）。"""
+    meta, ids, docs, metas = _load_doc(res, doc_id)
+    chunks = order_chunks(ids, docs, metas)
+    groups = plan_groups(res.settings, meta, chunks)
+    if not groups:
+        # chunk 全是空文本：没有可总结的内容，不要走到 map 阶段再报“全部失败”
+        raise HTTPException(status_code=422, detail=f"Document has no indexed chunks with text: doc_id={doc_id}")
+    return meta, chunks, groups
+
+async def _run_map(res: AppResources, meta, groups: list[MapGroup], deadline: float) -> list[MapResult]:
+    """
+    并发执行各组的 map 调用，同时在跑的不超过 SUMMARY_MAP_CONCURRENCY（再往上也只是在准入队列里排队，
+    组数多时还会把队列挤满被 429）。单组输出格式不对只记为失败；准入拒绝 / 超时让整个请求失败。
+    """
+    sem = asyncio.Semaphore(max(1, res.settings.summary_map_concurrency))
+    schema = StructuredAnswer.model_json_schema()
 
-    client = OllamaClient(
-        base_url=settings.ollama_base_url,
-        model=settings.ollama_model,
-        temperature=settings.ollama_temperature,
-        num_predict=settings.ollama_num_predict,
+    async def one(g: MapGroup) -> MapResult:
+        async with sem:
+            t0 = time.perf_counter()
+            r = MapResult(group=g)
+            try:
+                raw = await res.llm.chat(g.messages, response_format=schema, deadline=deadline, endpoint="summary_map")
+                r.answer, r.refused = parse_partial(raw, meta.title)
+            except (LLMBusyError, TimeoutError):
+                raise
+            except (ValueError, RuntimeError) as e:
+                r.error = str(e)[:300]
+            r.elapsed_ms = (time.perf_counter() - t0) * 1000
+            return r
+
+    tasks = [asyncio.ensure_future(one(g)) for g in groups]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+
+def _with_version_warning(warnings: list[str]) -> list[str]:
+    warnings = list(warnings or [])
+    if not any("最新" in w or "现行" in w for w in warnings):
+        warnings.append("请以学校官方最新现行版本为准；如制度更新，请上传/指定最新文件。")
+    return warnings
+
+async def _map_reduce_summary(
+    request: Request,
+    res: AppResources,
+    doc_id: str,
+    show_sources: bool,
+    max_chars_per_source: int,
+    deadline: float,
+) -> DocSummaryResponse:
+    t0 = time.perf_counter()
+    meta, chunks, groups = await run_in_threadpool(_prepare_map_reduce, res, doc_id)
+    t_map = time.perf_counter()
+
+    results = await run_llm(request, _run_map(res, meta, groups, deadline))
+    if not any(r.ok for r in results):
+        raise HTTPException(status_code=502, detail=f"All {len(results)} map calls failed: {results[0].error if results else ''}")
+    t_reduce = time.perf_counter()
+
+    summary, merge_stats = merge_partials(results, meta.title)
+    cov = coverage(chunks, results)
+    warnings = _with_version_warning(summary.warnings)
+    if cov["groups_failed"]:
+        warnings.append(f"有 {cov['groups_failed']} 个部分总结失败，未覆盖页码：{cov['missing_pages'] or '无'}，请核对原文。")
+    summary.warnings = warnings
+
+    sources: list[Source] = []
+    if show_sources:
+        # 只返回被引用到的 chunk，source_id 与 citations 中的全文档编号一致
+        positions = cited_positions(summary)
+        picked = [chunks[p] for p in positions]
+        sources = _picked_to_sources(picked=picked, max_char=max_chars_per_source, source_ids=[p + 1 for p in positions])
+    t_end = time.perf_counter()
+
+    return DocSummaryResponse(
+        doc_id=meta.doc_id,
+        title=meta.title,
+        category=meta.category,
+        publish_date=meta.publish_date,
+        effective_date=meta.effective_date,
+        status=meta.status,
+        refusal=None,
+        summary=summary,
+        sources=sources,
+        warnings=warnings,
+        context={"groups": [g.info() for g in groups], "reduce": merge_stats},
+        mode="map_reduce",
+        coverage=cov,
+        timings=stage_timings(
+            results,
+            prepare_ms=(t_map - t0) * 1000,
+            map_ms=(t_reduce - t_map) * 1000,
+            reduce_ms=(t_end - t_reduce) * 1000,
+            total_ms=(t_end - t0) * 1000,
+            concurrency=res.settings.summary_map_concurrency,
+        ),
     )
 
-    raw = client.chat(
-        [
-            ChatMessage(role="system", content=SYSTEM_PROMPT),
-            ChatMessage(role="user", content=user_prompt),
-        ]
+@router.get("/doc/{doc_id}/summary", response_model=DocSummaryResponse)
+async def doc_summary(
+    doc_id: str,
+    request: Request,
+    max_sources: int = Query(32, ge=4, le=40),
+    show_sources: bool = Query(True),
+    max_chars_per_source: int = Query(1800, ge=200, le=2000),
+    mode: Optional[str] = Query(None, pattern="^(single|map_reduce)$", description="默认 SUMMARY_MODE；map_reduce 覆盖全部 chunk，忽略 max_sources"),
+    res: AppResources = Depends(get_resources),
+) -> DocSummaryResponse:
+    deadline = time.monotonic() + res.settings.llm_deadline_s
+    if (mode or res.settings.summary_mode) == "map_reduce":
+        return await _map_reduce_summary(request, res, doc_id, show_sources, max_chars_per_source, deadline)
+
+    t0 = time.perf_counter()
+    meta, sources, messages, context = await run_in_threadpool(
+        _prepare_summary, res, doc_id, max_sources, show_sources, max_chars_per_source
     )
+    t_llm = time.perf_counter()
 
-    obj = extract_first_json(raw)
+    raw = await run_llm(request, res.llm.chat(messages, deadline=deadline, endpoint="summary"))
+    try:
+        obj = extract_first_json(raw)
+        if not isinstance(obj, dict):
+            raise ValueError(f"Expected a JSON object, got {type(obj).__name__}")
+    except ValueError as e:
+        raise llm_http_error(e) from e
+    t_end = time.perf_counter()
+    timings = {"prepare_ms": (t_llm - t0) * 1000, "llm_ms": (t_end - t_llm) * 1000, "total_ms": (t_end - t0) * 1000}
 
     if obj.get("refusal") is True:
         refusal = RefusalPayload(
@@ -183,14 +306,16 @@ def doc_summary(
             summary=None,
             sources=sources,
             warnings=refusal.warnings,
+            context=context,
+            timings=timings,
         )
     
-    summary = StructuredAnswer.model_validate(obj)
-
-    warnings = list(summary.warnings or [])
-    if not any("最新" in w or "现行" in w for w in warnings):
-        warnings.append("请以学校官方最新现行版本为准；如制度更新，请上传/指定最新文件。")
+    try:
+        summary = StructuredAnswer.model_validate(obj)
+    except ValueError as e:
+        raise llm_http_error(e) from e
 
+    warnings = _with_version_warning(summary.warnings)
     summary.warnings = warnings
 
     return DocSummaryResponse(
@@ -204,4 +329,6 @@ def doc_summary(
         summary=summary,
         sources=sources,
         warnings=warnings,
+        context=context,
+        timings=timings,
     )
\ No newline at end of file
@@ -0,0 +1,36 @@
+# 从已有的 chunks.jsonl 重建 chunk 邻接索引（旧语料补建，或 chunk 参数变化后重建）
+from __future__ import annotations
+
+import shutil
+
+import typer
+from rich.console import Console
+
+from policy_rag.config.settings import Settings
+from policy_rag.index.adjacency import open_adjacency_index
+from policy_rag.ingestion.indexing import build_chroma_records, load_chunks_jsonl, load_docs_meta
+
+console = Console()
+
+def build_adjacency_index(rebuild: bool = True):
+    settings = Settings.from_repo_root()
+    docs_meta = load_docs_meta(settings.docs_csv_path) if settings.docs_csv_path.exists() else {}
+
+    chunk_files = sorted(settings.parsed_dir.glob("*/chunks.jsonl")) if settings.parsed_dir.exists() else []
+    if not chunk_files:
+        console.print(f"[bold red]ERROR[/bold red] No chunks.jsonl found under {settings.parsed_dir}")
+        raise typer.Exit(code=1)
+
+    if rebuild:
+        shutil.rmtree(settings.index_dir / "adjacency" / settings.chroma_collection, ignore_errors=True)
+    adjacency = open_adjacency_index(settings)
+
+    console.print(f"\n[bold]Adjacency index[/bold] {adjacency.dir}")
+    for chunks_jsonl in chunk_files:
+        did = chunks_jsonl.parent.name
+        ids, _, metadatas = build_chroma_records(did, load_chunks_jsonl(chunks_jsonl), docs_meta.get(did))
+        skipped = adjacency.upsert_doc(did, ids=ids, metadatas=metadatas)
+        console.print(f"  {did}: {len(ids)} chunks" + (f" (skipped {skipped} without position fields)" if skipped else ""))
+
+    console.print(f"  chunks={adjacency.count()}")
+    console.print("[bold green]DONE[/bold green]")
@@ -1,6 +1,8 @@
 # 将项目变成一个“可执行的命令行工具“，并组织各个子命令
 from __future__ import annotations
 
+from pathlib import Path
+
 # 一个用类型注解来快速写 CLI 的框架
 import typer
 
@@ -14,9 +16,14 @@ from policy_rag.cli.parse_cmd import parse_pdf
 from policy_rag.cli.chunk_cmd import chunk_pages
 from policy_rag.cli.index_cmd import index_chunks
 from policy_rag.cli.search_cmd import search
+from policy_rag.cli.search_batch_cmd import search_batch
 from policy_rag.cli.ask_cmd import ask
 from policy_rag.cli.summarize_cmd import summarize
 from policy_rag.cli.ingest_cmd import ingest
+from policy_rag.cli.embed_check_cmd import check_embedding_backend
+from policy_rag.cli.lexical_cmd import build_lexical_index
+from policy_rag.cli.adjacency_cmd import build_adjacency_index
+from policy_rag.cli.doc_router_cmd import build_doc_router
 
 # 创建一个 CLI“应用对象“，后续所有命令都挂在它下面，关闭自动补全
 # app是一个 Typer 对象，这个对象实现了__call__（可调用协议），可以像函数一样被调用
@@ -94,7 +101,8 @@ def search_cmd(
     doc_id: str | None = typer.Option(None, help="Restrict to doc_id"),
     category: str | None = typer.Option(None, help="Restrict to category"),
     show_full: bool = typer.Option(False, help="Show full chunk text"),
-    use_gate: bool = typer.Option(True, help="Enable evidence gate (recommended)")
+    use_gate: bool = typer.Option(True, help="Enable evidence gate (recommended)"),
+    expand_neighbors: int | None = typer.Option(None, help="Attach N neighbouring chunks on each side of a hit (default: NEIGHBOR_EXPAND)"),
 ):
     search(
         query,
@@ -103,8 +111,19 @@ def search_cmd(
         category,
         show_full,
         use_gate,
+        expand_neighbors,
     )
 
+@app.command("search-batch")
+def search_batch_cmd(
+    input: Path = typer.Option(..., help="Queries JSONL: {id, query, doc_id?, category?, top_k?} per line"),
+    output: Path = typer.Option(..., help="Results JSONL (one line per query, same order as input)"),
+    top_k: int = typer.Option(8, help="Default number of chunks per query"),
+    batch_size: int = typer.Option(64, help="Queries embedded and searched per batch"),
+    use_gate: bool = typer.Option(True, help="Attach evidence gate result to each query"),
+):
+    search_batch(input_path=input, output_path=output, top_k=top_k, batch_size=batch_size, use_gate=use_gate)
+
 @app.command("ask")
 def ask_cmd(
     query: str = typer.Option(..., help="User question"),
@@ -113,15 +132,30 @@ def ask_cmd(
     category: str | None = typer.Option(None, help="Restrict to category"),
     use_gate: bool = typer.Option(True, help="Enable evidence gate"),
     show_evidence: bool = typer.Option(True, help="Print evidence table"),
+    expand_neighbors: int | None = typer.Option(None, help="Attach N neighbouring chunks on each side of a hit (default: NEIGHBOR_EXPAND)"),
+    llm_cache: bool = typer.Option(True, help="Reuse identical deterministic LLM completions (--no-llm-cache forces a fresh call)"),
 ):
-    ask(query=query, top_k=top_k, doc_id=doc_id, category=category, use_gate=use_gate, show_evidence=show_evidence)
+    ask(
+        query=query,
+        top_k=top_k,
+        doc_id=doc_id,
+        category=category,
+        use_gate=use_gate,
+        show_evidence=show_evidence,
+        expand_neighbors=expand_neighbors,
+        llm_cache=llm_cache,
+    )
 
 @app.command("summarize")
 def summarize_cmd(
     doc_id: str = typer.Option(..., help="Target doc_id"),
     max_sources: int = typer.Option(16, help="Max evidence chunks"),
+    llm_cache: bool = typer.Option(True, help="Reuse identical deterministic LLM completions (--no-llm-cache forces a fresh call)"),
+    mode: str | None = typer.Option(None, help="single | map_reduce (default: SUMMARY_MODE); map_reduce covers every chunk and ignores --max-sources"),
 ):
-    summarize(doc_id=doc_id, max_sources=max_sources)
+    if mode not in (None, "single", "map_reduce"):
+        raise typer.BadParameter("mode must be 'single' or 'map_reduce'", param_hint="--mode")
+    summarize(doc_id=doc_id, max_sources=max_sources, llm_cache=llm_cache, mode=mode)
 
 @app.command("ingest")
 def ingest_cmd(
@@ -134,6 +168,9 @@ def ingest_cmd(
     overlap: int = typer.Option(150, help="Overlap in characters"),
     min_chunk_chars: int = typer.Option(80, help="Drop too-short chunks"),
     embed_batch_size: int = typer.Option(32, help="Embedding batch size"),
+    embed_pool: bool = typer.Option(False, help="Embed with a multi-process CPU worker pool"),
+    embed_workers: int | None = typer.Option(None, help="Pool workers (default: EMBED_POOL_WORKERS or auto)"),
+    cores_per_worker: int | None = typer.Option(None, help="CPU cores pinned per pool worker (default: even split)"),
 ):
     ingest(
         doc_id=doc_id,
@@ -145,8 +182,41 @@ def ingest_cmd(
         overlap=overlap,
         min_chunk_chars=min_chunk_chars,
         embed_batch_size=embed_batch_size,
+        embed_pool=embed_pool,
+        embed_workers=embed_workers,
+        cores_per_worker=cores_per_worker,
     )
 
+@app.command("check-embedding-backend")
+def check_embedding_backend_cmd(
+    backend: str = typer.Option("onnx-int8", help="Candidate backend: onnx | onnx-int8"),
+    max_texts: int = typer.Option(256, help="Max texts (sample queries + indexed chunks) to compare"),
+    min_cos: float = typer.Option(0.99, help="Fail if any text's cosine vs torch is below this"),
+):
+    check_embedding_backend(backend=backend, max_texts=max_texts, min_cos=min_cos)
+
+@app.command("build-lexical-index")
+def build_lexical_index_cmd(
+    rebuild: bool = typer.Option(True, help="Drop the existing lexical index before rebuilding"),
+):
+    """Rebuild the Chinese n-gram BM25 index (hybrid retrieval) from data/parsed/*/chunks.jsonl."""
+    build_lexical_index(rebuild=rebuild)
+
+@app.command("build-adjacency-index")
+def build_adjacency_index_cmd(
+    rebuild: bool = typer.Option(True, help="Drop the existing adjacency index before rebuilding"),
+):
+    """Rebuild the chunk prev/next adjacency index (neighbour expansion) from data/parsed/*/chunks.jsonl."""
+    build_adjacency_index(rebuild=rebuild)
+
+@app.command("build-doc-router")
+def build_doc_router_cmd(
+    rebuild: bool = typer.Option(True, help="Drop the existing doc router before rebuilding"),
+    batch_size: int = typer.Option(32, help="Embedding batch size for chunks missing from the embedding cache"),
+):
+    """Rebuild document-level vectors (two-stage doc routing) from data/parsed/*/chunks.jsonl."""
+    build_doc_router(rebuild=rebuild, batch_size=batch_size)
+
 def main():
     app()
 
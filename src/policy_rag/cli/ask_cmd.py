@@ -1,15 +1,20 @@
 from __future__ import annotations
 
+from dataclasses import asdict
+
 import typer
 from rich.console import Console
 from rich.table import Table
 
 from policy_rag.config.settings import Settings
-from policy_rag.index.chroma_store import ChromaStore
-from policy_rag.retrieval.retriever import retrieve_top_k, make_snippet
+from policy_rag.index.base import open_vector_store
+from policy_rag.retrieval.pipeline import retrieval_signature, retrieve
+from policy_rag.retrieval.retriever import RetrievedChunk, build_where, make_snippet
 from policy_rag.retrieval.evidence_gate import assess_evidence
-from policy_rag.llm.llm_client import OllamaClient, ChatMessage
-from policy_rag.prompts.qa_prompt import SYSTEM_PROMPT, USER_TEMPLATE
+from policy_rag.llm.answer_cache import answer_cache_key, open_answer_cache
+from policy_rag.llm.llm_client import ChatMessage, open_ollama_client
+from policy_rag.prompts.context_packer import context_signature, pack_for_prompt
+from policy_rag.prompts.qa_prompt import PROMPT_VERSION, SYSTEM_PROMPT, USER_TEMPLATE
 from policy_rag.utils.json_extract import extract_first_json
 from policy_rag.schemas.answer import Refusal
 from policy_rag.schemas.structured_answer import StructuredAnswer
@@ -17,24 +22,6 @@ from policy_rag.retrieval.quote_verify import quote_in_text
 
 console = Console()
 
-def _format_sources_for_llm(hits, max_chars_per_source: int = 1000) -> str:
-    blocks = []
-    for i, h in enumerate(hits, start=1):
-        md = h.metadata or {}
-        title = str(md.get("title", "") or "")
-        did = str(md.get("doc_id", "") or "")
-        page = md.get("page_number", "")
-        sec = str(md.get("section_path", "") or "")
-
-        text = (h.text or "").strip()
-        if len(text) > max_chars_per_source:
-            text = text[:max_chars_per_source].rstrip() + "..."
-
-        header = f"[{i}] doc_id={did} title={title} page={page} section={sec}".strip()
-        blocks.append(header + "\n" + text)
-
-    return "\n\n---\n\n".join(blocks)
-
 def _print_evidence_table(hits):
     table = Table(title="Top Retrieved Chunks (evidence)", show_lines=True)
     table.add_column("Rank", justify="right")
@@ -86,34 +73,47 @@ def ask(
     doc_id: str | None,
     category: str | None,
     use_gate: bool,
-    show_evidence: bool
+    show_evidence: bool,
+    expand_neighbors: int | None = None,
+    llm_cache: bool = True,
 ):
     settings = Settings.from_repo_root()
 
-    store = ChromaStore(
-        persist_dir=settings.index_dir / "chroma",
-        collection_name=settings.chroma_collection,
-    )
+    store = open_vector_store(settings)
 
     if store.count() == 0:
-        console.print("[bold red]ERROR[/bold red] Chroma collection is empty. Run index-chunks first.")
+        console.print("[bold red]ERROR[/bold red] Vector store is empty. Run index-chunks first.")
         raise typer.Exit(code=1)
     
-    where = None
-    if doc_id and category:
-        where = {"$and": [{"doc_id": doc_id}, {"category": category}]}
-    elif doc_id:
-        where = {"doc_id": doc_id}
-    elif category:
-        where = {"category": category}
-
-    hits = retrieve_top_k(
-        store=store,
+    where = build_where(doc_id, category)
+
+    answers = open_answer_cache(settings)
+    cache_key = answer_cache_key(
+        endpoint="ask",
         query=query,
-        model_name=settings.embedding_model,
-        top_k=top_k,
         where=where,
+        top_k=top_k,
+        model=settings.ollama_model,
+        prompt_version=PROMPT_VERSION,
+        generation=store.generation(),
+        params={
+            "use_gate": use_gate,
+            "expand_neighbors": expand_neighbors,
+            "temperature": settings.ollama_temperature,
+            "retrieval": retrieval_signature(settings),
+            "context": context_signature(settings),
+        },
     )
+    cached = answers.get(cache_key) if answers is not None else None
+    if cached is not None:
+        console.print("[dim]answer cache: hit (same question, index generation and prompt version)[/dim]")
+        hits = [RetrievedChunk(**h) for h in cached["hits"]]
+        if show_evidence:
+            _print_evidence_table(hits=hits)
+        _render_answer(cached["answer"], hits)
+        return
+
+    hits = retrieve(settings, store, query, top_k, where, expand_neighbors=expand_neighbors)
 
     if show_evidence:
         _print_evidence_table(hits=hits)
@@ -125,6 +125,7 @@ def ask(
             good_hit_max_dist=settings.evidence_good_hit_max_dist,
             min_good_hits=settings.evidence_min_good_hits,
             min_gap=settings.evidence_min_gap,
+            min_fused_top1=settings.evidence_min_fused_top1,
         )
 
         if not decision.ok:
@@ -143,17 +144,17 @@ def ask(
         console.print("[bold red]ERROR[/bold red] Step 1.1 只实现 ollama provider。请设置 LLM_PROVIDER=ollama。")
         raise typer.Exit(code=1)
     
-    source_str = _format_sources_for_llm(hits, max_chars_per_source=1000)
-    user_prompt = USER_TEMPLATE.format(question=query, sources=source_str)
+    packed = pack_for_prompt(settings, [(h.text, h.metadata) for h in hits], SYSTEM_PROMPT, USER_TEMPLATE, query)
+    user_prompt = USER_TEMPLATE.format(question=query, sources=packed.text)
 
-    client = OllamaClient(
-        base_url=settings.ollama_base_url,
-        model=settings.ollama_model,
-        temperature=settings.ollama_temperature,
-        num_predict=settings.ollama_num_predict,
-    )
+    client = open_ollama_client(settings)
 
     console.print(f"\n[bold]LLM[/bold] provider=ollama model={settings.ollama_model}")
+    console.print(
+        f"[dim]context: {packed.tokens}/{packed.budget} tokens ({packed.counter}), "
+        f"sources {len(packed.source_ids)}/{packed.n_input}, truncated={packed.truncated}, "
+        f"deduped_sentences={packed.deduped_sentences}[/dim]"
+    )
 
     raw = client.chat(
         [
@@ -161,10 +162,22 @@ def ask(
             ChatMessage(role="user", content=user_prompt),
         ],
         response_format=StructuredAnswer.model_json_schema(),
+        endpoint="ask",
+        use_cache=llm_cache,
     )
 
     obj = extract_first_json(raw)
+    if answers is not None:
+        # 只缓存能通过 schema 校验的输出，格式错误的回答下次重新生成
+        (Refusal if obj.get("refusal") is True else StructuredAnswer).model_validate(obj)
+        answers.put(
+            cache_key,
+            {"hits": [asdict(h) for h in hits], "answer": obj},
+            doc_ids={str((h.metadata or {}).get("doc_id", "")) for h in hits} | {doc_id or ""},
+        )
+    _render_answer(obj, hits)
 
+def _render_answer(obj: dict, hits) -> None:
     # schema validate (AskAnswer or Refusal)
     parsed = None
     if obj.get("refusal") is True:
@@ -0,0 +1,43 @@
+# 从已有的 chunks.jsonl 重建文档级向量（doc routing）；chunk 向量优先从 embedding 缓存取，未命中才重新编码
+from __future__ import annotations
+
+import shutil
+
+import typer
+from rich.console import Console
+
+from policy_rag.config.settings import Settings
+from policy_rag.index.doc_router import open_doc_router
+from policy_rag.ingestion.indexing import build_chroma_records, load_chunks_jsonl, load_docs_meta
+from policy_rag.llm.embedding_cache import open_embedding_cache
+from policy_rag.llm.embeddings import embed_texts_np
+
+console = Console()
+
+def build_doc_router(rebuild: bool = True, batch_size: int = 32):
+    settings = Settings.from_repo_root()
+    docs_meta = load_docs_meta(settings.docs_csv_path) if settings.docs_csv_path.exists() else {}
+
+    chunk_files = sorted(settings.parsed_dir.glob("*/chunks.jsonl")) if settings.parsed_dir.exists() else []
+    if not chunk_files:
+        console.print(f"[bold red]ERROR[/bold red] No chunks.jsonl found under {settings.parsed_dir}")
+        raise typer.Exit(code=1)
+
+    if rebuild:
+        shutil.rmtree(settings.index_dir / "doc_router" / settings.chroma_collection, ignore_errors=True)
+    router = open_doc_router(settings)
+    embed_cache = open_embedding_cache(settings)
+
+    console.print(f"\n[bold]Doc router[/bold] {router.dir}")
+    for chunks_jsonl in chunk_files:
+        did = chunks_jsonl.parent.name
+        _, documents, _ = build_chroma_records(did, load_chunks_jsonl(chunks_jsonl), docs_meta.get(did))
+        if not documents:
+            continue
+        embeddings = embed_texts_np(documents, settings.embedding_model, batch_size=batch_size, cache=embed_cache)
+        router.upsert_doc(did, embeddings)
+        console.print(f"  {did}: {len(documents)} chunks")
+
+    st = router.stats()
+    console.print(f"  docs={st['docs']} chunks={st['chunks']}")
+    console.print("[bold green]DONE[/bold green]")
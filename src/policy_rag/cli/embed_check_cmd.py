@@ -0,0 +1,77 @@
+# 校验非默认 embedding 后端（onnx / onnx-int8）与 torch 后端的一致性，决定能否上线
+from __future__ import annotations
+
+import time
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from policy_rag.config.settings import Settings
+from policy_rag.ingestion.indexing import load_chunks_jsonl
+from policy_rag.llm.embedding_backends import load_backend, parity_check
+
+console = Console()
+
+_SAMPLE_QUERIES = [
+    "国家奖学金申请条件",
+    "研究生学业奖学金评定办法",
+    "学分绩点如何计算",
+    "申请材料需要提交哪些",
+    "评审结果公示期多长",
+    "受到纪律处分还能评奖学金吗",
+    "第十二条规定了什么",
+    "奖学金发放时间",
+]
+
+def _collect_texts(settings: Settings, max_texts: int) -> list[str]:
+    texts: list[str] = list(_SAMPLE_QUERIES)
+    if settings.parsed_dir.exists():
+        for chunks_jsonl in sorted(settings.parsed_dir.glob("*/chunks.jsonl")):
+            for c in load_chunks_jsonl(chunks_jsonl):
+                t = str(c.get("text", "")).strip()
+                if t:
+                    texts.append(t)
+                if len(texts) >= max_texts:
+                    return texts
+    return texts[:max_texts]
+
+def check_embedding_backend(backend: str, max_texts: int = 256, min_cos: float = 0.99):
+    settings = Settings.from_repo_root()
+    texts = _collect_texts(settings, max_texts)
+
+    console.print(f"\n[bold]Embedding backend parity[/bold] model={settings.embedding_model}")
+    console.print(f"  reference: torch  candidate: {backend}  texts: {len(texts)}")
+
+    ref = load_backend(settings.embedding_model, "torch", onnx_dir=settings.onnx_dir)
+    cand = load_backend(
+        settings.embedding_model,
+        backend,
+        onnx_dir=settings.onnx_dir,
+        num_threads=settings.embedding_threads,
+    )
+
+    report = parity_check(ref, cand, texts)
+
+    # 单条 query 延迟（serving 热路径）
+    lat: dict[str, float] = {}
+    for b in (ref, cand):
+        b.encode(texts[:1], batch_size=1)
+        t0 = time.perf_counter()
+        for q in _SAMPLE_QUERIES:
+            b.encode([q], batch_size=1)
+        lat[b.name] = (time.perf_counter() - t0) * 1000 / len(_SAMPLE_QUERIES)
+
+    table = Table(title="Parity vs torch", show_lines=True)
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    for k in ("mean_cos", "min_cos", "p05_cos", "nn_agreement"):
+        table.add_row(k, f"{report[k]:.5f}")
+    table.add_row("torch query ms", f"{lat[ref.name]:.2f}")
+    table.add_row(f"{cand.name} query ms", f"{lat[cand.name]:.2f}")
+    console.print(table)
+
+    if report["min_cos"] < min_cos:
+        console.print(f"[bold red]FAIL[/bold red] min_cos={report['min_cos']:.5f} < {min_cos}")
+        raise typer.Exit(code=1)
+    console.print(f"[bold green]PASS[/bold green] min_cos={report['min_cos']:.5f} >= {min_cos}")
@@ -4,9 +4,14 @@ import typer
 from rich.console import Console
 
 from policy_rag.config.settings import Settings
-from policy_rag.index.chroma_store import ChromaStore
+from policy_rag.index.base import open_vector_store
+from policy_rag.index.adjacency import open_adjacency_index
+from policy_rag.index.doc_router import open_doc_router
+from policy_rag.index.lexical_index import open_lexical_index
+from policy_rag.llm.answer_cache import open_answer_cache
 from policy_rag.ingestion.indexing import load_chunks_jsonl, load_docs_meta, build_chroma_records
-from policy_rag.llm.embeddings import embed_texts
+from policy_rag.llm.embeddings import embed_texts_np
+from policy_rag.llm.embedding_cache import open_embedding_cache
 
 console = Console()
 
@@ -31,17 +36,29 @@ def index_chunks(doc_id: str, batch_size: int):
     
     console.print(f"\n[bold]Indexing[/bold] doc_id={doc_id}")
     console.print(f"  embedding_model: {settings.embedding_model}")
-    console.print(f"  chroma_dir:      {settings.index_dir / 'chroma'}")
+    console.print(f"  vector_store:    {settings.vector_store} ({settings.index_dir / settings.vector_store})")
     console.print(f"  collection:      {settings.chroma_collection}")
     console.print(f"  chunks:          {len(documents)}")
 
-    embeddings = embed_texts(documents, model_name=settings.embedding_model, batch_size=batch_size)
-
-    store = ChromaStore(
-        persist_dir=settings.index_dir / "chroma",
-        collection_name=settings.chroma_collection,
+    embed_cache = open_embedding_cache(settings)
+    embeddings = embed_texts_np(
+        documents,
+        model_name=settings.embedding_model,
+        batch_size=batch_size,
+        cache=embed_cache,
     )
+    if embed_cache is not None:
+        st = embed_cache.stats()
+        console.print(f"  embed_cache:     hits={st['hits']} misses={st['misses']} hit_rate={st['hit_rate']:.2%}")
+
+    store = open_vector_store(settings)
     store.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+    open_lexical_index(settings).upsert(ids=ids, documents=documents, metadatas=metadatas)
+    open_adjacency_index(settings).upsert_doc(doc_id, ids=ids, metadatas=metadatas)
+    open_doc_router(settings).upsert_doc(doc_id, embeddings)
+    answers = open_answer_cache(settings)
+    if answers is not None:
+        answers.invalidate_doc(doc_id)
 
     console.print(f"[green]OK[/green] upserted {len(ids)} chunks.")
     console.print(f"  collection_count_now: {store.count()}")
@@ -11,8 +11,14 @@ from policy_rag.ingestion.validators import validate_docs_csv
 from policy_rag.ingestion.loader_pdf import parse_pdf_to_pages, write_pages_jsonl
 from policy_rag.ingestion.chunking import load_pages_jsonl, build_chunks_from_pages, write_chunks_jsonl
 from policy_rag.ingestion.indexing import load_docs_meta, load_chunks_jsonl, build_chroma_records
-from policy_rag.llm.embeddings import embed_texts
-from policy_rag.index.chroma_store import ChromaStore
+from policy_rag.llm.embeddings import embed_texts_np
+from policy_rag.llm.embedding_cache import open_embedding_cache
+from policy_rag.llm.embed_pool import EmbeddingPool, resolve_pool_workers
+from policy_rag.index.base import open_vector_store
+from policy_rag.index.adjacency import open_adjacency_index
+from policy_rag.index.doc_router import open_doc_router
+from policy_rag.llm.answer_cache import open_answer_cache
+from policy_rag.index.lexical_index import open_lexical_index
 
 console = Console()
 
@@ -31,6 +37,9 @@ def ingest(
     overlap: int = 150,
     min_chunk_chars: int = 80,
     embed_batch_size: int = 32,
+    embed_pool: bool = False,
+    embed_workers: int | None = None,
+    cores_per_worker: int | None = None,
 ):
     """
     One-shot ingest pipeline:
@@ -64,77 +73,121 @@ def ingest(
         
     docs_meta = load_docs_meta(settings.docs_csv_path)
 
-    store = ChromaStore(
-        persist_dir=settings.index_dir / "chroma",
-        collection_name=settings.chroma_collection,
-    )
-
-    console.print("\n[bold]Ingest Pipeline[/bold]")
-    console.print(f"  embedding_model: {settings.embedding_model}")
-    console.print(f"  chroma_dir:      {settings.index_dir / 'chroma'}")
-    console.print(f"  collection:      {settings.chroma_collection}")
-    console.print(f"  reparse={reparse}, rechunk={rechunk}, reset_doc={reset_doc}")
-    console.print(f"  chunk_size={chunk_size}, overlap={overlap}, min_chunk_chars={min_chunk_chars}")
-    console.print(f"  embed_batch_size={embed_batch_size}")
-
-    for r in target_rows:
-        did = (r.get("doc_id") or "").strip()
-        file_path = (r.get("file_path") or "").strip()
-
-        meta = docs_meta.get(did)
-        title = meta.title if meta else (r.get("title") or "").strip()
-
-        pdf_path = (settings.repo_root / file_path).resolve()
-
-        if not pdf_path.exists():
-            console.print(f"\n[bold red]SKIP[/bold red] doc_id={did} PDF not found: {file_path}")
-            continue
-
-        console.print(f"\n[bold]Doc[/bold] doc_id={did}")
-        if title:
-            console.print(f"  title: {title}")
-        console.print(f"  pdf:   {pdf_path}")
-
-        pages_jsonl = settings.parsed_dir / did / "pages.jsonl"
-        if reparse or (not pages_jsonl.exists()):
-            pages = parse_pdf_to_pages(did, pdf_path)
-            write_pages_jsonl(pages, pages_jsonl)
-            empty_pages = sum(1 for p in pages if not (p.text or "").strip())
-            console.print(f"  parse: wrote pages.jsonl ({len(pages)} pages, empty={empty_pages})")
-            if len(pages) > 0 and empty_pages / len(pages) >= 0.6:
-                console.print("[yellow]  WARN[/yellow] Many pages empty; may be scanned PDF (OCR later).")
-        else:
-            console.print("  parse: skip (pages.jsonl exists)")
-
-        chunks_jsonl = settings.parsed_dir / did / "chunks.jsonl"
-        if rechunk or (not chunks_jsonl.exists()):
-            pages = load_pages_jsonl(pages_jsonl)
-            chunks = build_chunks_from_pages(
-                pages,
-                chunk_size=chunk_size,
-                overlap=overlap,
-                min_chunk_chars=min_chunk_chars,
+    store = open_vector_store(settings)
+    lexical = open_lexical_index(settings)
+    adjacency = open_adjacency_index(settings)
+    router = open_doc_router(settings)
+    answers = open_answer_cache(settings)
+
+    embed_cache = open_embedding_cache(settings)
+
+    pool: EmbeddingPool | None = None
+    if embed_pool:
+        pool = EmbeddingPool(
+            model_name=settings.embedding_model,
+            workers=resolve_pool_workers(embed_workers if embed_workers is not None else settings.embed_pool_workers),
+            cores_per_worker=cores_per_worker if cores_per_worker is not None else settings.embed_pool_cores_per_worker,
+            backend=settings.embedding_backend,
+            onnx_dir=settings.onnx_dir,
+        )
+
+    # 任何一个文档出错（解析失败、Ctrl-C 等）也要关掉 worker 进程，否则它们会一直挂着
+    try:
+        console.print("\n[bold]Ingest Pipeline[/bold]")
+        console.print(f"  embedding_model: {settings.embedding_model} (backend={settings.embedding_backend})")
+        console.print(f"  vector_store:    {settings.vector_store} ({settings.index_dir / settings.vector_store})")
+        console.print(f"  collection:      {settings.chroma_collection}")
+        console.print(f"  reparse={reparse}, rechunk={rechunk}, reset_doc={reset_doc}")
+        console.print(f"  chunk_size={chunk_size}, overlap={overlap}, min_chunk_chars={min_chunk_chars}")
+        console.print(f"  embed_batch_size={embed_batch_size}")
+        console.print(f"  embed_cache:     {embed_cache.dir if embed_cache else 'disabled'}")
+        if pool is not None:
+            console.print(f"  embed_pool:      workers={pool.workers} core_groups={pool.core_groups}")
+
+        for r in target_rows:
+            did = (r.get("doc_id") or "").strip()
+            file_path = (r.get("file_path") or "").strip()
+
+            meta = docs_meta.get(did)
+            title = meta.title if meta else (r.get("title") or "").strip()
+
+            pdf_path = (settings.repo_root / file_path).resolve()
+
+            if not pdf_path.exists():
+                console.print(f"\n[bold red]SKIP[/bold red] doc_id={did} PDF not found: {file_path}")
+                continue
+
+            console.print(f"\n[bold]Doc[/bold] doc_id={did}")
+            if title:
+                console.print(f"  title: {title}")
+            console.print(f"  pdf:   {pdf_path}")
+
+            pages_jsonl = settings.parsed_dir / did / "pages.jsonl"
+            if reparse or (not pages_jsonl.exists()):
+                pages = parse_pdf_to_pages(did, pdf_path)
+                write_pages_jsonl(pages, pages_jsonl)
+                empty_pages = sum(1 for p in pages if not (p.text or "").strip())
+                console.print(f"  parse: wrote pages.jsonl ({len(pages)} pages, empty={empty_pages})")
+                if len(pages) > 0 and empty_pages / len(pages) >= 0.6:
+                    console.print("[yellow]  WARN[/yellow] Many pages empty; may be scanned PDF (OCR later).")
+            else:
+                console.print("  parse: skip (pages.jsonl exists)")
+
+            chunks_jsonl = settings.parsed_dir / did / "chunks.jsonl"
+            if rechunk or (not chunks_jsonl.exists()):
+                pages = load_pages_jsonl(pages_jsonl)
+                chunks = build_chunks_from_pages(
+                    pages,
+                    chunk_size=chunk_size,
+                    overlap=overlap,
+                    min_chunk_chars=min_chunk_chars,
+                )
+                write_chunks_jsonl(chunks, chunks_jsonl)
+                console.print(f"  chunk: wrote chunks.jsonl ({len(chunks)} chunks)")
+            else:
+                console.print("  chunk: skip (chunks.jsonl exists)")
+
+            chunks_raw =load_chunks_jsonl(chunks_jsonl)
+            ids, documents, metadatas = build_chroma_records(did, chunks_raw, meta)
+
+            if not documents:
+                console.print("[bold yellow]  WARN[/bold yellow] No valid chunk texts. Skipping indexing.")
+                continue
+
+            if reset_doc:
+                store.delete(where={"doc_id": did})
+                lexical.delete(where={"doc_id": did})
+                adjacency.delete_doc(did)
+                router.delete_doc(did)
+                console.print("  index: cleared existing vectors for this doc_id")
+
+            embeddings = embed_texts_np(
+                documents,
+                model_name=settings.embedding_model,
+                batch_size=embed_batch_size,
+                cache=embed_cache,
+                pool=pool,
             )
-            write_chunks_jsonl(chunks, chunks_jsonl)
-            console.print(f"  chunk: wrote chunks.jsonl ({len(chunks)} chunks)")
-        else:
-            console.print("  chunk: skip (chunks.jsonl exists)")
-
-        chunks_raw =load_chunks_jsonl(chunks_jsonl)
-        ids, documents, metadatas = build_chroma_records(did, chunks_raw, meta)
-
-        if not documents:
-            console.print("[bold yellow]  WARN[/bold yellow] No valid chunk texts. Skipping indexing.")
-            continue
-
-        if reset_doc:
-            store.delete(where={"doc_id": did})
-            console.print("  index: cleared existing vectors for this doc_id")
-
-        embeddings = embed_texts(documents, model_name=settings.embedding_model, batch_size=embed_batch_size)
-        store.upsert(ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
-
-        console.print(f"  index: upserted {len(ids)} chunks")
-        console.print(f"  index: collection_count_now={store.count()}")
+            store.upsert(ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+            lexical.upsert(ids, documents=documents, metadatas=metadatas)
+            adjacency.upsert_doc(did, ids=ids, metadatas=metadatas)
+            router.upsert_doc(did, embeddings)
+            if answers is not None:
+                n_stale = answers.invalidate_doc(did)
+                if n_stale:
+                    console.print(f"  answer_cache: dropped {n_stale} cached answers citing this doc_id")
+
+            console.print(f"  index: upserted {len(ids)} chunks")
+            console.print(f"  index: collection_count_now={store.count()}")
+    finally:
+        if pool is not None:
+            pool.close()
+
+    if embed_cache is not None:
+        st = embed_cache.stats()
+        console.print(
+            f"\n  embed_cache: hits={st['hits']} misses={st['misses']} "
+            f"hit_rate={st['hit_rate']:.2%} entries={st['entries']} evictions={st['evictions']}"
+        )
 
     console.print("\n[bold green]DONE[/bold green] ingest finished.")
\ No newline at end of file
@@ -0,0 +1,53 @@
+# 从已有的 chunks.jsonl 重建 BM25 词面索引（已经用旧版本 ingest 过、还没有词面索引的语料用这个补建）
+from __future__ import annotations
+
+import shutil
+import time
+
+import typer
+from rich.console import Console
+
+from policy_rag.config.settings import Settings
+from policy_rag.index.lexical_index import open_lexical_index
+from policy_rag.ingestion.indexing import build_chroma_records, load_chunks_jsonl, load_docs_meta
+
+console = Console()
+
+_PROBE_QUERIES = ["学分绩点如何计算", "第十二条规定了什么", "国家奖学金申请条件"]
+
+def build_lexical_index(rebuild: bool = True):
+    settings = Settings.from_repo_root()
+    docs_meta = load_docs_meta(settings.docs_csv_path) if settings.docs_csv_path.exists() else {}
+
+    chunk_files = sorted(settings.parsed_dir.glob("*/chunks.jsonl")) if settings.parsed_dir.exists() else []
+    if not chunk_files:
+        console.print(f"[bold red]ERROR[/bold red] No chunks.jsonl found under {settings.parsed_dir}")
+        raise typer.Exit(code=1)
+
+    if rebuild:
+        shutil.rmtree(settings.index_dir / "lexical" / settings.chroma_collection, ignore_errors=True)
+    lexical = open_lexical_index(settings)
+
+    console.print(f"\n[bold]Lexical index[/bold] {lexical.dir}")
+    t0 = time.perf_counter()
+    for chunks_jsonl in chunk_files:
+        did = chunks_jsonl.parent.name
+        ids, documents, metadatas = build_chroma_records(did, load_chunks_jsonl(chunks_jsonl), docs_meta.get(did))
+        lexical.upsert(ids, documents=documents, metadatas=metadatas)
+        console.print(f"  {did}: {len(ids)} chunks")
+    t1 = time.perf_counter()
+
+    st = lexical.stats()
+    console.print(
+        f"  docs={st['docs']} terms={st['terms']} postings={st['postings']} "
+        f"postings_bytes={st['postings_bytes']} build={t1 - t0:.2f}s"
+    )
+
+    n_rounds = 20
+    t2 = time.perf_counter()
+    for _ in range(n_rounds):
+        for q in _PROBE_QUERIES:
+            lexical.search(q, top_k=50)
+    per_query_ms = (time.perf_counter() - t2) * 1000 / (n_rounds * len(_PROBE_QUERIES))
+    console.print(f"  lookup: {per_query_ms:.3f} ms/query (top-50)")
+    console.print("[bold green]DONE[/bold green]")
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+import typer
+from rich.console import Console
+
+from policy_rag.config.settings import Settings
+from policy_rag.index.base import open_vector_store
+from policy_rag.retrieval.retriever import build_where, make_snippet, retrieve_top_k_batch
+from policy_rag.retrieval.evidence_gate import assess_evidence
+
+console = Console()
+
+def _iter_batches(path: Path, batch_size: int) -> Iterator[list[dict[str, Any]]]:
+    # 逐行读取，按 batch_size 攒批；不会把整个回归集一次性读进内存
+    batch: list[dict[str, Any]] = []
+    with path.open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if not str(obj.get("query") or "").strip():
+                raise ValueError(f"{path}:{line_no}: missing 'query'")
+            obj.setdefault("id", line_no)
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def search_batch(
+    input_path: Path,
+    output_path: Path,
+    top_k: int,
+    batch_size: int,
+    use_gate: bool = True,
+):
+    """
+    输入 JSONL 每行：{"id": ..., "query": "...", "doc_id"?: ..., "category"?: ..., "top_k"?: ...}
+    输出 JSONL 每行：{"id", "query", "hits": [...], "evidence"?: {...}}，行序与输入一致
+    """
+    settings = Settings.from_repo_root()
+
+    if not input_path.exists():
+        console.print(f"[bold red]ERROR[/bold red] input not found: {input_path}")
+        raise typer.Exit(code=1)
+
+    store = open_vector_store(settings)
+    if store.count() == 0:
+        console.print("[bold red]ERROR[/bold red] Vector store is empty. Run index-chunks first.")
+        raise typer.Exit(code=1)
+
+    console.print(f"\n[bold]Search batch[/bold] top_k={top_k} batch_size={batch_size}")
+    console.print(f"  embedding_model: {settings.embedding_model}")
+    console.print(f"  vector_store:    {settings.vector_store}")
+    console.print(f"  input:           {input_path}")
+    console.print(f"  output:          {output_path}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    n_queries = 0
+    n_gate_ok = 0
+    t0 = time.perf_counter()
+    with output_path.open("w", encoding="utf-8") as out:
+        for batch in _iter_batches(input_path, max(1, batch_size)):
+            # 同一批内按 (where, top_k) 分组，每组只发一次多向量 query
+            groups: dict[str, list[int]] = {}
+            for i, item in enumerate(batch):
+                where = build_where(item.get("doc_id"), item.get("category"))
+                k = int(item.get("top_k") or top_k)
+                groups.setdefault(json.dumps([where, k], sort_keys=True), []).append(i)
+
+            results: list[list[Any]] = [[] for _ in batch]
+            for key, idxs in groups.items():
+                where, k = json.loads(key)
+                hits_per_query = retrieve_top_k_batch(
+                    store,
+                    [str(batch[i]["query"]) for i in idxs],
+                    settings.embedding_model,
+                    top_k=k,
+                    where=where,
+                    batch_size=batch_size,
+                )
+                for i, hits in zip(idxs, hits_per_query):
+                    results[i] = hits
+
+            for item, hits in zip(batch, results):
+                row: dict[str, Any] = {
+                    "id": item["id"],
+                    "query": item["query"],
+                    "hits": [
+                        {
+                            "rank": h.rank,
+                            "chunk_id": h.chunk_id,
+                            "distance": h.distance,
+                            "doc_id": h.metadata.get("doc_id"),
+                            "page_number": h.metadata.get("page_number"),
+                            "snippet": make_snippet(h.text, max_chars=160),
+                        }
+                        for h in hits
+                    ],
+                }
+                if use_gate:
+                    decision = assess_evidence(
+                        hits=hits,
+                        top1_max_dist=settings.evidence_top1_max_dist,
+                        good_hit_max_dist=settings.evidence_good_hit_max_dist,
+                        min_good_hits=settings.evidence_min_good_hits,
+                        min_gap=settings.evidence_min_gap,
+                        min_fused_top1=settings.evidence_min_fused_top1,
+                    )
+                    n_gate_ok += int(decision.ok)
+                    row["evidence"] = {"ok": decision.ok, "stats": decision.stats}
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+            n_queries += len(batch)
+            out.flush()
+            elapsed = time.perf_counter() - t0
+            console.print(f"  processed={n_queries}  {n_queries / max(elapsed, 1e-9):.1f} queries/s")
+
+    elapsed = time.perf_counter() - t0
+    console.print(f"[bold green]DONE[/bold green] queries={n_queries} elapsed={elapsed:.2f}s "
+                  f"throughput={n_queries / max(elapsed, 1e-9):.1f} queries/s")
+    if use_gate:
+        console.print(f"  evidence ok: {n_gate_ok}/{n_queries}")
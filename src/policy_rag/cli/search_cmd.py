@@ -5,8 +5,9 @@ from rich.console import Console
 from rich.table import Table
 
 from policy_rag.config.settings import Settings
-from policy_rag.index.chroma_store import ChromaStore
-from policy_rag.retrieval.retriever import retrieve_top_k, make_snippet
+from policy_rag.index.base import open_vector_store
+from policy_rag.retrieval.pipeline import retrieve_traced
+from policy_rag.retrieval.retriever import build_where, make_snippet
 from policy_rag.retrieval.evidence_gate import assess_evidence
 
 console = Console()
@@ -18,42 +19,30 @@ def search(
     category: str | None,
     show_full: bool,
     use_gate: bool = True,
+    expand_neighbors: int | None = None,
 ):
     settings = Settings.from_repo_root()
 
-    store = ChromaStore(
-        persist_dir=settings.index_dir / "chroma",
-        collection_name=settings.chroma_collection,
-    )
+    store = open_vector_store(settings)
 
     if store.count() == 0:
-        console.print("[bold red]ERROR[/bold red] Chroma collection is empty. Run index-chunks first.")
+        console.print("[bold red]ERROR[/bold red] Vector store is empty. Run index-chunks first.")
         raise typer.Exit(code=1)
     
     # 创建搜索的筛选范围
-    where = None
-    if doc_id and category:
-        where = {"$and": [{"doc_id": doc_id}, {"category": category}]}
-    elif doc_id:
-        where = {"doc_id": doc_id}
-    elif category:
-        where = {"category": category}
+    where = build_where(doc_id, category)
 
     console.print(f"\n[bold]Search[/bold] top_k={top_k}")
     console.print(f"  embedding_model: {settings.embedding_model}")
     console.print(f"  collection:      {settings.chroma_collection}")
+    console.print(f"  retrieval_mode:  {settings.retrieval_mode}")
 
     if where:
         console.print(f"  where:           {where}")
     console.print(f"  query:           {query}")
 
-    hits = retrieve_top_k(
-        store,
-        query,
-        settings.embedding_model,
-        top_k,
-        where,
-    )
+    hits, trace = retrieve_traced(settings, store, query, top_k, where, expand_neighbors=expand_neighbors)
+    console.print(f"[dim]retrieval: {trace}[/dim]")
 
     decision = None
     if use_gate:
@@ -63,6 +52,7 @@ def search(
             good_hit_max_dist=settings.evidence_good_hit_max_dist,
             min_good_hits=settings.evidence_min_good_hits,
             min_gap=settings.evidence_min_gap,
+            min_fused_top1=settings.evidence_min_fused_top1,
         )
 
         if decision.ok:
@@ -96,10 +86,11 @@ def search(
         content = h.text if show_full else make_snippet(h.text, max_chars=160)
 
         doc_show = did if not title else f"{did}\n{title}"
+        dist_show = f"{h.distance:.4f}" if h.fused_score is None else f"{h.distance:.4f}\nrrf={h.fused_score:.3f}"
 
         table.add_row(
             str(h.rank),
-            f"{h.distance:.4f}",
+            dist_show,
             doc_show,
             page,
             sec,
@@ -108,7 +99,7 @@ def search(
 
     console.print(table)
 
-    if hits and hits[0].distance != hits[0].distance:  # NaN
+    if hits and hits[0].distance != hits[0].distance and hits[0].fused_score is None:  # NaN
         console.print("[yellow]WARN[/yellow] Distance is NaN; check embeddings/collection config.")
     console.print(
         "\n[dim]Tip: 证据不足时，我们会“拒绝给出确定结论 + 给出追问建议”，这是后续 ask/summarize 强制执行的反幻觉策略。[/dim]"
@@ -1,12 +1,26 @@
 from __future__ import annotations
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import typer
 from rich.console import Console
 from rich.table import Table
 
 from policy_rag.config.settings import Settings
-from policy_rag.index.chroma_store import ChromaStore
-from policy_rag.llm.llm_client import OllamaClient, ChatMessage
+from policy_rag.index.base import open_vector_store
+from policy_rag.llm.llm_client import ChatMessage, open_ollama_client
+from policy_rag.prompts.context_packer import pack_for_prompt
+from policy_rag.prompts.map_reduce import (
+    MapGroup,
+    MapResult,
+    coverage,
+    merge_partials,
+    order_chunks,
+    parse_partial,
+    plan_groups,
+    stage_timings,
+)
 from policy_rag.prompts.policy_card_prompt import SYSTEM_PROMPT, USER_TEMPLATE
 from policy_rag.schemas.structured_answer import StructuredAnswer
 from policy_rag.utils.json_extract import extract_first_json
@@ -56,23 +70,6 @@ def _pick_representative_sources(documents, metadatas, max_sources: int = 16):
 
     return picked
 
-def _format_sources(picked, max_chars_per_source: int = 900) -> str:
-    blocks = []
-    for i, it in enumerate(picked, start=1):
-        md = it["md"] or {}
-        did = str(md.get("doc_id", "") or "")
-        title = str(md.get("title", "") or "")
-        page = md.get("page_number", "")
-        sec = str(md.get("section_path", "") or "")
-
-        text = it["text"]
-        if len(text) > max_chars_per_source:
-            text = text[:max_chars_per_source] + "..."
-
-        header = f"[{i}] doc_id={did} title={title} page={page} section={sec}".strip()
-        blocks.append(header + "\n" + text)
-    return "\n\n--\n\n".join(blocks)
-
 def _render_items(title: str, items, picked):
     if not items:
         return
@@ -101,9 +98,106 @@ def _render_items(title: str, items, picked):
                 console.print("     [red]提示[/red]：quote 未在该 source chunk 中命中，可能是模型改写/拼接/省略号导致。")
 
 
+def _run_map(client, groups: list[MapGroup], title: str, concurrency: int, llm_cache: bool) -> list[MapResult]:
+    schema = StructuredAnswer.model_json_schema()
+
+    def one(g: MapGroup) -> MapResult:
+        t0 = time.perf_counter()
+        r = MapResult(group=g)
+        try:
+            raw = client.chat(g.messages, response_format=schema, endpoint="summarize_map", use_cache=llm_cache)
+            r.answer, r.refused = parse_partial(raw, title)
+        except (ValueError, RuntimeError, TimeoutError) as e:
+            r.error = str(e)[:300]
+        r.elapsed_ms = (time.perf_counter() - t0) * 1000
+        status = "[green]ok[/green]" if r.ok else f"[red]failed[/red] {r.error}"
+        console.print(f"  map {g.index + 1}/{len(groups)} pages {g.info()['pages']}: {status} ({r.elapsed_ms:.0f} ms)")
+        return r
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        return list(ex.map(one, groups))
+
+def _render_summary(parsed: StructuredAnswer, picked) -> None:
+    console.print("\n[bold green]政策速览卡片（基于证据）[/bold green]")
+    console.print(f"制度：{parsed.question}")
+
+    _render_items("适用对象 / 范围", parsed.applicable_to, picked)
+    _render_items("核心结论", parsed.key_conclusions, picked)
+    _render_items("条件 / 资格 / 门槛", parsed.conditions, picked)
+    _render_items("材料清单", parsed.materials, picked)
+    _render_items("流程步骤", parsed.procedure, picked)
+    _render_items("时间节点 / 截止日期", parsed.time_nodes, picked)
+    _render_items("例外条款 / 坑点", parsed.exceptions_pitfalls, picked)
+    _render_items("咨询渠道 / 官方入口", parsed.contact_channel, picked)
+
+    if parsed.uncertainties:
+        console.print("\n[bold yellow]不确定项（证据不足，需核对原文/补充信息）[/bold yellow]")
+        for u in parsed.uncertainties:
+            console.print(f"- {u}")
+
+    if parsed.warnings:
+        console.print("\n[bold]提醒：[/bold]")
+        for w in parsed.warnings:
+            console.print(f"- {w}")
+
+def _summarize_map_reduce(settings: Settings, meta, ids, docs, metas, llm_cache: bool) -> None:
+    t0 = time.perf_counter()
+    chunks = order_chunks(ids, docs, metas)
+    groups = plan_groups(settings, meta, chunks)
+    if not groups:
+        console.print(f"[bold red]ERROR[/bold red] Document has no indexed chunks with text: doc_id={meta.doc_id}")
+        raise typer.Exit(code=1)
+    t_map = time.perf_counter()
+
+    concurrency = settings.summary_map_concurrency
+    console.print(f"\n[bold]Summarize (map-reduce)[/bold] doc_id={meta.doc_id}")
+    console.print(f"  title: {meta.title}")
+    console.print(f"  chunks: {len(chunks)}  groups: {len(groups)}  concurrency: {concurrency}")
+
+    client = open_ollama_client(settings)
+    console.print(f"\n[bold]LLM[/bold] provider=ollama model={settings.ollama_model}")
+    results = _run_map(client, groups, meta.title, concurrency, llm_cache)
+    if not any(r.ok for r in results):
+        console.print(f"[bold red]ERROR[/bold red] All {len(results)} map calls failed.")
+        raise typer.Exit(code=1)
+    t_reduce = time.perf_counter()
+
+    parsed, merge_stats = merge_partials(results, meta.title)
+    cov = coverage(chunks, results)
+    t_end = time.perf_counter()
+    if cov["groups_failed"]:
+        parsed.warnings.append(f"有 {cov['groups_failed']} 个部分总结失败，未覆盖页码：{cov['missing_pages'] or '无'}，请核对原文。")
+
+    # 合并后的 source_id 是 chunks 里的位置（1-based），_render_items 直接按它取原文核对引用
+    _render_summary(parsed, chunks)
+
+    tm = stage_timings(
+        results,
+        prepare_ms=(t_map - t0) * 1000,
+        map_ms=(t_reduce - t_map) * 1000,
+        reduce_ms=(t_end - t_reduce) * 1000,
+        total_ms=(t_end - t0) * 1000,
+        concurrency=concurrency,
+    )
+    table = Table(title="map-reduce")
+    table.add_column("stage")
+    table.add_column("value", justify="right")
+    table.add_row("prepare_ms", f"{tm['prepare_ms']:.0f}")
+    table.add_row("map_ms (wall)", f"{tm['map_ms']:.0f}")
+    table.add_row("map_call_ms (sum / max)", f"{tm['map_call_ms_sum']:.0f} / {tm['map_call_ms_max']:.0f}")
+    table.add_row("reduce_ms", f"{tm['reduce_ms']:.0f}")
+    table.add_row("total_ms", f"{tm['total_ms']:.0f}")
+    table.add_row("pages covered", f"{cov['pages_covered']}/{cov['pages_total']}")
+    table.add_row("chunks covered", f"{cov['chunks_covered']}/{cov['chunks_total']} ({100 * cov['char_ratio']:.1f}% chars)")
+    table.add_row("items (in → out)", f"{merge_stats['items_in']} → {merge_stats['items_out']} (merged {merge_stats['duplicates_merged']})")
+    console.print()
+    console.print(table)
+
 def summarize(
     doc_id: str = ...,
-    max_sources: int = 16
+    max_sources: int = 16,
+    llm_cache: bool = True,
+    mode: str | None = None,
 ):
     settings = Settings.from_repo_root()
 
@@ -113,22 +207,24 @@ def summarize(
         console.print(f"[bold red]ERROR[/bold red] doc_id not found in docs.csv: {doc_id}")
         raise typer.Exit(code=1)
     
-    store = ChromaStore(
-        persist_dir=settings.index_dir / "chroma",
-        collection_name=settings.chroma_collection,
-    )
+    store = open_vector_store(settings)
 
     if store.count() == 0:
-        console.print("[bold red]ERROR[/bold red] Chroma collection is empty. Run index-chunks first.")
+        console.print("[bold red]ERROR[/bold red] Vector store is empty. Run index-chunks first.")
         raise typer.Exit(code=1)
     
     got = store.get(where={"doc_id": doc_id}, limit=5000)
+    ids = got.get("ids") or []
     docs = got.get("documents") or []
     metas = got.get("metadatas") or []
 
     if not docs:
         console.print(f"[bold red]ERROR[/bold red] No chunks found for doc_id={doc_id}. Did you index-chunks?")
         raise typer.Exit(code=1)
+
+    if (mode or settings.summary_mode) == "map_reduce":
+        _summarize_map_reduce(settings, meta, ids, docs, metas, llm_cache)
+        return
     
     picked = _pick_representative_sources(docs, metas, max_sources=max_sources)
 
@@ -148,7 +244,11 @@ def summarize(
     if pages:
         console.print(f"  covered_pages: {pages[:20]}{'...' if len(pages) > 20 else ''}")
 
-    sources_str = _format_sources(picked=picked, max_chars_per_source=900)
+    packed = pack_for_prompt(settings, [(it["text"], it["md"]) for it in picked], SYSTEM_PROMPT, USER_TEMPLATE, meta.title)
+    console.print(
+        f"  context: {packed.tokens}/{packed.budget} tokens ({packed.counter}), "
+        f"sources {len(packed.source_ids)}/{packed.n_input}, truncated={packed.truncated}"
+    )
 
     user_prompt = USER_TEMPLATE.format(
         doc_id=meta.doc_id,
@@ -157,15 +257,10 @@ def summarize(
         publish_date=meta.publish_date,
         effective_date=meta.effective_date,
         status=meta.status,
-        sources=sources_str,
+        sources=packed.text,
     )
 
-    client = OllamaClient(
-        base_url=settings.ollama_base_url,
-        model=settings.ollama_model,
-        temperature=settings.ollama_temperature,
-        num_predict=settings.ollama_num_predict,
-    )
+    client = open_ollama_client(settings)
 
     console.print(f"\n[bold]LLM[/bold] provider=ollama model={settings.ollama_model}")
     raw = client.chat(
@@ -174,29 +269,10 @@ def summarize(
             ChatMessage(role="user", content=user_prompt),
         ],
         response_format=StructuredAnswer.model_json_schema(),
+        endpoint="summarize",
+        use_cache=llm_cache,
     )
 
     obj = extract_first_json(raw)
     parsed = StructuredAnswer.model_validate(obj)
-
-    console.print("\n[bold green]政策速览卡片（基于证据）[/bold green]")
-    console.print(f"制度：{parsed.question}")
-
-    _render_items("适用对象 / 范围", parsed.applicable_to, picked)
-    _render_items("核心结论", parsed.key_conclusions, picked)
-    _render_items("条件 / 资格 / 门槛", parsed.conditions, picked)
-    _render_items("材料清单", parsed.materials, picked)
-    _render_items("流程步骤", parsed.procedure, picked)
-    _render_items("时间节点 / 截止日期", parsed.time_nodes, picked)
-    _render_items("例外条款 / 坑点", parsed.exceptions_pitfalls, picked)
-    _render_items("咨询渠道 / 官方入口", parsed.contact_channel, picked)
-
-    if parsed.uncertainties:
-        console.print("\n[bold yellow]不确定项（证据不足，需核对原文/补充信息）[/bold yellow]")
-        for u in parsed.uncertainties:
-            console.print(f"- {u}")
-
-    if parsed.warnings:
-        console.print("\n[bold]提醒：[/bold]")
-        for w in parsed.warnings:
-            console.print(f"- {w}")
\ No newline at end of file
+    _render_summary(parsed, picked)
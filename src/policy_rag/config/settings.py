@@ -18,13 +18,101 @@ class Settings:
 
     # Embedding
     embedding_model: str
+    embedding_backend: str # "torch" | "onnx" | "onnx-int8"
+    onnx_dir: Path # ONNX 导出/量化产物目录
+    embedding_threads: int # ONNX Runtime intra-op 线程数（0 = 由 ORT 自动决定）
     chroma_collection: str
+    vector_store: str # "chroma" | "numpy"（精确 float32 矩阵乘检索）
+
+    # Embedding 缓存（按模型名 + 归一化 + 文本哈希内容寻址，重复 ingest 时只编码新增/改动的 chunk）
+    embed_cache_enabled: bool
+    embed_cache_dir: Path
+    embed_cache_max_mb: int
+
+    # Query 向量的进程内 LRU/TTL 缓存（serving 路径上热门问题不再重复编码）
+    query_cache_size: int
+    query_cache_ttl_s: float
+
+    # 答案缓存（/chat 与 ask）：key 含索引代数与 prompt 版本，SQLite 持久化，TTL + LRU 淘汰
+    answer_cache_enabled: bool
+    answer_cache_path: Path
+    answer_cache_max_entries: int
+    answer_cache_ttl_s: float
+
+    # LLM 补全缓存（客户端内部，key = 完整请求体哈希）：只缓存 temperature=0 的调用，除非允许缓存采样输出
+    llm_cache_enabled: bool
+    llm_cache_path: Path
+    llm_cache_max_mb: float
+    llm_cache_allow_sampling: bool
+
+    # 语义近重复问题缓存（/chat，进程内）：同 scope 下与已回答问题的 cosine ≥ 阈值时复用其回答
+    semantic_cache_enabled: bool
+    semantic_cache_threshold: float
+    semantic_cache_size: int
+
+    # /chat 并发的相同问题合并为一次检索 + 一次生成（single-flight）
+    coalesce_enabled: bool
+
+    # API 并发 query 的动态微批：最多攒 max_batch 条或等待 max_wait_ms 毫秒
+    query_batch_enabled: bool
+    query_batch_max_size: int
+    query_batch_max_wait_ms: float
+
+    # API 启动时预热 embedding 模型与向量库
+    api_warmup: bool
+
+    # 批量 ingest 的多进程 embedding 池（0 表示自动：按 CPU 核数推算）
+    embed_pool_workers: int
+    embed_pool_cores_per_worker: int
+
+    # 检索模式："dense"（纯向量）| "hybrid"（向量 + 中文 n-gram BM25，RRF 融合）
+    retrieval_mode: str
+    hybrid_candidates: int # 混合检索时每一路取多少候选参与融合
+    hybrid_rrf_k: int # RRF 的平滑常数 k
+
+    # 两阶段文档路由：先用文档级向量选出 top-M 个文档，再只在这些文档里查 chunk；置信度低时退回全局检索
+    doc_routing_enabled: bool
+    doc_routing_top_m: int
+    doc_routing_min_score: float # top1 文档的 cosine 相似度下限
+    doc_routing_min_margin: float # top1 与第 M+1 名文档的相似度差下限
+    doc_routing_min_hits: int # 路由后的候选少于这个数才退回全局检索；0 = top_k
+
+    # Cross-encoder 重排：先多取 rerank_candidates 个候选，预算 rerank_budget_ms 内打完分才采用重排结果
+    rerank_enabled: bool
+    rerank_model: str
+    rerank_candidates: int
+    rerank_budget_ms: float
+    rerank_batch_size: int
+    rerank_cache_size: int # (query 哈希, chunk_id) -> 分数 的 LRU 缓存条数
+
+    # 检索后去重：合并同页重叠/相邻的命中，腾出的名额由后续命中补位（多取 top_k * dedup_overfetch 个候选）
+    dedup_merge_enabled: bool
+    dedup_overfetch: int
+    merge_max_span_chars: int
+
+    # 邻居上下文扩展：每个命中按邻接索引接上前后各 neighbor_expand 个 chunk（0 = 关闭），单段不超过 neighbor_max_chars
+    neighbor_expand: int
+    neighbor_max_chars: int
+
+    # 发给 LLM 的【SOURCES】按 token 预算打包（见 prompts/context_packer.py）：
+    # 总预算、单条上限、为输出预留的 token；tokenizer 为空时用估算计数
+    context_token_budget: int
+    context_max_tokens_per_source: int
+    context_reserve_output_tokens: int # 实际预留不少于 ollama_num_predict（见 output_reserve）
+    context_tokenizer: str
+
+    # 文档总结模式："single"（每页取一个 chunk，一次调用）| "map_reduce"（全部 chunk 分组并发抽取再合并）
+    # map 阶段每组 SOURCES 的 token 预算与同时发出的 map 调用数
+    summary_mode: str
+    summary_map_token_budget: int
+    summary_map_concurrency: int
 
     # Evidence Gate
     evidence_top1_max_dist: float # top-1（排名第一的chunk）的距离不能超过这个上限
     evidence_good_hit_max_dist: float # 将检索结果中 distance ≤ 该阈值的 chunk 视为“高相关/好证据“
     evidence_min_good_hits: int # 至少要有多少条“好证据“
     evidence_min_gap: float # 用median(distance) - top1_distance 衡量区分度，top1 必须“明显优于整体“
+    evidence_min_fused_top1: float # 混合检索：top1 的归一化融合分 ≥ 该值（两路都排在前面）时，视为强命中
     
     # llm
     llm_provider: str
@@ -35,6 +123,18 @@ class Settings:
     # 温度越高：更有创造性，但更容易跑偏
     ollama_temperature: float 
     ollama_num_predict: int # 本次最多生成多少token
+    ollama_num_ctx: int # 上下文窗口（token）：prompt + 输出都要放得下，超出的 prompt 会被截掉
+    ollama_keep_alive: str # 模型空闲多久后卸载（"30m"；"-1" 常驻；空 = 用 Ollama 默认的 5 分钟）
+    # keep-alive 连接池：建连超时 / 单次读超时（秒），最多同时打开的连接数，池满时等空闲连接的上限（秒）
+    ollama_connect_timeout_s: float
+    ollama_read_timeout_s: float
+    ollama_pool_size: int
+    ollama_pool_wait_s: float
+    # API 的生成并发控制：同时在跑的生成数上限、排队上限、排队最长等待（秒）、单个请求的总期限（秒）
+    ollama_max_in_flight: int
+    ollama_max_queue: int
+    ollama_queue_timeout_s: float
+    llm_deadline_s: float
 
     @staticmethod
     def from_repo_root(repo_root: Path | None = None) -> Settings:
@@ -47,13 +147,70 @@ class Settings:
             index_dir= root / "data" / "index",
             # 优先从环境变量中读取配置；如果没配环境变量，就用默认值
             embedding_model=os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-zh-v1.5"),
+            embedding_backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+            onnx_dir=root / "data" / "models" / "onnx",
+            embedding_threads=int(os.getenv("EMBEDDING_THREADS", "0")),
             chroma_collection=os.getenv("CHROMA_COLLECTION", "policy-chunks"),
+            vector_store=os.getenv("VECTOR_STORE", "chroma"),
+            embed_cache_enabled=os.getenv("EMBED_CACHE_ENABLED", "1") == "1",
+            embed_cache_dir=root / "data" / "index" / "embed_cache",
+            embed_cache_max_mb=int(os.getenv("EMBED_CACHE_MAX_MB", "512")),
+            query_cache_size=int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+            query_cache_ttl_s=float(os.getenv("QUERY_CACHE_TTL_S", "3600")),
+            answer_cache_enabled=os.getenv("ANSWER_CACHE_ENABLED", "1") == "1",
+            answer_cache_path=root / "data" / "index" / "answer_cache.sqlite",
+            answer_cache_max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+            answer_cache_ttl_s=float(os.getenv("ANSWER_CACHE_TTL_S", "86400")),
+
+            llm_cache_enabled=os.getenv("LLM_CACHE_ENABLED", "1") == "1",
+            llm_cache_path=root / "data" / "index" / "llm_cache.sqlite",
+            llm_cache_max_mb=float(os.getenv("LLM_CACHE_MAX_MB", "256")),
+            llm_cache_allow_sampling=os.getenv("LLM_CACHE_ALLOW_SAMPLING", "0") == "1",
+            semantic_cache_enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1",
+            semantic_cache_threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            semantic_cache_size=int(os.getenv("SEMANTIC_CACHE_SIZE", "2048")),
+            coalesce_enabled=os.getenv("COALESCE_ENABLED", "1") == "1",
+            query_batch_enabled=os.getenv("QUERY_BATCH_ENABLED", "1") == "1",
+            query_batch_max_size=int(os.getenv("QUERY_BATCH_MAX_SIZE", "16")),
+            query_batch_max_wait_ms=float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "3")),
+            api_warmup=os.getenv("API_WARMUP", "1") == "1",
+            embed_pool_workers=int(os.getenv("EMBED_POOL_WORKERS", "0")),
+            embed_pool_cores_per_worker=int(os.getenv("EMBED_POOL_CORES_PER_WORKER", "0")),
+            retrieval_mode=os.getenv("RETRIEVAL_MODE", "dense"),
+            hybrid_candidates=int(os.getenv("HYBRID_CANDIDATES", "50")),
+            hybrid_rrf_k=int(os.getenv("HYBRID_RRF_K", "60")),
+            doc_routing_enabled=os.getenv("DOC_ROUTING_ENABLED", "0") == "1",
+            doc_routing_top_m=int(os.getenv("DOC_ROUTING_TOP_M", "3")),
+            doc_routing_min_score=float(os.getenv("DOC_ROUTING_MIN_SCORE", "0.5")),
+            doc_routing_min_margin=float(os.getenv("DOC_ROUTING_MIN_MARGIN", "0.02")),
+            doc_routing_min_hits=int(os.getenv("DOC_ROUTING_MIN_HITS", "0")),
+            rerank_enabled=os.getenv("RERANK_ENABLED", "0") == "1",
+            rerank_model=os.getenv("RERANK_MODEL", "BAAI/bge-reranker-base"),
+            rerank_candidates=int(os.getenv("RERANK_CANDIDATES", "50")),
+            rerank_budget_ms=float(os.getenv("RERANK_BUDGET_MS", "300")),
+            rerank_batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+            rerank_cache_size=int(os.getenv("RERANK_CACHE_SIZE", "20000")),
+            dedup_merge_enabled=os.getenv("DEDUP_MERGE_ENABLED", "0") == "1",
+            dedup_overfetch=int(os.getenv("DEDUP_OVERFETCH", "2")),
+            merge_max_span_chars=int(os.getenv("MERGE_MAX_SPAN_CHARS", "3000")),
+            neighbor_expand=int(os.getenv("NEIGHBOR_EXPAND", "0")),
+            neighbor_max_chars=int(os.getenv("NEIGHBOR_MAX_CHARS", "1800")),
+
+            context_token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+            context_max_tokens_per_source=int(os.getenv("CONTEXT_MAX_TOKENS_PER_SOURCE", "600")),
+            context_reserve_output_tokens=int(os.getenv("CONTEXT_RESERVE_OUTPUT_TOKENS", "1536")),
+            context_tokenizer=os.getenv("CONTEXT_TOKENIZER", ""),
+
+            summary_mode=os.getenv("SUMMARY_MODE", "single"),
+            summary_map_token_budget=int(os.getenv("SUMMARY_MAP_TOKEN_BUDGET", "4000")),
+            summary_map_concurrency=int(os.getenv("SUMMARY_MAP_CONCURRENCY", "2")),
 
             # Evidence Gate Defaults(distance 越小越相关)
             evidence_top1_max_dist=float(os.getenv("EVIDENCE_TOP1_MAX_DIST", "0.95")),
             evidence_good_hit_max_dist=float(os.getenv("EVIDENCE_GOOD_HIT_MAX_DIST", "1.05")),
             evidence_min_good_hits=int(os.getenv("EVIDENCE_MIN_GOOD_HITS", "2")),
             evidence_min_gap=float(os.getenv("EVIDENCE_MIN_GAP", "0.03")),
+            evidence_min_fused_top1=float(os.getenv("EVIDENCE_MIN_FUSED_TOP1", "0.9")),
 
             # LLM(Ollama)
             llm_provider=os.getenv("LLM_PROVIDER", "ollama"),
@@ -61,4 +218,15 @@ class Settings:
             ollama_model=os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M"),
             ollama_temperature=float(os.getenv("OLLAMA_TEMPERATURE", "0.2")),
             ollama_num_predict=int(os.getenv("OLLAMA_NUM_PREDICT", "4800")),
+            ollama_num_ctx=int(os.getenv("OLLAMA_NUM_CTX", "8192")),
+            ollama_keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+            ollama_connect_timeout_s=float(os.getenv("OLLAMA_CONNECT_TIMEOUT_S", "5")),
+            ollama_read_timeout_s=float(os.getenv("OLLAMA_READ_TIMEOUT_S", "240")),
+            ollama_pool_size=int(os.getenv("OLLAMA_POOL_SIZE", "8")),
+            # 0 = 与 OLLAMA_READ_TIMEOUT_S 相同（占着连接的请求正在生成，可能要几十秒）
+            ollama_pool_wait_s=float(os.getenv("OLLAMA_POOL_WAIT_S", "0")),
+            ollama_max_in_flight=int(os.getenv("OLLAMA_MAX_IN_FLIGHT", "2")),
+            ollama_max_queue=int(os.getenv("OLLAMA_MAX_QUEUE", "16")),
+            ollama_queue_timeout_s=float(os.getenv("OLLAMA_QUEUE_TIMEOUT_S", "30")),
+            llm_deadline_s=float(os.getenv("LLM_DEADLINE_S", "300")),
         )
\ No newline at end of file
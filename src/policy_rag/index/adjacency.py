@@ -0,0 +1,186 @@
+# chunk 邻接索引：ingest 时预先算好每个 chunk 在文档中的前一个 / 后一个 chunk（跨页也相连）
+# 检索命中把条款截断时，按 ±N 个邻居扩展上下文只需要查这张表（O(1)），不需要额外的向量查询。
+#
+# 磁盘布局：<persist_dir>/<collection>/
+#   adjacency.npz  每行一个 chunk：doc 编码 / page_number / chunk_index / char_start / char_end / prev / next（行号，-1 表示没有）
+#   meta.json      ids（行号 -> chunk_id）与 doc_id 字典
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from policy_rag.config.settings import Settings
+
+_META_VERSION = 1
+_COLUMNS = ("doc", "page", "chunk_index", "char_start", "char_end", "prev", "next")
+
+def _position_of(md: dict[str, Any]) -> Optional[tuple[int, int, int, int]]:
+    # 旧版本 ingest 写入的行可能缺少位置字段：这种行不进邻接表（查不到邻居，检索时原样返回）
+    try:
+        return int(md["page_number"]), int(md["chunk_index"]), int(md["char_start"]), int(md["char_end"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class AdjacencyIndex:
+    def __init__(self, persist_dir: Path, collection_name: str):
+        self.persist_dir = persist_dir
+        self.dir = persist_dir / collection_name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.arrays_path = self.dir / "adjacency.npz"
+        self.meta_path = self.dir / "meta.json"
+
+        self._lock = threading.RLock()
+        self._loaded_mtime: float | None = None
+        self._reset_memory()
+        self._load()
+
+    def _reset_memory(self) -> None:
+        self._ids: list[str] = []
+        self._id_to_row: dict[str, int] = {}
+        self._docs: list[str] = []
+        self._arr: dict[str, np.ndarray] = {k: np.empty(0, dtype=np.int32) for k in _COLUMNS}
+
+    def _load(self) -> None:
+        if not self.meta_path.exists() or not self.arrays_path.exists():
+            return
+        mtime = self.meta_path.stat().st_mtime
+        obj = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        if obj.get("version") != _META_VERSION:
+            raise RuntimeError(f"Unsupported adjacency index format in {self.meta_path}")
+
+        self._reset_memory()
+        self._ids = list(obj["ids"])
+        self._docs = list(obj["docs"])
+        self._id_to_row = {cid: i for i, cid in enumerate(self._ids)}
+        with np.load(self.arrays_path) as z:
+            self._arr = {k: z[k] for k in _COLUMNS}
+        self._loaded_mtime = mtime
+
+    def _maybe_reload(self) -> None:
+        try:
+            mtime = self.meta_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self._load()
+
+    def _save(self) -> None:
+        tmp_npz = self.dir / "adjacency.tmp.npz"
+        np.savez(tmp_npz, **self._arr)
+        tmp_npz.replace(self.arrays_path)
+
+        tmp_meta = self.meta_path.with_suffix(".json.tmp")
+        tmp_meta.write_text(
+            json.dumps(
+                {"version": _META_VERSION, "ids": self._ids, "docs": self._docs},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ),
+            encoding="utf-8",
+        )
+        tmp_meta.replace(self.meta_path)
+        self._loaded_mtime = self.meta_path.stat().st_mtime
+
+    def _relink(self, ids: list[str], cols: dict[str, np.ndarray]) -> None:
+        # 按 (doc, page, chunk_index) 排序后，同一文档内相邻的两行互为 prev/next
+        order = np.lexsort((cols["chunk_index"], cols["page"], cols["doc"]))
+        self._ids = [ids[i] for i in order]
+        self._id_to_row = {cid: i for i, cid in enumerate(self._ids)}
+        arr = {k: np.ascontiguousarray(v[order], dtype=np.int32) for k, v in cols.items()}
+
+        n = len(self._ids)
+        same_doc = arr["doc"][1:] == arr["doc"][:-1] if n > 1 else np.zeros(0, dtype=bool)
+        prev = np.full(n, -1, dtype=np.int32)
+        nxt = np.full(n, -1, dtype=np.int32)
+        rows = np.arange(n, dtype=np.int32)
+        prev[1:][same_doc] = rows[:-1][same_doc]
+        nxt[:-1][same_doc] = rows[1:][same_doc]
+        arr["prev"], arr["next"] = prev, nxt
+        self._arr = arr
+
+    def upsert_doc(self, doc_id: str, ids: list[str], metadatas: list[dict[str, Any]]) -> int:
+        """用这一批 chunk 整体替换 doc_id 的邻接关系（ingest 按文档进行）；返回因缺少位置字段而跳过的行数。"""
+        rows = [(cid, pos) for cid, pos in zip(ids, (_position_of(md or {}) for md in metadatas)) if pos is not None]
+        new_ids = [cid for cid, _ in rows]
+        pos = np.asarray([p for _, p in rows], dtype=np.int32).reshape(len(rows), 4)
+        with self._lock:
+            self._maybe_reload()
+            if doc_id not in self._docs:
+                self._docs.append(doc_id)
+            code = self._docs.index(doc_id)
+
+            keep = self._arr["doc"] != code
+            kept_ids = [cid for cid, k in zip(self._ids, keep) if k]
+            new_cols = {
+                "doc": np.full(len(new_ids), code, dtype=np.int32),
+                "page": pos[:, 0],
+                "chunk_index": pos[:, 1],
+                "char_start": pos[:, 2],
+                "char_end": pos[:, 3],
+            }
+            cols = {k: np.concatenate([self._arr[k][keep], new_cols[k]]) for k in new_cols}
+            self._relink(kept_ids + new_ids, cols)
+            self._save()
+        return len(ids) - len(new_ids)
+
+    def delete_doc(self, doc_id: str) -> None:
+        with self._lock:
+            self._maybe_reload()
+            if doc_id not in self._docs:
+                return
+            keep = self._arr["doc"] != self._docs.index(doc_id)
+            if keep.all():
+                return
+            kept_ids = [cid for cid, k in zip(self._ids, keep) if k]
+            cols = {k: self._arr[k][keep] for k in ("doc", "page", "chunk_index", "char_start", "char_end")}
+            self._relink(kept_ids, cols)
+            self._save()
+
+    def neighbors(self, chunk_id: str, n: int = 1) -> tuple[list[str], list[str]]:
+        """返回 (前面最多 n 个 chunk_id（由近到远）, 后面最多 n 个 chunk_id（由近到远）)。"""
+        with self._lock:
+            self._maybe_reload()
+            row = self._id_to_row.get(chunk_id)
+            if row is None:
+                return [], []
+            before: list[str] = []
+            after: list[str] = []
+            r = row
+            for _ in range(n):
+                r = int(self._arr["prev"][r])
+                if r < 0:
+                    break
+                before.append(self._ids[r])
+            r = row
+            for _ in range(n):
+                r = int(self._arr["next"][r])
+                if r < 0:
+                    break
+                after.append(self._ids[r])
+            return before, after
+
+    def position(self, chunk_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            self._maybe_reload()
+            row = self._id_to_row.get(chunk_id)
+            if row is None:
+                return None
+            return {
+                "doc_id": self._docs[int(self._arr["doc"][row])],
+                "page_number": int(self._arr["page"][row]),
+                "chunk_index": int(self._arr["chunk_index"][row]),
+                "char_start": int(self._arr["char_start"][row]),
+                "char_end": int(self._arr["char_end"][row]),
+            }
+
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._ids)
+
+def open_adjacency_index(settings: Settings) -> AdjacencyIndex:
+    return AdjacencyIndex(persist_dir=settings.index_dir / "adjacency", collection_name=settings.chroma_collection)
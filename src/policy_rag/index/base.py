@@ -0,0 +1,71 @@
+# 向量库抽象：ChromaStore / NumpyStore 都实现这一组方法，检索与 ingest 代码只依赖这个协议
+# 返回值沿用 Chroma 的结构（query 结果按 query 分组的嵌套 list），retrieve_top_k 等调用方无需区分后端
+from __future__ import annotations
+
+from typing import Any, Optional, Protocol
+
+import numpy as np
+
+from policy_rag.config.settings import Settings
+
+VECTOR_STORES = ("chroma", "numpy")
+
+def as_f32_matrix(embeddings: np.ndarray | list[list[float]]) -> np.ndarray:
+    # 已经是 C 连续的 float32 时零拷贝；list 输入只在这里转换一次
+    arr = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    return arr
+
+class VectorStore(Protocol):
+    def upsert(
+        self,
+        ids: list[str],
+        documents: list[str],
+        embeddings: np.ndarray | list[list[float]],
+        metadatas: list[dict[str, Any]],
+    ) -> None: ...
+
+    def count(self) -> int: ...
+
+    def query(
+        self,
+        query_embeddings: np.ndarray | list[list[float]],
+        n_results: int,
+        where: Optional[dict[str, Any]] = None,
+    ) -> dict[str, Any]:
+        """返回 {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}（距离越小越相关）"""
+        ...
+
+    def get(
+        self,
+        where: dict[str, Any] | None = None,
+        limit: int = 1000,
+        ids: list[str] | None = None,
+    ) -> dict[str, Any]:
+        """返回 {"ids": [...], "documents": [...], "metadatas": [...]}；传 ids 时只取这些 chunk（不保证顺序）"""
+        ...
+
+    def delete(self, where=None, ids=None) -> None: ...
+
+    def generation(self) -> int:
+        """索引代数：每次 upsert / delete 后 +1（跨进程持久化），用作答案缓存等下游缓存 key 的一部分"""
+        ...
+
+def open_vector_store(settings: Settings) -> VectorStore:
+    """按 Settings.vector_store（环境变量 VECTOR_STORE）打开对应的向量库。"""
+    if settings.vector_store == "chroma":
+        from policy_rag.index.chroma_store import ChromaStore
+
+        return ChromaStore(
+            persist_dir=settings.index_dir / "chroma",
+            collection_name=settings.chroma_collection,
+        )
+    if settings.vector_store == "numpy":
+        from policy_rag.index.numpy_store import NumpyStore
+
+        return NumpyStore(
+            persist_dir=settings.index_dir / "numpy",
+            collection_name=settings.chroma_collection,
+        )
+    raise ValueError(f"Unknown VECTOR_STORE={settings.vector_store!r}. Allowed: {list(VECTOR_STORES)}")
@@ -4,7 +4,15 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import chromadb
+import numpy as np
 
+from policy_rag.index.base import as_f32_matrix
+from policy_rag.index.generation import IndexGeneration
+
+# Chroma 单次写入有条数上限，老版本客户端拿不到时用这个保守值
+_DEFAULT_MAX_BATCH = 5000
+
+# 实现 policy_rag.index.base.VectorStore 协议
 class ChromaStore:
     def __init__(self, persist_dir: Path, collection_name: str):
         self.persist_dir = persist_dir
@@ -14,33 +22,49 @@ class ChromaStore:
         self.client = chromadb.PersistentClient(path=str(self.persist_dir))
         # 去找（或创建）数据库中的一张表（存向量+文本+元数据）
         self.collection = self.client.get_or_create_collection(name=collection_name)
+        self._generation = IndexGeneration(self.persist_dir / f"{collection_name}.generation.json")
+
+        get_max = getattr(self.client, "get_max_batch_size", None)
+        try:
+            self.max_batch_size = int(get_max()) if callable(get_max) else _DEFAULT_MAX_BATCH
+        except Exception:
+            self.max_batch_size = _DEFAULT_MAX_BATCH
 
     # Chroma 天然只有 4 类字段：id、embedding、document、metadata
     def upsert(
         self,
         ids: list[str], # 每条记录的唯一主键
         documents: list[str], # 每条向量对于的原文文本，向量只用于找 top-k 证据，真正给用户看的引用片段来自 documents
-        embeddings: list[list[float]], # 每条文本的向量表示
+        embeddings: np.ndarray | list[list[float]], # 每条文本的向量表示，推荐 (n, dim) float32 ndarray
         metadatas: list[dict[str, Any]]  # 一个dict：自己塞什么键值都行
     ):
-        self.collection.upsert(
-            ids=ids,
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas,
-        )
+        emb = as_f32_matrix(embeddings)
+        if emb.shape[0] != len(ids):
+            raise ValueError(f"embeddings rows ({emb.shape[0]}) != ids ({len(ids)})")
+
+        # 按 Chroma 的批量上限切片写入；ndarray 切片是视图，不会复制向量
+        step = max(1, self.max_batch_size)
+        for i in range(0, len(ids), step):
+            j = i + step
+            self.collection.upsert(
+                ids=ids[i:j],
+                documents=documents[i:j],
+                embeddings=emb[i:j],
+                metadatas=metadatas[i:j],
+            )
+        self._generation.bump()
 
     def count(self) -> int:
         return self.collection.count()
     
     def query(
         self,
-        query_embeddings: list[list[float]],
+        query_embeddings: np.ndarray | list[list[float]], # (n_queries, dim)
         n_results: int,
         where: Optional[dict[str, Any]] = None # 用于限定查询范围，再做向量相似度检索
     ) -> dict[str, Any]:
         return self.collection.query(
-            query_embeddings=query_embeddings,
+            query_embeddings=as_f32_matrix(query_embeddings),
             n_results=n_results,
             where=where,
             include=["documents", "metadatas", "distances"] # 默认会返回ids
@@ -50,8 +74,10 @@ class ChromaStore:
         self,
         where: dict[str, Any] | None = None,
         limit: int = 1000,
+        ids: list[str] | None = None,
     ) -> dict[str, Any]:
         return self.collection.get(
+            ids=ids,
             where=where,
             limit=limit,
             include=["documents", "metadatas"],
@@ -62,4 +88,8 @@ class ChromaStore:
         where = None,
         ids = None,
     ) -> None:
-        self.collection.delete(where=where, ids=ids)
\ No newline at end of file
+        self.collection.delete(where=where, ids=ids)
+        self._generation.bump()
+
+    def generation(self) -> int:
+        return self._generation.current()
\ No newline at end of file
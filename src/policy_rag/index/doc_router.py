@@ -0,0 +1,181 @@
+# 文档级向量索引（两阶段检索的第一阶段：先路由到少数几个文档，再在这些文档里查 chunk）
+# 每个 doc_id 一个向量：该文档所有 chunk 向量的均值（再 L2 归一化），ingest 时顺手算好。
+# 文档数通常只有几十到几百，整张表常驻内存，一次矩阵乘就能给所有文档打分。
+#
+# 磁盘布局：<persist_dir>/<collection>/
+#   doc_vectors.npy   (n_docs, dim) float32
+#   docs.json         doc_ids（行序与向量一致）与每个文档的 chunk 数
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from policy_rag.config.settings import Settings
+from policy_rag.index.base import as_f32_matrix
+
+_DOCS_VERSION = 1
+
+class DocRouter:
+    def __init__(self, persist_dir: Path, collection_name: str):
+        self.persist_dir = persist_dir
+        self.dir = persist_dir / collection_name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "doc_vectors.npy"
+        self.docs_path = self.dir / "docs.json"
+
+        self._lock = threading.RLock()
+        self._loaded_mtime: float | None = None
+        self._doc_ids: list[str] = []
+        self._chunk_counts: list[int] = []
+        self._vecs = np.empty((0, 0), dtype=np.float32)
+        # 路由决策统计：queries = 参与路由的检索次数，routed = 最终按路由结果检索的次数，fallbacks 按原因计数
+        self._queries = 0
+        self._routed = 0
+        self._fallbacks: dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.docs_path.exists() or not self.vectors_path.exists():
+            return
+        mtime = self.docs_path.stat().st_mtime
+        obj = json.loads(self.docs_path.read_text(encoding="utf-8"))
+        if obj.get("version") != _DOCS_VERSION:
+            raise RuntimeError(f"Unsupported doc router format in {self.docs_path}")
+        self._doc_ids = list(obj["doc_ids"])
+        self._chunk_counts = list(obj["chunk_counts"])
+        self._vecs = np.load(self.vectors_path)
+        self._loaded_mtime = mtime
+
+    def _maybe_reload(self) -> None:
+        try:
+            mtime = self.docs_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self._load()
+
+    def _save(self) -> None:
+        tmp_vec = self.dir / "doc_vectors.tmp.npy"
+        np.save(tmp_vec, np.ascontiguousarray(self._vecs, dtype=np.float32))
+        tmp_vec.replace(self.vectors_path)
+
+        tmp_docs = self.docs_path.with_suffix(".json.tmp")
+        tmp_docs.write_text(
+            json.dumps(
+                {"version": _DOCS_VERSION, "doc_ids": self._doc_ids, "chunk_counts": self._chunk_counts},
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        tmp_docs.replace(self.docs_path)
+        self._loaded_mtime = self.docs_path.stat().st_mtime
+
+    def upsert_doc(self, doc_id: str, chunk_embeddings: np.ndarray | list[list[float]]) -> None:
+        """用该文档全部 chunk 的向量（已归一化）计算文档向量：均值后再归一化。"""
+        emb = as_f32_matrix(chunk_embeddings)
+        if emb.shape[0] == 0:
+            return
+        v = emb.mean(axis=0)
+        v /= max(float(np.linalg.norm(v)), 1e-12)
+
+        with self._lock:
+            self._maybe_reload()
+            if len(self._doc_ids) and self._vecs.shape[1] != v.shape[0]:
+                raise ValueError(f"Embedding dim mismatch: router={self._vecs.shape[1]} new={v.shape[0]}")
+            if doc_id in self._doc_ids:
+                i = self._doc_ids.index(doc_id)
+                vecs = np.array(self._vecs, dtype=np.float32)
+                vecs[i] = v
+                self._chunk_counts[i] = int(emb.shape[0])
+            else:
+                vecs = np.vstack([self._vecs.reshape(-1, v.shape[0]), v[None, :]]).astype(np.float32)
+                self._doc_ids.append(doc_id)
+                self._chunk_counts.append(int(emb.shape[0]))
+            self._vecs = vecs
+            self._save()
+
+    def delete_doc(self, doc_id: str) -> None:
+        with self._lock:
+            self._maybe_reload()
+            if doc_id not in self._doc_ids:
+                return
+            i = self._doc_ids.index(doc_id)
+            self._vecs = np.delete(self._vecs, i, axis=0)
+            del self._doc_ids[i]
+            del self._chunk_counts[i]
+            self._save()
+
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._doc_ids)
+
+    def scores(self, query_embedding: np.ndarray) -> list[tuple[str, float]]:
+        """按 cosine 相似度从高到低返回所有文档 [(doc_id, score), ...]。"""
+        q = as_f32_matrix(query_embedding)[0]
+        with self._lock:
+            self._maybe_reload()
+            if not self._doc_ids:
+                return []
+            sims = self._vecs @ q
+            order = np.argsort(-sims, kind="stable")
+            return [(self._doc_ids[i], float(sims[i])) for i in order]
+
+    def record_decision(self, fallback: str | None) -> None:
+        """记录一次路由决策；fallback 为 None 表示按路由结果检索，否则是退回全局检索的原因。"""
+        with self._lock:
+            self._queries += 1
+            if fallback is None:
+                self._routed += 1
+            else:
+                self._fallbacks[fallback] = self._fallbacks.get(fallback, 0) + 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            n_fallback = sum(self._fallbacks.values())
+            return {
+                "docs": len(self._doc_ids),
+                "chunks": int(sum(self._chunk_counts)),
+                "queries": self._queries,
+                "routed": self._routed,
+                "fallbacks": dict(self._fallbacks),
+                "fallback_rate": (n_fallback / self._queries) if self._queries else 0.0,
+            }
+
+def route_documents(
+    scored: list[tuple[str, float]],
+    top_m: int,
+    min_score: float,
+    min_margin: float,
+) -> tuple[list[str] | None, dict[str, Any]]:
+    """
+    路由决策：返回 (要查询的 doc_id 列表, 决策信息)；置信度不够时返回 None（调用方退回全局检索）。
+    - 文档总数不超过 top_m：路由没有意义
+    - top1 相似度低于 min_score：问题可能不针对任何单一文档
+    - top1 与第一个被排除的文档（第 top_m+1 名）差距小于 min_margin：边界模糊，容易漏掉正确文档
+    """
+    info: dict[str, Any] = {"docs_total": len(scored), "top_m": top_m}
+    if len(scored) <= top_m:
+        info["fallback"] = "few_docs"
+        return None, info
+
+    top1 = scored[0][1]
+    margin = top1 - scored[top_m][1]
+    info.update({"top1": top1, "margin": margin})
+    if top1 < min_score:
+        info["fallback"] = "low_score"
+        return None, info
+    if margin < min_margin:
+        info["fallback"] = "low_margin"
+        return None, info
+
+    picked = [did for did, _ in scored[:top_m]]
+    info["docs"] = picked
+    return picked, info
+
+def open_doc_router(settings: Settings) -> DocRouter:
+    return DocRouter(persist_dir=settings.index_dir / "doc_router", collection_name=settings.chroma_collection)
@@ -0,0 +1,37 @@
+# 索引代数（generation）：向量库每次 upsert / delete 都把计数 +1，持久化在 <persist_dir>/<collection>.generation.json
+# 下游缓存（答案缓存等）把代数放进 key：索引内容一变，旧条目自然失效。
+# CLI ingest 与 API 进程各自打开同一个文件，所以 current() 每次都读文件（几十字节），不做进程内缓存；
+# bump() 的 读-加一-写 在 <collection>.generation.lock 的排他 flock 内完成，两个进程同时 bump 不会丢掉一次递增。
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError: # Windows 没有 flock：只保证进程内互斥
+    fcntl = None
+
+class IndexGeneration:
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_suffix(".lock")
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        try:
+            return int(json.loads(self.path.read_text(encoding="utf-8"))["generation"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0
+
+    def bump(self) -> int:
+        with self._lock, self.lock_path.open("a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX) # 关闭文件时自动释放
+            gen = self.current() + 1
+            tmp = self.path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps({"generation": gen}), encoding="utf-8")
+            tmp.replace(self.path)
+            return gen
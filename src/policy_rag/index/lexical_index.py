@@ -0,0 +1,334 @@
+# 中文字符 n-gram 倒排索引 + BM25（混合检索里的词面通道）
+# 政策类问题经常依赖精确术语（“学分绩点”“第十二条”、具体奖项名称），bge-small-zh 的稠密检索有时召回不到，
+# 这里对连续汉字取 bigram + trigram、对英文/数字取整词，建一个和向量库并列的倒排索引。
+#
+# 磁盘布局：<persist_dir>/<collection>/
+#   postings.npz   CSR 形式的倒排表：term_ptr (V+1,) int64；post_rows 行号差分编码 uint32；post_tf 词频 uint16；doc_len uint32
+#   meta.json      ids / vocab（term 字符串，下标即 term id）/ doc_id、category 两列（where 过滤用）
+#
+# 每个 term 的 postings 按行号升序存放，第一个元素是绝对行号，其余是与前一个的差值；查询时对切片做一次 cumsum 即可还原
+from __future__ import annotations
+
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from policy_rag.config.settings import Settings
+
+_META_VERSION = 1
+
+_CJK_RUN = re.compile(r"[㐀-䶿一-鿿]+")
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+# BM25 参数（Lucene 默认值）
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+# where 过滤只支持这两列（build_where 只会生成它们）
+_FILTER_COLUMNS = ("doc_id", "category")
+
+def lexical_terms(text: str) -> list[str]:
+    """汉字连续片段取 bigram + trigram（单字片段保留单字），英文/数字按整词；统一做 NFKC + 小写。"""
+    s = unicodedata.normalize("NFKC", text or "").lower()
+    terms: list[str] = []
+    for m in _CJK_RUN.finditer(s):
+        run = m.group()
+        if len(run) == 1:
+            terms.append(run)
+            continue
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        terms.extend(run[i:i + 3] for i in range(len(run) - 2))
+    terms.extend(_WORD.findall(s))
+    return terms
+
+def _delta_encode(rows: np.ndarray, ptr: np.ndarray) -> np.ndarray:
+    # rows 在每个 term 段内升序；段首存绝对值，其余存差值
+    deltas = rows.astype(np.int64, copy=True)
+    if len(deltas):
+        deltas[1:] -= rows[:-1]
+        starts = ptr[:-1][ptr[:-1] < ptr[1:]]
+        deltas[starts] = rows[starts]
+    return deltas.astype(np.uint32)
+
+def _delta_decode(deltas: np.ndarray, ptr: np.ndarray) -> np.ndarray:
+    # 整体 cumsum 后减去每段起点之前的累计值，得到每段各自的绝对行号
+    c = np.cumsum(deltas, dtype=np.int64)
+    starts = ptr[:-1]
+    prev = np.zeros(len(starts), dtype=np.int64)
+    nz = starts > 0
+    prev[nz] = c[starts[nz] - 1]
+    return c - np.repeat(prev, np.diff(ptr))
+
+class LexicalIndex:
+    def __init__(self, persist_dir: Path, collection_name: str):
+        self.persist_dir = persist_dir
+        self.dir = persist_dir / collection_name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.postings_path = self.dir / "postings.npz"
+        self.meta_path = self.dir / "meta.json"
+
+        self._lock = threading.RLock()
+        self._loaded_mtime: float | None = None
+        self._reset_memory()
+        self._load()
+
+    # ---------- 内存结构 ----------
+
+    def _reset_memory(self) -> None:
+        self._ids: list[str] = []
+        self._id_to_row: dict[str, int] = {}
+        self._vocab: dict[str, int] = {}
+        self._cols: dict[str, list[Any]] = {k: [] for k in _FILTER_COLUMNS}
+        self._term_ptr = np.zeros(1, dtype=np.int64)
+        self._post_rows = np.empty(0, dtype=np.uint32)
+        self._post_tf = np.empty(0, dtype=np.uint16)
+        self._doc_len = np.empty(0, dtype=np.uint32)
+        self._avgdl = 0.0
+
+    def _load(self) -> None:
+        if not self.meta_path.exists() or not self.postings_path.exists():
+            return
+        mtime = self.meta_path.stat().st_mtime
+        obj = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        if obj.get("version") != _META_VERSION:
+            raise RuntimeError(f"Unsupported lexical index format in {self.meta_path}")
+
+        self._reset_memory()
+        self._ids = list(obj["ids"])
+        self._id_to_row = {cid: i for i, cid in enumerate(self._ids)}
+        self._vocab = {t: i for i, t in enumerate(obj["vocab"])}
+        for k in _FILTER_COLUMNS:
+            self._cols[k] = list((obj.get("columns") or {}).get(k) or [None] * len(self._ids))
+
+        with np.load(self.postings_path) as z:
+            self._term_ptr = z["term_ptr"]
+            self._post_rows = z["post_rows"]
+            self._post_tf = z["post_tf"]
+            self._doc_len = z["doc_len"]
+        self._avgdl = float(self._doc_len.mean()) if len(self._doc_len) else 0.0
+        self._loaded_mtime = mtime
+
+    def _maybe_reload(self) -> None:
+        # 另一个进程（CLI ingest）更新了索引时，API 进程下次读取前自动重新加载
+        try:
+            mtime = self.meta_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self._load()
+
+    def _save(self) -> None:
+        tmp_npz = self.dir / "postings.tmp.npz"
+        np.savez(
+            tmp_npz,
+            term_ptr=self._term_ptr,
+            post_rows=self._post_rows,
+            post_tf=self._post_tf,
+            doc_len=self._doc_len,
+        )
+        tmp_npz.replace(self.postings_path)
+
+        vocab = [""] * len(self._vocab)
+        for t, i in self._vocab.items():
+            vocab[i] = t
+        tmp_meta = self.meta_path.with_suffix(".json.tmp")
+        tmp_meta.write_text(
+            json.dumps(
+                {"version": _META_VERSION, "ids": self._ids, "vocab": vocab, "columns": self._cols},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ),
+            encoding="utf-8",
+        )
+        tmp_meta.replace(self.meta_path)
+        self._loaded_mtime = self.meta_path.stat().st_mtime
+
+    # ---------- 写入 ----------
+
+    def _rebuild(self, keep: np.ndarray, new_terms: np.ndarray, new_rows: np.ndarray, new_tf: np.ndarray) -> None:
+        """
+        保留 keep 为 True 的旧行（重新编号为 0..n_keep-1），追加本批新行的 postings，
+        然后整体按 (term, row) 排序重建 CSR；全部是向量化操作，不在 Python 里逐条遍历 postings。
+        """
+        n_terms = len(self._vocab)
+        lengths = np.diff(self._term_ptr)
+        old_terms = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        old_rows = _delta_decode(self._post_rows, self._term_ptr)
+        old_tf = self._post_tf
+
+        remap = np.cumsum(keep, dtype=np.int64) - 1
+        alive = keep[old_rows] if len(old_rows) else np.zeros(0, dtype=bool)
+
+        terms = np.concatenate([old_terms[alive], new_terms])
+        rows = np.concatenate([remap[old_rows[alive]], new_rows])
+        tf = np.concatenate([old_tf[alive], new_tf]).astype(np.uint16)
+
+        order = np.lexsort((rows, terms))
+        terms, rows, tf = terms[order], rows[order], tf[order]
+
+        ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=ptr[1:])
+        self._term_ptr = ptr
+        self._post_rows = _delta_encode(rows, ptr)
+        self._post_tf = tf
+
+    def upsert(self, ids: list[str], documents: list[str], metadatas: list[dict[str, Any]]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._maybe_reload()
+
+            # 同一批内重复 id 以最后一次为准
+            last: dict[str, int] = {}
+            for j, cid in enumerate(ids):
+                last[cid] = j
+            batch = sorted(last.values())
+
+            n_old = len(self._ids)
+            keep = np.ones(n_old, dtype=bool)
+            for cid in last:
+                r = self._id_to_row.get(cid)
+                if r is not None:
+                    keep[r] = False
+            kept_rows = np.nonzero(keep)[0]
+            base = len(kept_rows)
+
+            t_list: list[int] = []
+            r_list: list[int] = []
+            f_list: list[int] = []
+            new_lens: list[int] = []
+            for k, j in enumerate(batch):
+                counts = Counter(lexical_terms(documents[j]))
+                for term, tf in counts.items():
+                    t_list.append(self._vocab.setdefault(term, len(self._vocab)))
+                    r_list.append(base + k)
+                    f_list.append(min(tf, 65535))
+                new_lens.append(sum(counts.values()))
+
+            self._rebuild(
+                keep,
+                np.asarray(t_list, dtype=np.int64),
+                np.asarray(r_list, dtype=np.int64),
+                np.asarray(f_list, dtype=np.uint16),
+            )
+
+            self._ids = [self._ids[r] for r in kept_rows] + [ids[j] for j in batch]
+            self._id_to_row = {cid: i for i, cid in enumerate(self._ids)}
+            for key in _FILTER_COLUMNS:
+                col = self._cols[key]
+                self._cols[key] = [col[r] for r in kept_rows] + [(metadatas[j] or {}).get(key) for j in batch]
+            self._doc_len = np.concatenate(
+                [self._doc_len[kept_rows], np.asarray(new_lens, dtype=np.uint32)]
+            ).astype(np.uint32)
+            self._avgdl = float(self._doc_len.mean()) if len(self._doc_len) else 0.0
+            self._save()
+
+    def delete(self, where=None, ids=None) -> None:
+        with self._lock:
+            self._maybe_reload()
+            n = len(self._ids)
+            drop = np.zeros(n, dtype=bool)
+            for cid in ids or []:
+                r = self._id_to_row.get(cid)
+                if r is not None:
+                    drop[r] = True
+            if where:
+                drop |= self._mask(where)
+            if not drop.any():
+                return
+
+            keep = ~drop
+            kept_rows = np.nonzero(keep)[0]
+            self._rebuild(keep, np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.uint16))
+            self._ids = [self._ids[r] for r in kept_rows]
+            self._id_to_row = {cid: i for i, cid in enumerate(self._ids)}
+            self._cols = {k: [col[r] for r in kept_rows] for k, col in self._cols.items()}
+            self._doc_len = self._doc_len[kept_rows]
+            self._avgdl = float(self._doc_len.mean()) if len(self._doc_len) else 0.0
+            self._save()
+
+    # ---------- 查询 ----------
+
+    def _mask(self, where: dict[str, Any]) -> np.ndarray:
+        n = len(self._ids)
+        if "$and" in where:
+            m = np.ones(n, dtype=bool)
+            for w in where["$and"]:
+                m &= self._mask(w)
+            return m
+
+        m = np.ones(n, dtype=bool)
+        for key, cond in where.items():
+            if key not in self._cols:
+                raise ValueError(f"Unsupported where field for lexical index: {key}")
+            if isinstance(cond, dict):
+                if set(cond) == {"$in"}:
+                    allowed = set(cond["$in"])
+                    m &= np.fromiter((v in allowed for v in self._cols[key]), dtype=bool, count=n)
+                    continue
+                if set(cond) != {"$eq"}:
+                    raise ValueError(f"Unsupported where operator for lexical index: {list(cond)}")
+                cond = cond["$eq"]
+            m &= np.fromiter((v == cond for v in self._cols[key]), dtype=bool, count=n)
+        return m
+
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._ids)
+
+    def search(self, query: str, top_k: int = 50, where: Optional[dict[str, Any]] = None) -> list[tuple[str, float]]:
+        """BM25 打分，返回 [(chunk_id, score), ...]，按分数从高到低；只返回至少命中一个 term 的 chunk。"""
+        terms = set(lexical_terms(query))
+        with self._lock:
+            self._maybe_reload()
+            n = len(self._ids)
+            if n == 0 or not terms:
+                return []
+
+            scores = np.zeros(n, dtype=np.float32)
+            norm = _BM25_K1 * (1.0 - _BM25_B + _BM25_B * self._doc_len / max(self._avgdl, 1e-9))
+            for t in terms:
+                tid = self._vocab.get(t)
+                if tid is None:
+                    continue
+                s, e = int(self._term_ptr[tid]), int(self._term_ptr[tid + 1])
+                if s == e:
+                    continue
+                rows = np.cumsum(self._post_rows[s:e], dtype=np.int64)
+                tf = self._post_tf[s:e].astype(np.float32)
+                df = e - s
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                # 同一 term 的 rows 互不重复，可以直接 fancy-index 累加
+                scores[rows] += idf * tf * (_BM25_K1 + 1.0) / (tf + norm[rows])
+
+            if where:
+                scores[~self._mask(where)] = 0.0
+
+            cand = np.nonzero(scores > 0)[0]
+            if len(cand) == 0:
+                return []
+            k = min(int(top_k), len(cand))
+            part = cand[np.argpartition(-scores[cand], k - 1)[:k]] if k < len(cand) else cand
+            order = part[np.argsort(-scores[part], kind="stable")]
+            return [(self._ids[r], float(scores[r])) for r in order]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "docs": len(self._ids),
+                "terms": len(self._vocab),
+                "postings": int(len(self._post_rows)),
+                "postings_bytes": int(self._post_rows.nbytes + self._post_tf.nbytes + self._term_ptr.nbytes),
+                "avgdl": self._avgdl,
+            }
+
+def open_lexical_index(settings: Settings) -> LexicalIndex:
+    return LexicalIndex(persist_dir=settings.index_dir / "lexical", collection_name=settings.chroma_collection)
@@ -0,0 +1,550 @@
+# 纯 NumPy 的精确向量检索后端（VECTOR_STORE=numpy）
+# 语料规模在几万 chunk 量级时，一次 float32 矩阵乘 + argpartition 的精确 top-k
+# 比 Chroma 的 HNSW + SQLite 更快，也更容易部署（没有服务进程，只有几个文件）。
+#
+# 磁盘布局：<persist_dir>/<collection>/
+#   manifest.json   当前有效的段列表，以及每个段里已失效的行号（墓碑）；读者只认 manifest 里列出的段
+#   seg-<n>.npy     一个段的向量 (rows, dim) float32，读取时用 mmap 映射
+#   seg-<n>.json    同一个段的列式元数据：ids / documents / 每个 metadata 字段一列（低基数列做字典编码）
+#   store.lock      写入方之间的进程间互斥（fcntl.flock）
+#
+# 段文件写好之后不再修改：upsert 只把本批写成一个新段，被覆盖 / 删除的旧行在 manifest 里记墓碑，
+# 每个文档的写入量与已有语料规模无关。段文件先落盘、manifest 最后原子替换，读者看到的向量与列永远配套。
+# 新段不比前一个段小时两者合并（段数保持在 log 级别，每行只被重写 O(log N) 次）；墓碑过多时整体重写一次。
+# 旧版本的 vectors.npy + columns.json 当作一个段读入，之后第一次写入时并入 manifest。
+#
+# 距离与 Chroma 默认的 "l2" 空间一致（平方欧氏距离），证据门控阈值无需重新标定
+from __future__ import annotations
+
+import bisect
+import json
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # Windows 没有 flock：只保证进程内互斥
+    fcntl = None
+
+from policy_rag.index.base import as_f32_matrix
+from policy_rag.index.generation import IndexGeneration
+
+_COLUMNS_VERSION = 1
+_MANIFEST_VERSION = 2
+# 墓碑占全部行的比例超过它时，把所有存活行重写成一个段
+_COMPACT_DEAD_RATIO = 0.3
+# 读 manifest 与读段文件之间，另一个进程的合并可能刚删掉旧段：重新读 manifest 再试
+_LOAD_RETRIES = 3
+
+@dataclass
+class _Segment:
+    name: str
+    vectors: str # 文件名（相对 collection 目录）
+    columns: str
+    ids: list[str]
+    docs: list[str]
+    cols: dict[str, list[Any]]
+    vecs: np.ndarray
+    sqnorms: np.ndarray = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.sqnorms = np.einsum("ij,ij->i", self.vecs, self.vecs).astype(np.float32)
+
+    @property
+    def rows(self) -> int:
+        return len(self.ids)
+
+def _encode_columns(cols: dict[str, list[Any]], n: int) -> dict[str, Any]:
+    out: dict[str, Any] = {}
+    for key, col in cols.items():
+        vocab: dict[Any, int] = {}
+        codes: list[int] = []
+        for v in col:
+            if v is None:
+                codes.append(-1)
+                continue
+            codes.append(vocab.setdefault(v, len(vocab)))
+        # 低基数列（doc_id/category/title/...）做字典编码，高基数列（char_start 等）直接存
+        if len(vocab) <= max(1, n // 2):
+            out[key] = {"values": list(vocab.keys()), "codes": codes}
+        else:
+            out[key] = col
+    return out
+
+def _decode_columns(columns: dict[str, Any]) -> dict[str, list[Any]]:
+    out: dict[str, list[Any]] = {}
+    for key, col in columns.items():
+        if isinstance(col, dict):
+            vocab = col["values"]
+            out[key] = [vocab[c] if c >= 0 else None for c in col["codes"]]
+        else:
+            out[key] = list(col)
+    return out
+
+class NumpyStore:
+    def __init__(self, persist_dir: Path, collection_name: str):
+        self.persist_dir = persist_dir
+        self.dir = persist_dir / collection_name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.dir / "manifest.json"
+        self.lock_path = self.dir / "store.lock"
+        # 旧版本的单文件布局
+        self.legacy_vectors_path = self.dir / "vectors.npy"
+        self.legacy_columns_path = self.dir / "columns.json"
+        self._generation = IndexGeneration(persist_dir / f"{collection_name}.generation.json")
+
+        self._lock = threading.RLock()
+        self._loaded_stat: Optional[tuple[int, int, int]] = None
+        self._segments: list[_Segment] = []
+        self._dead: dict[str, set[int]] = {}
+        self._next_seg = 1
+        self._reset_memory()
+        self._load()
+
+    # ---------- 内存结构 ----------
+
+    def _reset_memory(self) -> None:
+        # 所有段按顺序拼接后的行视图；失效行留在原位，由 _live 标记
+        self._ids: list[str] = []
+        self._docs: list[str] = []
+        self._cols: dict[str, list[Any]] = {}
+        self._live: np.ndarray = np.zeros(0, dtype=bool)
+        self._offsets: list[int] = [] # 每个段第一行的行号
+        self._id_to_row: dict[str, int] = {} # 只含存活行
+        # 拼接后的向量矩阵与平方范数：数据变更后第一次查询时再拼（只有一个段时直接用它的 mmap）
+        self._mat: Optional[np.ndarray] = None
+        self._mat_sqnorms: Optional[np.ndarray] = None
+        # where 过滤用的列编码缓存：key -> (codes, value->code)，数据变更时清空
+        self._code_cache: dict[str, tuple[np.ndarray, dict[Any, int]]] = {}
+
+    def _append_rows(self, seg: _Segment, dead: set[int]) -> None:
+        base = len(self._ids)
+        self._offsets.append(base)
+        self._ids.extend(seg.ids)
+        self._docs.extend(seg.docs)
+        for key, col in self._cols.items():
+            col.extend(seg.cols.get(key) or [None] * seg.rows)
+        for key, col in seg.cols.items():
+            if key not in self._cols:
+                self._cols[key] = [None] * base + list(col)
+        live = np.ones(seg.rows, dtype=bool)
+        if dead:
+            live[sorted(dead)] = False
+        self._live = np.concatenate([self._live, live])
+        for i, cid in enumerate(seg.ids):
+            if live[i]:
+                self._id_to_row[cid] = base + i
+        self._invalidate()
+
+    def _truncate_rows(self, n_segments: int) -> None:
+        """丢掉第 n_segments 个段及之后的所有行（合并尾部段之前调用）。"""
+        row = self._offsets[n_segments] if n_segments < len(self._offsets) else len(self._ids)
+        for cid in self._ids[row:]:
+            if self._id_to_row.get(cid, -1) >= row:
+                del self._id_to_row[cid]
+        del self._ids[row:]
+        del self._docs[row:]
+        for col in self._cols.values():
+            del col[row:]
+        self._live = self._live[:row].copy()
+        del self._offsets[n_segments:]
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        self._mat = None
+        self._mat_sqnorms = None
+        self._code_cache.clear()
+
+    def _matrix(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._mat is None:
+            if not self._segments:
+                self._mat, self._mat_sqnorms = np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.float32)
+            elif len(self._segments) == 1:
+                self._mat, self._mat_sqnorms = self._segments[0].vecs, self._segments[0].sqnorms
+            else:
+                self._mat = np.concatenate([s.vecs for s in self._segments], axis=0)
+                self._mat_sqnorms = np.concatenate([s.sqnorms for s in self._segments])
+        return self._mat, self._mat_sqnorms
+
+    def _dim(self) -> Optional[int]:
+        return int(self._segments[0].vecs.shape[1]) if self._segments else None
+
+    def _kill(self, row: int) -> None:
+        self._live[row] = False
+        del self._id_to_row[self._ids[row]]
+        si = bisect.bisect_right(self._offsets, row) - 1
+        seg = self._segments[si]
+        self._dead[seg.name].add(row - self._offsets[si])
+
+    # ---------- 持久化 ----------
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """写入方之间的进程间排他锁；调用方必须已持有 self._lock。"""
+        if fcntl is None:
+            yield
+            return
+        with self.lock_path.open("a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX) # 关闭文件时自动释放
+            yield
+
+    def _stat(self) -> Optional[tuple[int, int, int]]:
+        path = self.manifest_path if self.manifest_path.exists() else self.legacy_columns_path
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_manifest(self) -> Optional[dict[str, Any]]:
+        if self.manifest_path.exists():
+            obj = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            if obj.get("version") != _MANIFEST_VERSION:
+                raise RuntimeError(f"Unsupported numpy store format in {self.manifest_path}")
+            return obj
+        if self.legacy_columns_path.exists() and self.legacy_vectors_path.exists():
+            legacy = {"name": "legacy", "vectors": self.legacy_vectors_path.name, "columns": self.legacy_columns_path.name}
+            return {"version": _MANIFEST_VERSION, "next": 1, "segments": [legacy]}
+        return None
+
+    def _read_segment(self, entry: dict[str, Any]) -> _Segment:
+        obj = json.loads((self.dir / entry["columns"]).read_text(encoding="utf-8"))
+        if obj.get("version") != _COLUMNS_VERSION:
+            raise RuntimeError(f"Unsupported numpy store segment format in {self.dir / entry['columns']}")
+        vecs = np.load(self.dir / entry["vectors"], mmap_mode="r")
+        return _Segment(
+            name=entry["name"],
+            vectors=entry["vectors"],
+            columns=entry["columns"],
+            ids=list(obj["ids"]),
+            docs=list(obj["documents"]),
+            cols=_decode_columns(obj.get("columns") or {}),
+            vecs=vecs,
+        )
+
+    def _load(self) -> None:
+        for attempt in range(_LOAD_RETRIES):
+            try:
+                self._load_once()
+                return
+            except FileNotFoundError:
+                if attempt == _LOAD_RETRIES - 1:
+                    raise
+
+    def _load_once(self) -> None:
+        stat = self._stat()
+        manifest = self._read_manifest()
+        if manifest is None:
+            return
+
+        # 段文件不可变：已经读过的段直接复用，只读新出现的段
+        known = {s.name: s for s in self._segments}
+        segments = [known.get(e["name"]) or self._read_segment(e) for e in manifest["segments"]]
+
+        self._segments = segments
+        self._dead = {e["name"]: set(e.get("dead") or []) for e in manifest["segments"]}
+        self._next_seg = int(manifest.get("next", 1))
+        self._reset_memory()
+        for seg in segments:
+            self._append_rows(seg, self._dead[seg.name])
+        self._loaded_stat = stat
+
+    def _maybe_reload(self) -> None:
+        # 另一个进程（例如 CLI ingest）更新了索引时，API 进程下次读取前自动重新加载
+        stat = self._stat()
+        if stat is not None and stat != self._loaded_stat:
+            self._load()
+
+    def _write_segment(self, ids: list[str], docs: list[str], cols: dict[str, list[Any]], vecs: np.ndarray) -> _Segment:
+        name = f"seg-{self._next_seg:06d}"
+        self._next_seg += 1
+        seg = _Segment(
+            name=name,
+            vectors=f"{name}.npy",
+            columns=f"{name}.json",
+            ids=ids,
+            docs=docs,
+            cols=cols,
+            vecs=np.ascontiguousarray(vecs, dtype=np.float32),
+        )
+        # 先写临时文件再改名：进程中途退出时不会留下半截的段（没进 manifest 的段不会被读到）
+        tmp_vec = self.dir / f"{name}.tmp.npy"
+        np.save(tmp_vec, seg.vecs)
+        tmp_vec.replace(self.dir / seg.vectors)
+
+        tmp_cols = self.dir / f"{name}.json.tmp"
+        tmp_cols.write_text(
+            json.dumps(
+                {"version": _COLUMNS_VERSION, "ids": ids, "documents": docs, "columns": _encode_columns(cols, len(ids))},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ),
+            encoding="utf-8",
+        )
+        tmp_cols.replace(self.dir / seg.columns)
+        return seg
+
+    def _write_manifest(self) -> None:
+        obj = {
+            "version": _MANIFEST_VERSION,
+            "next": self._next_seg,
+            "segments": [
+                {
+                    "name": s.name,
+                    "vectors": s.vectors,
+                    "columns": s.columns,
+                    "rows": s.rows,
+                    "dead": sorted(self._dead.get(s.name, ())),
+                }
+                for s in self._segments
+            ],
+        }
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(obj, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.manifest_path)
+        self._loaded_stat = self._stat()
+
+    def _merge_tail(self, start: int) -> list[_Segment]:
+        """把 segments[start:] 的存活行重写成一个段（start=0 即整体重写），返回被替换掉的旧段。"""
+        old = self._segments[start:]
+        parts: list[tuple[_Segment, np.ndarray]] = []
+        for s in old:
+            alive = np.ones(s.rows, dtype=bool)
+            dead = self._dead.get(s.name)
+            if dead:
+                alive[sorted(dead)] = False
+            if alive.any():
+                parts.append((s, np.nonzero(alive)[0]))
+
+        self._truncate_rows(start)
+        del self._segments[start:]
+        for s in old:
+            self._dead.pop(s.name, None)
+        if parts:
+            keys = {k for s, _ in parts for k in s.cols}
+            merged = self._write_segment(
+                ids=[s.ids[i] for s, keep in parts for i in keep],
+                docs=[s.docs[i] for s, keep in parts for i in keep],
+                cols={k: [(s.cols.get(k) or [None] * s.rows)[i] for s, keep in parts for i in keep] for k in keys},
+                vecs=np.concatenate([s.vecs[keep] for s, keep in parts], axis=0),
+            )
+            self._segments.append(merged)
+            self._dead[merged.name] = set()
+            self._append_rows(merged, set())
+        return old
+
+    def _compact_locked(self) -> list[_Segment]:
+        total = len(self._ids)
+        if total and total - len(self._id_to_row) > _COMPACT_DEAD_RATIO * total:
+            return self._merge_tail(0)
+        # 二进制计数式合并：最新的段不比前一个段小时合并二者，直到前一个段明显更大
+        start = len(self._segments) - 1
+        while start > 0 and self._segments[start - 1].rows <= sum(s.rows for s in self._segments[start:]):
+            start -= 1
+        if start < len(self._segments) - 1:
+            return self._merge_tail(start)
+        return []
+
+    def _commit_locked(self) -> None:
+        replaced = self._compact_locked()
+        self._write_manifest()
+        # 新 manifest 生效后再删旧段：正在读旧 manifest 的进程找不到文件时会重新读 manifest
+        for s in replaced:
+            for fname in (s.vectors, s.columns):
+                (self.dir / fname).unlink(missing_ok=True)
+
+    # ---------- where 过滤 ----------
+
+    def _codes(self, key: str) -> tuple[np.ndarray, dict[Any, int]]:
+        cached = self._code_cache.get(key)
+        if cached is not None:
+            return cached
+        col = self._cols.get(key) or [None] * len(self._ids)
+        vocab: dict[Any, int] = {}
+        codes = np.fromiter(
+            (vocab.setdefault(v, len(vocab)) if v is not None else -1 for v in col),
+            dtype=np.int32,
+            count=len(col),
+        )
+        self._code_cache[key] = (codes, vocab)
+        return codes, vocab
+
+    def _mask(self, where: dict[str, Any]) -> np.ndarray:
+        n = len(self._ids)
+        if "$and" in where:
+            m = np.ones(n, dtype=bool)
+            for w in where["$and"]:
+                m &= self._mask(w)
+            return m
+        if "$or" in where:
+            m = np.zeros(n, dtype=bool)
+            for w in where["$or"]:
+                m |= self._mask(w)
+            return m
+
+        m = np.ones(n, dtype=bool)
+        for key, cond in where.items():
+            codes, vocab = self._codes(key)
+            if isinstance(cond, dict):
+                for op, val in cond.items():
+                    if op == "$eq":
+                        m &= codes == vocab.get(val, -2)
+                    elif op == "$ne":
+                        m &= codes != vocab.get(val, -2)
+                    elif op == "$in":
+                        m &= np.isin(codes, [vocab[v] for v in val if v in vocab])
+                    elif op == "$nin":
+                        m &= ~np.isin(codes, [vocab[v] for v in val if v in vocab])
+                    else:
+                        raise ValueError(f"Unsupported where operator for numpy store: {op}")
+            else:
+                m &= codes == vocab.get(cond, -2)
+        return m
+
+    def _rows(self, where: Optional[dict[str, Any]]) -> Optional[np.ndarray]:
+        """满足 where 的存活行号；没有过滤条件且没有失效行时返回 None（全部行）。"""
+        if not where:
+            return None if len(self._id_to_row) == len(self._ids) else np.nonzero(self._live)[0]
+        return np.nonzero(self._mask(where) & self._live)[0]
+
+    def _row_meta(self, i: int) -> dict[str, Any]:
+        return {k: col[i] for k, col in self._cols.items() if col[i] is not None}
+
+    # ---------- VectorStore 协议 ----------
+
+    def upsert(
+        self,
+        ids: list[str],
+        documents: list[str],
+        embeddings: np.ndarray | list[list[float]],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        emb = as_f32_matrix(embeddings)
+        if emb.shape[0] != len(ids):
+            raise ValueError(f"embeddings rows ({emb.shape[0]}) != ids ({len(ids)})")
+        if not ids:
+            return
+
+        with self._lock, self._file_lock():
+            self._maybe_reload()
+            dim = self._dim()
+            if dim is not None and emb.shape[1] != dim:
+                raise ValueError(f"Embedding dim mismatch: store={dim} new={emb.shape[1]}")
+
+            # 同一批内重复 id 以最后一次为准；已有的 id 把旧行记为失效，新内容写进本批的段
+            last = {cid: j for j, cid in enumerate(ids)}
+            order = sorted(last.values())
+            for j in order:
+                row = self._id_to_row.get(ids[j])
+                if row is not None:
+                    self._kill(row)
+
+            mds = [metadatas[j] or {} for j in order]
+            keys = {k for md in mds for k in md}
+            seg = self._write_segment(
+                ids=[ids[j] for j in order],
+                docs=[documents[j] for j in order],
+                cols={k: [md.get(k) for md in mds] for k in keys},
+                vecs=emb[order],
+            )
+            self._segments.append(seg)
+            self._dead[seg.name] = set()
+            self._append_rows(seg, set())
+            self._commit_locked()
+        self._generation.bump()
+
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._id_to_row)
+
+    def query(
+        self,
+        query_embeddings: np.ndarray | list[list[float]],
+        n_results: int,
+        where: Optional[dict[str, Any]] = None,
+    ) -> dict[str, Any]:
+        q = as_f32_matrix(query_embeddings)
+        with self._lock:
+            self._maybe_reload()
+            return self._query_locked(q, int(n_results), where)
+
+    def _query_locked(self, q: np.ndarray, n_results: int, where: Optional[dict[str, Any]]) -> dict[str, Any]:
+        idx = self._rows(where)
+
+        out: dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        m = len(self._ids) if idx is None else len(idx)
+        k = min(n_results, m)
+        if k <= 0:
+            for key in out:
+                out[key] = [[] for _ in range(len(q))]
+            return out
+
+        vecs, sqnorms = self._matrix()
+        x = vecs if idx is None else vecs[idx]
+        xn = sqnorms if idx is None else sqnorms[idx]
+
+        # 平方欧氏距离：|q|^2 + |x|^2 - 2 q·x，一次矩阵乘算完所有 query
+        d = np.einsum("ij,ij->i", q, q)[:, None] + xn[None, :] - 2.0 * (q @ x.T)
+        np.maximum(d, 0.0, out=d)
+
+        # argpartition 只保证前 k 个是最小的 k 个（无序），再对这 k 个排序
+        part = np.argpartition(d, k - 1, axis=1)[:, :k] if k < m else np.tile(np.arange(m), (len(q), 1))
+        for qi in range(len(q)):
+            cand = part[qi]
+            order = cand[np.argsort(d[qi, cand], kind="stable")]
+            rows = order if idx is None else idx[order]
+            out["ids"].append([self._ids[r] for r in rows])
+            out["documents"].append([self._docs[r] for r in rows])
+            out["metadatas"].append([self._row_meta(r) for r in rows])
+            out["distances"].append([float(v) for v in d[qi, order]])
+        return out
+
+    def get(
+        self,
+        where: dict[str, Any] | None = None,
+        limit: int = 1000,
+        ids: list[str] | None = None,
+    ) -> dict[str, Any]:
+        with self._lock:
+            self._maybe_reload()
+            rows = self._rows(where)
+            if rows is None:
+                rows = np.arange(len(self._ids))
+            if ids is not None:
+                wanted = np.zeros(len(self._ids), dtype=bool)
+                wanted[[r for r in (self._id_to_row.get(cid) for cid in ids) if r is not None]] = True
+                rows = rows[wanted[rows]]
+            rows = rows[:limit] if limit else rows
+            return {
+                "ids": [self._ids[r] for r in rows],
+                "documents": [self._docs[r] for r in rows],
+                "metadatas": [self._row_meta(r) for r in rows],
+            }
+
+    def delete(self, where=None, ids=None) -> None:
+        with self._lock, self._file_lock():
+            self._maybe_reload()
+            drop = np.zeros(len(self._ids), dtype=bool)
+            if ids:
+                for cid in ids:
+                    r = self._id_to_row.get(cid)
+                    if r is not None:
+                        drop[r] = True
+            if where:
+                drop |= self._mask(where) & self._live
+            if not drop.any():
+                return
+
+            for r in np.nonzero(drop)[0]:
+                self._kill(int(r))
+            self._commit_locked()
+        self._generation.bump()
+
+    def generation(self) -> int:
+        return self._generation.current()
@@ -0,0 +1,192 @@
+# 持久化的答案缓存（/chat 与 ask 共用）：同一个问题在同一份索引、同一套 prompt 和模型下直接复用上次的回答，
+# 跳过检索和几秒钟的 LLM 生成。
+#
+# key = sha256(端点, normalize_query(问题), 过滤条件, top_k, 模型, prompt 版本, 索引代数, 其它影响输出的参数)
+# - 索引代数（VectorStore.generation()）在每次 upsert / delete 后 +1，索引一变旧 key 就不会再被查到
+# - 条目记录了回答引用到的 doc_id，重新 ingest 某个文档时 invalidate_doc 立刻删掉相关条目（不用等 TTL / LRU）
+#
+# 存储：SQLite 单文件（标准库自带，多进程读写安全），默认 data/index/answer_cache.sqlite
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from policy_rag.config.settings import Settings
+from policy_rag.llm.embedding_cache import normalize_query
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key        TEXT PRIMARY KEY,
+    payload    TEXT NOT NULL,
+    created    REAL NOT NULL,
+    last_used  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used);
+CREATE TABLE IF NOT EXISTS answer_docs (
+    key     TEXT NOT NULL,
+    doc_id  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answer_docs_doc ON answer_docs(doc_id);
+CREATE INDEX IF NOT EXISTS answer_docs_key ON answer_docs(key);
+"""
+
+def answer_scope_key(
+    *,
+    endpoint: str,
+    where: Optional[dict[str, Any]],
+    top_k: int,
+    model: str,
+    prompt_version: str,
+    generation: int,
+    params: Optional[dict[str, Any]] = None,
+    query: Optional[str] = None,
+) -> str:
+    """不含问题本身时（query=None）是语义缓存的 scope：只有 scope 相同的问题之间才能互相复用回答。"""
+    raw = json.dumps(
+        {
+            "endpoint": endpoint,
+            "query": normalize_query(query) if query is not None else None,
+            "where": where,
+            "top_k": int(top_k),
+            "model": model,
+            "prompt_version": prompt_version,
+            "generation": int(generation),
+            "params": params or {},
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def answer_cache_key(*, query: str, **scope: Any) -> str:
+    return answer_scope_key(query=query, **scope)
+
+class AnswerCache:
+    def __init__(self, path: Path, max_entries: int = 5000, ttl_s: float = 86400.0):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidated = 0
+
+        # FastAPI 的同步路由跑在线程池里：共用一个连接，用锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, created = row
+            if self.ttl_s > 0 and now - created > self.ttl_s:
+                self._delete_keys([key])
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, key: str, payload: dict[str, Any], doc_ids: Iterable[str] = ()) -> None:
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            self._delete_keys([key])
+            self._conn.execute(
+                "INSERT INTO answers(key, payload, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO answer_docs(key, doc_id) VALUES (?, ?)",
+                [(key, did) for did in sorted({str(d) for d in doc_ids if d})],
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def invalidate_doc(self, doc_id: str) -> int:
+        """删除引用了 doc_id 的所有条目（重新 ingest / 删除文档时调用），返回删除条数。"""
+        with self._lock:
+            keys = [k for (k,) in self._conn.execute("SELECT DISTINCT key FROM answer_docs WHERE doc_id = ?", (doc_id,))]
+            self._delete_keys(keys)
+            self._conn.commit()
+            self.invalidated += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.execute("DELETE FROM answer_docs")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _delete_keys(self, keys: list[str]) -> None:
+        if not keys:
+            return
+        rows = [(k,) for k in keys]
+        self._conn.executemany("DELETE FROM answers WHERE key = ?", rows)
+        self._conn.executemany("DELETE FROM answer_docs WHERE key = ?", rows)
+
+    def _evict_locked(self) -> None:
+        (n,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if n <= self.max_entries:
+            return
+        # 先清掉过期条目，仍然超出上限再按 last_used 淘汰最久未用的
+        if self.ttl_s > 0:
+            old = [k for (k,) in self._conn.execute("SELECT key FROM answers WHERE created < ?", (time.time() - self.ttl_s,))]
+            self._delete_keys(old)
+            self.expired += len(old)
+            n -= len(old)
+        excess = n - self.max_entries
+        if excess > 0:
+            lru = [k for (k,) in self._conn.execute("SELECT key FROM answers ORDER BY last_used LIMIT ?", (excess,))]
+            self._delete_keys(lru)
+            self.evictions += len(lru)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidated": self.invalidated,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+def open_answer_cache(settings: Settings) -> AnswerCache | None:
+    if not settings.answer_cache_enabled:
+        return None
+    return AnswerCache(
+        path=settings.answer_cache_path,
+        max_entries=settings.answer_cache_max_entries,
+        ttl_s=settings.answer_cache_ttl_s,
+    )
@@ -0,0 +1,465 @@
+# API 用的 asyncio 版 Ollama 客户端 + 生成并发的准入控制
+# 本机 Ollama 同时只能较好地跑一两个生成；同步客户端下多出来的请求会各占一个线程池 worker 阻塞几分钟，
+# 连 /health 都排不上队。这里：
+# - 同时在跑的生成数由信号量限制（OLLAMA_MAX_IN_FLIGHT），其余请求在事件循环里排队，不占线程
+# - 排队人数超过 OLLAMA_MAX_QUEUE 立即 429；排队超过 OLLAMA_QUEUE_TIMEOUT_S（或请求期限）返回 503
+# - 每个请求带一个绝对期限（time.monotonic()），排队 + 生成共用；超时或客户端断开时取消任务并关掉连接，
+#   Ollama 发现连接断开后会停止这次生成
+# HTTP/1.1 直接基于 asyncio streams 实现（只需要 POST JSON + 定长 / chunked 响应），不引入额外依赖。
+# 补全缓存（completion_cache.py）在准入之前查：命中的请求不排队、不占生成名额。
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+from policy_rag.config.settings import Settings
+from policy_rag.llm.completion_cache import CompletionCache, open_completion_cache
+from policy_rag.llm.llm_client import ChatMessage, _OllamaChatBase
+
+class LLMBusyError(RuntimeError):
+    """准入被拒绝：status_code 为 429（队列已满）或 503（排队超时），retry_after_s 供 Retry-After 头使用。"""
+
+    def __init__(self, status_code: int, detail: str, retry_after_s: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after_s = retry_after_s
+
+class LLMDeadlineError(TimeoutError):
+    """生成阶段超过了调用方给的请求期限（已取消并断开与 Ollama 的连接）。"""
+
+class LLMReadTimeoutError(TimeoutError):
+    """Ollama 连续 read_timeout 秒没有发来任何数据（单次读取的空闲超时，与请求期限无关）。"""
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 2, max_queue: int = 16, queue_timeout_s: float = 30.0):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout_s = float(queue_timeout_s)
+        self._sem = asyncio.Semaphore(self.max_in_flight)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self._waits_ms: deque[float] = deque(maxlen=1024)
+        self._service_s = 0.0 # 单次生成耗时的指数滑动平均，用来估算 Retry-After
+
+    def _retry_after(self) -> int:
+        per_slot = self._service_s or self.queue_timeout_s
+        return max(1, math.ceil(per_slot * (self.waiting + 1) / self.max_in_flight))
+
+    async def acquire(self, deadline: Optional[float] = None) -> float:
+        """拿到一个生成名额，返回准入时刻（交给 release 统计服务耗时）。"""
+        t0 = time.monotonic()
+        if not self._sem.locked():
+            # 有空闲名额：Semaphore.acquire 不会挂起，直接拿到
+            await self._sem.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected_full += 1
+                raise LLMBusyError(429, f"LLM queue is full ({self.waiting} waiting)", self._retry_after())
+
+            timeout = self.queue_timeout_s
+            rem = _remaining(deadline)
+            if rem is not None:
+                timeout = min(timeout, rem)
+
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=max(0.0, timeout))
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise LLMBusyError(503, f"No free LLM slot within {timeout:.1f}s", self._retry_after()) from None
+            finally:
+                self.waiting -= 1
+
+        now = time.monotonic()
+        self._waits_ms.append((now - t0) * 1000)
+        self.in_flight += 1
+        self.admitted += 1
+        return now
+
+    def release(self, t_admit: Optional[float] = None) -> None:
+        if t_admit is not None:
+            dt = time.monotonic() - t_admit
+            self._service_s = dt if not self._service_s else 0.8 * self._service_s + 0.2 * dt
+        self.in_flight -= 1
+        self._sem.release()
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        t_admit = await self.acquire(deadline)
+        try:
+            yield
+        finally:
+            self.release(t_admit)
+
+    def stats(self) -> dict[str, Any]:
+        waits = sorted(self._waits_ms)
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_queue_timeout": self.rejected_timeout,
+            "mean_wait_ms": (sum(waits) / len(waits)) if waits else 0.0,
+            "p95_wait_ms": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+            "mean_service_s": self._service_s,
+        }
+
+class AdmittedStream:
+    """chat_stream 的返回值：异步迭代增量文本；还没开始迭代就 aclose() 时也会归还名额。"""
+
+    def __init__(self, gen: AsyncIterator[str], on_unstarted_close):
+        self._gen = gen
+        self._on_unstarted_close = on_unstarted_close
+        self._started = False
+        self._closed = False
+
+    def __aiter__(self) -> AdmittedStream:
+        return self
+
+    async def __anext__(self) -> str:
+        if self._closed:
+            raise StopAsyncIteration
+        self._started = True
+        return await self._gen.__anext__()
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._started:
+            await self._gen.aclose() # 生成器自己的 finally 会断开连接并归还名额
+        else:
+            self._on_unstarted_close()
+
+class _AsyncConn:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self) -> None:
+        self.writer.close()
+
+class AsyncOllamaClient(_OllamaChatBase):
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        temperature: float = 0.2,
+        num_predict: int = 800,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 240.0,
+        max_in_flight: int = 2,
+        max_queue: int = 16,
+        queue_timeout_s: float = 30.0,
+        num_ctx: Optional[int] = None,
+        keep_alive: Optional[str] = None,
+        completions: Optional[CompletionCache] = None,
+    ):
+        super().__init__(base_url, model, temperature, num_predict, num_ctx, keep_alive, completions)
+        parts = urlsplit(self.base_url)
+        self._ssl = parts.scheme == "https"
+        self._host = parts.hostname or "localhost"
+        self._port = parts.port or (443 if self._ssl else 80)
+        self.connect_timeout = float(connect_timeout)
+        self.read_timeout = float(read_timeout)
+        self.admission = AdmissionController(max_in_flight, max_queue, queue_timeout_s)
+
+        # 在跑的生成数已被准入控制限住，空闲连接最多保留 max_in_flight 条
+        self._idle: list[_AsyncConn] = []
+        self.created = 0
+        self.reused = 0
+        self.cancelled = 0
+        self.deadline_exceeded = 0
+        self.read_timeouts = 0
+
+    async def chat(
+        self,
+        messages: list[ChatMessage],
+        response_format=None,
+        deadline: Optional[float] = None,
+        endpoint: str = "default",
+        use_cache: bool = True,
+    ) -> str:
+        """
+        deadline 为 time.monotonic() 下的绝对时间；排队与生成都受它约束。
+        endpoint 只用于补全缓存按调用方分别统计命中；use_cache=False 绕过补全缓存。
+        """
+        payload = self._chat_payload(messages, response_format, stream=False)
+        key = self._completion_key(payload, use_cache)
+        if key is not None:
+            hit = await asyncio.to_thread(self.completions.get, key, endpoint)
+            if hit is not None:
+                return hit
+
+        body = self._encode(payload)
+        try:
+            async with self.admission.slot(deadline):
+                raw = await self._with_deadline(self._request(body), deadline)
+        except asyncio.CancelledError:
+            # 客户端断开：取消会一路传到正在读的 socket，连接随之关闭，Ollama 随后停止生成
+            self.cancelled += 1
+            raise
+        obj = json.loads(raw.decode("utf-8"))
+        content = str((obj.get("message") or {}).get("content", ""))
+        if key is not None and content:
+            await asyncio.to_thread(self.completions.put, key, content, endpoint)
+        return content
+
+    async def chat_stream(
+        self,
+        messages: list[ChatMessage],
+        response_format=None,
+        deadline: Optional[float] = None,
+        endpoint: str = "default",
+        use_cache: bool = True,
+    ) -> AdmittedStream:
+        """
+        先完成准入（被拒绝时在这里直接抛 LLMBusyError，调用方还能返回正常的 HTTP 状态码），
+        再返回逐条产出增量文本的异步迭代器。调用方必须把它迭代完或 aclose()，名额才会释放。
+        补全缓存命中时不经过准入，整段输出作为一条增量返回。
+        """
+        payload = self._chat_payload(messages, response_format, stream=True)
+        key = self._completion_key(payload, use_cache)
+        if key is not None:
+            hit = await asyncio.to_thread(self.completions.get, key, endpoint)
+            if hit is not None:
+                return AdmittedStream(self._replay(hit), on_unstarted_close=lambda: None)
+
+        body = self._encode(payload)
+        t_admit = await self.admission.acquire(deadline)
+        return AdmittedStream(
+            self._stream_admitted(body, deadline, t_admit, key, endpoint),
+            on_unstarted_close=lambda: self.admission.release(t_admit),
+        )
+
+    @staticmethod
+    async def _replay(text: str) -> AsyncIterator[str]:
+        yield text
+
+    async def _stream_admitted(
+        self,
+        body: bytes,
+        deadline: Optional[float],
+        t_admit: float,
+        key: Optional[str] = None,
+        endpoint: str = "default",
+    ) -> AsyncIterator[str]:
+        conn: Optional[_AsyncConn] = None
+        ok = False
+        parts: list[str] = []
+        try:
+            conn, status, headers = await self._with_deadline(self._open(body), deadline)
+            body_iter = self._iter_body(conn, headers)
+            if status != 200:
+                raw = b"".join([c async for c in body_iter])
+                raise RuntimeError(f"Ollama stream failed: HTTP {status}: {raw[:500].decode('utf-8', 'replace')}")
+
+            buf = b""
+            done = False
+            while not done:
+                chunk = await self._with_deadline(anext(body_iter, b""), deadline)
+                if not chunk:
+                    break
+                buf += chunk
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    obj = json.loads(line)
+                    if obj.get("error"):
+                        raise RuntimeError(f"Ollama stream failed: {obj['error']}")
+                    delta = str((obj.get("message") or {}).get("content", ""))
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+                    if obj.get("done"):
+                        done = True
+            if done:
+                async for _ in body_iter: # 读掉 chunked 结尾，连接才能复用
+                    pass
+                ok = self._reusable(headers)
+                if key is not None and parts:
+                    await asyncio.to_thread(self.completions.put, key, "".join(parts), endpoint)
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+        finally:
+            if conn is not None:
+                self._release(conn, ok)
+            self.admission.release(t_admit)
+
+    @staticmethod
+    def _encode(payload: dict[str, Any]) -> bytes:
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    async def _with_deadline(self, aw, deadline: Optional[float]):
+        """只施加调用方的请求期限；每次读 socket 的空闲超时由 _read 单独负责。"""
+        rem = _remaining(deadline)
+        if rem is None:
+            return await aw
+        try:
+            return await asyncio.wait_for(aw, timeout=max(0.0, rem))
+        except LLMReadTimeoutError:
+            raise
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            raise LLMDeadlineError("LLM generation exceeded the request deadline") from None
+
+    async def _read(self, aw):
+        """单次读取的空闲超时：Ollama 在 read_timeout 秒内一个字节都没发来才算超时，生成再久也不受限。"""
+        try:
+            return await asyncio.wait_for(aw, timeout=self.read_timeout)
+        except asyncio.TimeoutError:
+            self.read_timeouts += 1
+            raise LLMReadTimeoutError(
+                f"Ollama sent no data for {self.read_timeout:g}s (OLLAMA_READ_TIMEOUT_S)"
+            ) from None
+
+    async def _request(self, body: bytes) -> bytes:
+        conn, status, headers = await self._open(body)
+        ok = False
+        try:
+            raw = b"".join([c async for c in self._iter_body(conn, headers)])
+            ok = self._reusable(headers)
+        finally:
+            self._release(conn, ok)
+        if status != 200:
+            raise RuntimeError(f"Ollama request failed: HTTP {status}: {raw[:500].decode('utf-8', 'replace')}")
+        return raw
+
+    async def _open(self, body: bytes) -> tuple[_AsyncConn, int, dict[str, str]]:
+        """发请求并读完响应头；复用的空闲连接若已被服务端关掉，换新连接重试一次。"""
+        head = (
+            f"POST /api/chat HTTP/1.1\r\nHost: {self._host}:{self._port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n"
+        ).encode("ascii")
+        retried = False
+        while True:
+            conn, reused = await self._acquire_conn()
+            try:
+                conn.writer.write(head + body)
+                await conn.writer.drain()
+                status, headers = await self._read_head(conn)
+                return conn, status, headers
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if not reused or retried:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+            retried = True
+
+    async def _acquire_conn(self) -> tuple[_AsyncConn, bool]:
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.reader.at_eof() and not conn.writer.is_closing():
+                self.reused += 1
+                return conn, True
+            conn.close()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self._host, self._port, ssl=self._ssl or None),
+                timeout=self.connect_timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise RuntimeError(f"Ollama request failed. Is Ollama running at {self.base_url}? Error: {e!r}") from e
+        self.created += 1
+        return _AsyncConn(reader, writer), False
+
+    def _release(self, conn: _AsyncConn, reusable: bool) -> None:
+        if reusable and len(self._idle) < self.admission.max_in_flight:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    async def _read_head(self, conn: _AsyncConn) -> tuple[int, dict[str, str]]:
+        reader = conn.reader
+        line = await self._read(reader.readline())
+        if not line:
+            raise ConnectionResetError("Connection closed before response")
+        status = int(line.split(None, 2)[1])
+        headers: dict[str, str] = {}
+        while True:
+            line = await self._read(reader.readline())
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        return status, headers
+
+    async def _iter_body(self, conn: _AsyncConn, headers: dict[str, str]) -> AsyncIterator[bytes]:
+        reader, read = conn.reader, self._read
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size = int((await read(reader.readline())).split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    while (await read(reader.readline())) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                data = await read(reader.readexactly(size))
+                await read(reader.readexactly(2))
+                yield data
+        elif "content-length" in headers:
+            yield await read(reader.readexactly(int(headers["content-length"])))
+        else:
+            yield await read(reader.read())
+
+    @staticmethod
+    def _reusable(headers: dict[str, str]) -> bool:
+        framed = "content-length" in headers or "chunked" in headers.get("transfer-encoding", "").lower()
+        return framed and headers.get("connection", "").lower() != "close"
+
+    def stats(self) -> dict[str, Any]:
+        requests = self.created + self.reused
+        return {
+            **self.admission.stats(),
+            "idle_connections": len(self._idle),
+            "connections_created": self.created,
+            "connections_reused": self.reused,
+            "reuse_rate": (self.reused / requests) if requests else 0.0,
+            "cancelled": self.cancelled,
+            "deadline_exceeded": self.deadline_exceeded,
+            "read_timeouts": self.read_timeouts,
+        }
+
+    async def aclose(self) -> None:
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        if self.completions is not None:
+            self.completions.close()
+
+def open_async_ollama_client(settings: Settings) -> AsyncOllamaClient:
+    return AsyncOllamaClient(
+        base_url=settings.ollama_base_url,
+        model=settings.ollama_model,
+        temperature=settings.ollama_temperature,
+        num_predict=settings.ollama_num_predict,
+        connect_timeout=settings.ollama_connect_timeout_s,
+        read_timeout=settings.ollama_read_timeout_s,
+        max_in_flight=settings.ollama_max_in_flight,
+        max_queue=settings.ollama_max_queue,
+        queue_timeout_s=settings.ollama_queue_timeout_s,
+        num_ctx=settings.ollama_num_ctx,
+        keep_alive=settings.ollama_keep_alive,
+        completions=open_completion_cache(settings),
+    )
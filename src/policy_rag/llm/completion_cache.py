@@ -0,0 +1,149 @@
+# LLM 补全缓存（OllamaClient / AsyncOllamaClient 内部使用）：完全相同的请求体直接返回上次的输出。
+# 重跑评测集、重新生成文档总结时，(system prompt, user prompt, 模型, 采样参数, 输出格式) 完全一致的调用很多；
+# 答案缓存（answer_cache.py）在检索之后才起作用，这里覆盖所有经过客户端的调用（ask / summarize / API）。
+#
+# - key = sha256(规范化后的请求体：model、messages、options、format)，不含 stream / keep_alive
+# - 只有确定性的调用才缓存：temperature == 0，或显式开启 LLM_CACHE_ALLOW_SAMPLING
+# - SQLite 单文件（默认 data/index/llm_cache.sqlite），按输出文本的总字节数做上限，超出按 last_used 淘汰
+# - 命中 / 未命中按调用方传入的 endpoint 分别计数
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from policy_rag.config.settings import Settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key        TEXT PRIMARY KEY,
+    endpoint   TEXT NOT NULL,
+    response   TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    created    REAL NOT NULL,
+    last_used  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS completions_last_used ON completions(last_used);
+"""
+
+_KEY_FIELDS = ("model", "messages", "options", "format")
+
+def completion_key(payload: dict[str, Any]) -> str:
+    raw = json.dumps({k: payload.get(k) for k in _KEY_FIELDS}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class CompletionCache:
+    def __init__(self, path: Path, max_bytes: int = 256 * 1024 * 1024, allow_sampling: bool = False):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.allow_sampling = bool(allow_sampling)
+
+        self.evictions = 0
+        self.skipped = 0 # 非确定性调用（temperature > 0）未参与缓存的次数
+        self._by_endpoint: dict[str, dict[str, int]] = {}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        (self._bytes,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()
+
+    def cacheable(self, payload: dict[str, Any]) -> bool:
+        temperature = float((payload.get("options") or {}).get("temperature", 0.8))
+        ok = temperature == 0.0 or self.allow_sampling
+        if not ok:
+            with self._lock:
+                self.skipped += 1
+        return ok
+
+    def _count(self, endpoint: str, field: str) -> None:
+        c = self._by_endpoint.setdefault(endpoint, {"hits": 0, "misses": 0, "stores": 0})
+        c[field] += 1
+
+    def get(self, key: str, endpoint: str = "default") -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(endpoint, "misses")
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self._count(endpoint, "hits")
+            return row[0]
+
+    def put(self, key: str, response: str, endpoint: str = "default") -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions(key, endpoint, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, response, size, now, now),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            self._evict_locked()
+            self._conn.commit()
+            self._count(endpoint, "stores")
+
+    def _evict_locked(self) -> None:
+        if self._bytes <= self.max_bytes:
+            return
+        # 按 last_used 从旧到新删，直到回到上限的 90%（避免每次写入都触发一次淘汰）
+        target = int(self.max_bytes * 0.9)
+        doomed: list[tuple[str]] = []
+        for key, size in self._conn.execute("SELECT key, size FROM completions ORDER BY last_used"):
+            if self._bytes <= target:
+                break
+            doomed.append((key,))
+            self._bytes -= size
+        self._conn.executemany("DELETE FROM completions WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+            self._bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+            by_endpoint = {
+                ep: {**c, "hit_rate": (c["hits"] / (c["hits"] + c["misses"])) if (c["hits"] + c["misses"]) else 0.0}
+                for ep, c in self._by_endpoint.items()
+            }
+        hits = sum(c["hits"] for c in by_endpoint.values())
+        misses = sum(c["misses"] for c in by_endpoint.values())
+        return {
+            "entries": size,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "allow_sampling": self.allow_sampling,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / (hits + misses)) if (hits + misses) else 0.0,
+            "skipped_nondeterministic": self.skipped,
+            "evictions": self.evictions,
+            "by_endpoint": by_endpoint,
+        }
+
+def open_completion_cache(settings: Settings) -> CompletionCache | None:
+    if not settings.llm_cache_enabled:
+        return None
+    return CompletionCache(
+        path=settings.llm_cache_path,
+        max_bytes=int(settings.llm_cache_max_mb * 1024 * 1024),
+        allow_sampling=settings.llm_cache_allow_sampling,
+    )
@@ -0,0 +1,158 @@
+# 多进程 CPU embedding 池：批量 ingest 时把 chunk 分片交给多个常驻 worker 并行编码
+# - 每个 worker 绑定一组 CPU 核（core group），模型只在 worker 启动时加载一次
+# - 结果按提交顺序拼回，和单进程 embed_texts_np 的输出行序完全一致
+
+# 注意：本模块在 worker 进程里也会被 import，所以顶层不要 import torch / sentence_transformers，
+# 必须等 initializer 里设好线程数环境变量之后再加载
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from policy_rag.config.settings import Settings
+
+# worker 进程内的全局模型（每个进程各自一份）
+_worker_model: Any = None
+
+def _available_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def resolve_pool_workers(workers: int) -> int:
+    # workers<=0 表示自动：大约每 4 个核一个 worker
+    if workers and workers > 0:
+        return int(workers)
+    return max(1, len(_available_cpus()) // 4)
+
+def plan_core_groups(workers: int, cores_per_worker: int = 0) -> list[list[int]]:
+    """
+    把可用 CPU 切成 workers 组；cores_per_worker<=0 时平均分配。
+    核数不够时允许组之间共享 CPU（至少每组 1 核）。
+    """
+    cpus = _available_cpus()
+    workers = max(1, int(workers))
+    per = int(cores_per_worker) if cores_per_worker and cores_per_worker > 0 else max(1, len(cpus) // workers)
+
+    groups: list[list[int]] = []
+    for w in range(workers):
+        start = (w * per) % len(cpus)
+        groups.append([cpus[(start + k) % len(cpus)] for k in range(per)])
+    return groups
+
+def _init_worker(model_name: str, backend: str, onnx_dir: str, group_queue: Any) -> None:
+    global _worker_model
+
+    cores: list[int] = group_queue.get()
+    threads = str(len(cores))
+    # 在 import torch 之前限制 BLAS/OpenMP 线程数，避免多个 worker 互相抢核
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+    from policy_rag.llm.embedding_backends import load_backend
+
+    if backend == "torch":
+        import torch
+
+        torch.set_num_threads(len(cores))
+    _worker_model = load_backend(model_name, backend=backend, onnx_dir=Path(onnx_dir), num_threads=len(cores))
+
+def _encode_shard(texts: list[str], batch_size: int) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+
+def _warmup() -> int:
+    return os.getpid()
+
+class EmbeddingPool:
+    def __init__(
+        self,
+        model_name: str,
+        workers: int,
+        cores_per_worker: int = 0,
+        backend: str = "torch",
+        onnx_dir: Path | None = None,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.core_groups = plan_core_groups(workers, cores_per_worker)
+        self.workers = len(self.core_groups)
+
+        # spawn：worker 不继承父进程已加载的 torch 状态，跨平台行为一致
+        ctx = mp.get_context("spawn")
+        group_queue = ctx.Queue()
+        for g in self.core_groups:
+            group_queue.put(g)
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(model_name, backend, str(onnx_dir or ""), group_queue),
+        )
+
+    def warmup(self) -> None:
+        """提前拉起所有 worker 并加载模型，避免第一批数据承担启动开销。"""
+        futs = [self._executor.submit(_warmup) for _ in range(self.workers * 2)]
+        for f in futs:
+            f.result()
+
+    def submit(self, texts: list[str], batch_size: int = 32) -> list[Future]:
+        # 每个分片就是一个 encode 批次；分片越多，worker 之间越容易负载均衡
+        shard = max(1, int(batch_size))
+        return [
+            self._executor.submit(_encode_shard, texts[i:i + shard], batch_size)
+            for i in range(0, len(texts), shard)
+        ]
+
+    def encode(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # 按提交顺序收集结果，保证输出行序 = 输入顺序
+        parts = [f.result() for f in self.submit(texts, batch_size=batch_size)]
+        return np.ascontiguousarray(np.concatenate(parts, axis=0), dtype=np.float32)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> EmbeddingPool:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+_shared_pool: Optional[EmbeddingPool] = None
+_shared_lock = threading.Lock()
+
+def get_embedding_pool(settings: Settings) -> EmbeddingPool:
+    """进程级共享的 pool（API 进程用）：第一次调用时创建，之后复用同一组 worker。"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = EmbeddingPool(
+                model_name=settings.embedding_model,
+                workers=resolve_pool_workers(settings.embed_pool_workers),
+                cores_per_worker=settings.embed_pool_cores_per_worker,
+                backend=settings.embedding_backend,
+                onnx_dir=settings.onnx_dir,
+            )
+        return _shared_pool
+
+def close_embedding_pool() -> None:
+    """API 关闭时调用：结束共享 pool 的 worker 进程（没创建过就什么也不做）。"""
+    global _shared_pool
+    with _shared_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.close()
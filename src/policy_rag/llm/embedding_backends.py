@@ -0,0 +1,217 @@
+# 可插拔的 embedding 推理后端，由 Settings.embedding_backend（环境变量 EMBEDDING_BACKEND）选择：
+# - torch:     sentence-transformers + PyTorch（默认，和之前行为一致）
+# - onnx:      ONNX Runtime（fp32），CPU 上通常比 PyTorch eager 更快
+# - onnx-int8: ONNX Runtime + 动态 int8 量化权重，CPU 延迟/内存最低，精度略有损失（用 parity 检查把关）
+#
+# ONNX 模型只从本地权重导出（local_files_only=True，不访问网络），导出产物放在
+# <onnx_dir>/<模型名>/ 下：model.onnx、model.int8.onnx、tokenizer 文件和 export.json
+
+# 注意：本模块会在 embed_pool 的 worker 里被 import，顶层不要 import torch / onnxruntime
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Protocol
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+class EmbeddingBackend(Protocol):
+    name: str
+    model_name: str
+
+    def encode(self, texts: list[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        """返回 L2 归一化后的 (len(texts), dim) C 连续 float32 矩阵。"""
+        ...
+
+def _l2_normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return np.ascontiguousarray(x / norms, dtype=np.float32)
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: list[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        vecs = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+        return np.ascontiguousarray(vecs, dtype=np.float32)
+
+def onnx_export_dir(onnx_dir: Path, model_name: str) -> Path:
+    return onnx_dir / re.sub(r"[^A-Za-z0-9_.\-]+", "__", model_name)
+
+def export_onnx(model_name: str, out_dir: Path, quantize: bool = True, opset: int = 17) -> Path:
+    """
+    用本地已缓存的 sentence-transformers 权重导出 ONNX（不联网）。
+    quantize=True 时额外生成动态 int8 量化版本 model.int8.onnx。
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, local_files_only=True, device="cpu")
+    transformer = st[0]
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    pooling = "cls"
+    if len(st) > 1 and hasattr(st[1], "get_pooling_mode_str"):
+        pooling = st[1].get_pooling_mode_str()
+    if pooling not in ("cls", "mean"):
+        raise RuntimeError(f"Unsupported pooling mode for ONNX export: {pooling}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = out_dir / "model.onnx"
+
+    dummy = tokenizer(["示例文本：国家奖学金申请条件"], return_tensors="pt")
+    # BERT 系 forward 的位置参数顺序就是 input_ids, attention_mask, token_type_ids
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {n: {0: "batch", 1: "seq"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(dummy[n] for n in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+
+    tokenizer.save_pretrained(str(out_dir))
+    (out_dir / "export.json").write_text(
+        json.dumps(
+            {
+                "model_name": model_name,
+                "pooling": pooling,
+                "max_seq_length": int(st.max_seq_length or 512),
+                "input_names": input_names,
+            },
+            ensure_ascii=False,
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(fp32_path), str(out_dir / "model.int8.onnx"), weight_type=QuantType.QInt8)
+
+    return out_dir
+
+class OnnxBackend:
+    def __init__(self, model_name: str, onnx_dir: Path, int8: bool = False, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=onnx/onnx-int8 requires onnxruntime and onnx. "
+                "Install with: pip install -e '.[onnx]'"
+            ) from e
+
+        self.model_name = model_name
+        self.name = "onnx-int8" if int8 else "onnx"
+
+        export_dir = onnx_export_dir(onnx_dir, model_name)
+        model_path = export_dir / ("model.int8.onnx" if int8 else "model.onnx")
+        if not model_path.exists():
+            export_onnx(model_name, export_dir, quantize=int8)
+
+        cfg = json.loads((export_dir / "export.json").read_text(encoding="utf-8"))
+        self.pooling = cfg.get("pooling", "cls")
+        self.max_seq_length = int(cfg.get("max_seq_length", 512))
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir), local_files_only=True)
+
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            so.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_path), sess_options=so, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, batch: list[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            batch,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feed = {k: v.astype(np.int64, copy=False) for k, v in enc.items() if k in self._input_names}
+        hidden = self.session.run(None, feed)[0]
+
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _l2_normalize(pooled)
+
+    def encode(self, texts: list[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # 按长度排序后分批，减少 padding；最后按原顺序放回
+        bs = max(1, batch_size)
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        parts: list[np.ndarray] = []
+        for i in range(0, len(texts), bs):
+            parts.append(self._encode_batch([texts[j] for j in order[i:i + bs]]))
+        sorted_vecs = np.concatenate(parts, axis=0)
+
+        out = np.empty_like(sorted_vecs)
+        out[order] = sorted_vecs
+        return out
+
+def load_backend(model_name: str, backend: str, onnx_dir: Path, num_threads: int = 0) -> EmbeddingBackend:
+    if backend == "torch":
+        return TorchBackend(model_name)
+    if backend == "onnx":
+        return OnnxBackend(model_name, onnx_dir=onnx_dir, int8=False, num_threads=num_threads)
+    if backend == "onnx-int8":
+        return OnnxBackend(model_name, onnx_dir=onnx_dir, int8=True, num_threads=num_threads)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND={backend!r}. Allowed: {list(BACKENDS)}")
+
+def parity_check(reference: EmbeddingBackend, candidate: EmbeddingBackend, texts: list[str]) -> dict[str, Any]:
+    """
+    比较两个后端对同一批文本的向量：逐条 cosine（两边都已归一化，即点积），
+    以及 top-1 近邻是否一致（检索排序是否会被改变）。
+    """
+    ref = reference.encode(texts, batch_size=32)
+    cand = candidate.encode(texts, batch_size=32)
+    cos = np.einsum("ij,ij->i", ref, cand)
+
+    # 用文本两两相似度的 argmax 近似“检索排序一致性”
+    ref_sim = ref @ ref.T
+    cand_sim = cand @ cand.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    nn_agree = float(np.mean(ref_sim.argmax(axis=1) == cand_sim.argmax(axis=1))) if len(texts) > 1 else 1.0
+
+    return {
+        "reference": reference.name,
+        "candidate": candidate.name,
+        "n": len(texts),
+        "mean_cos": float(cos.mean()),
+        "min_cos": float(cos.min()),
+        "p05_cos": float(np.percentile(cos, 5)),
+        "nn_agreement": nn_agree,
+    }
@@ -0,0 +1,381 @@
+# 持久化的 embedding 缓存：按 (模型名, 是否归一化, 文本哈希) 做内容寻址
+# 重新 ingest / index-chunks 时，只有“新增或改动过“的 chunk 才需要真正跑模型
+
+# 磁盘布局（每个 (model, normalize) 组合一个子目录）：
+#   <cache_dir>/<namespace>/vectors.f32   连续 float32 行矩阵，用 np.memmap 读写
+#   <cache_dir>/<namespace>/index.json    文本哈希 -> [行号, 最近使用序号] + 元信息
+#   <cache_dir>/<namespace>/cache.lock    进程间互斥（fcntl.flock）
+#
+# 多个进程（API 与 CLI 同时 ingest）共用同一个目录：分配行号、写向量、写 index.json 都在排他锁内完成，
+# 拿到锁后先把磁盘上别的进程写入的条目合并进来，再从磁盘上的 n_rows 往后分配，行号不会重叠。
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # Windows 没有 flock：只保证进程内互斥
+    fcntl = None
+
+from policy_rag.config.settings import Settings
+
+_INDEX_VERSION = 1
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _namespace(model_name: str, normalize: bool, backend: str) -> str:
+    raw = f"{model_name}|normalize={int(bool(normalize))}"
+    # 默认 torch 后端保持原命名空间；onnx/int8 向量有数值差异，单独存放
+    if backend != "torch":
+        raw += f"|backend={backend}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        cache_dir: Path,
+        model_name: str,
+        normalize: bool = True,
+        max_bytes: int = 512 * 1024 * 1024,
+        backend: str = "torch",
+    ):
+        self.model_name = model_name
+        self.normalize = bool(normalize)
+        self.backend = backend
+        self.max_bytes = int(max_bytes)
+
+        self.dir = cache_dir / _namespace(model_name, normalize, backend)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "vectors.f32"
+        self.index_path = self.dir / "index.json"
+        self.lock_path = self.dir / "cache.lock"
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._n_rows = 0 # 已使用的行数（文件可能预留了更多行）
+        self._tick = 0 # 单调递增的“使用序号“，用于 LRU 淘汰
+        self._entries: dict[str, list[int]] = {} # key -> [row, last_used_tick]
+        self._mm: Optional[np.memmap] = None
+        self._dirty = False
+        self._index_sig: Optional[tuple[int, int, int]] = None # 上次读 / 写 index.json 时的 (inode, mtime_ns, size)
+        self._lock_file = None
+
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh_locked()
+
+    # ---------- 持久化 ----------
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True) -> Iterator[None]:
+        """进程间锁；调用方必须已持有 self._lock（同一个 fd 上的 flock 由进程内所有线程共享）。"""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = self.lock_path.open("a+b")
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _stat_index(self) -> Optional[tuple[int, int, int]]:
+        try:
+            st = self.index_path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_index(self) -> Optional[dict[str, Any]]:
+        if not self.index_path.exists() or not self.vectors_path.exists():
+            return None
+        try:
+            obj = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            # 索引损坏就当作空缓存，下次 flush 会重建
+            return None
+        if (
+            obj.get("version") != _INDEX_VERSION
+            or obj.get("model_name") != self.model_name
+            or obj.get("backend", "torch") != self.backend
+        ):
+            return None
+        return obj
+
+    def _refresh_locked(self) -> None:
+        """
+        index.json 被（别的进程）改过就重新读入，需持有文件锁。
+        行号以磁盘为准；本进程只在内存里更新过的 LRU 序号取较大值保留。
+        自己分配的行在释放锁之前都已写回磁盘，所以只在内存里有的 key 一定是被别的进程淘汰掉的。
+        """
+        sig = self._stat_index()
+        if sig == self._index_sig:
+            return
+        self._index_sig = sig
+        obj = self._read_index()
+        if obj is None:
+            return
+
+        ticks = {k: ent[1] for k, ent in self._entries.items()}
+        self._dim = int(obj["dim"]) if obj.get("dim") else None
+        self._n_rows = int(obj.get("n_rows", 0))
+        self._tick = max(self._tick, int(obj.get("tick", 0)))
+        self._entries = {
+            k: [int(v[0]), max(int(v[1]), ticks.get(k, 0))] for k, v in (obj.get("entries") or {}).items()
+        }
+        # 别的进程可能扩容或压缩（替换）了向量文件，重新映射
+        self._mm = None
+        if self._dim:
+            self._open_mm()
+
+    def _capacity(self) -> int:
+        if not self._dim or not self.vectors_path.exists():
+            return 0
+        return self.vectors_path.stat().st_size // (self._dim * 4)
+
+    def _open_mm(self) -> None:
+        cap = self._capacity()
+        self._mm = None
+        if cap > 0:
+            self._mm = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(cap, self._dim))
+
+    def _ensure_capacity(self, rows_needed: int) -> None:
+        cap = self._capacity()
+        if rows_needed <= cap:
+            return
+        # 按倍数扩容，避免每批都 truncate + 重新 mmap
+        new_cap = max(rows_needed, cap * 2, 1024)
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm = None
+        with self.vectors_path.open("ab") as f:
+            f.truncate(new_cap * self._dim * 4)
+        self._open_mm()
+
+    def flush(self) -> None:
+        """写回 get_many 更新过的 LRU 序号（新写入的向量在 put_many 里已经落盘）。"""
+        with self._lock:
+            if not self._dirty:
+                return
+            with self._file_lock():
+                self._refresh_locked()
+                self._write_index_locked()
+
+    def _write_index_locked(self) -> None:
+        if self._mm is not None:
+            self._mm.flush()
+        obj = {
+            "version": _INDEX_VERSION,
+            "model_name": self.model_name,
+            "normalize": self.normalize,
+            "backend": self.backend,
+            "dim": self._dim,
+            "n_rows": self._n_rows,
+            "tick": self._tick,
+            "entries": self._entries,
+        }
+        tmp = self.index_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(obj, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.index_path)
+        self._index_sig = self._stat_index()
+        self._dirty = False
+
+    # ---------- 读写 ----------
+
+    def get_many(self, keys: list[str]) -> tuple[np.ndarray | None, list[int]]:
+        """
+        返回 (vectors, missing_positions)：
+        - vectors: shape=(len(keys), dim) 的 float32 矩阵，未命中的行为 0；缓存为空时为 None
+        - missing_positions: 未命中的下标（按输入顺序）
+        """
+        with self._lock:
+            with self._file_lock(exclusive=False):
+                self._refresh_locked()
+            if self._dim is None or self._mm is None:
+                self.misses += len(keys)
+                return None, list(range(len(keys)))
+
+            out = np.zeros((len(keys), self._dim), dtype=np.float32)
+            missing: list[int] = []
+            for i, k in enumerate(keys):
+                ent = self._entries.get(k)
+                if ent is None:
+                    missing.append(i)
+                    continue
+                self._tick += 1
+                ent[1] = self._tick
+                out[i] = self._mm[ent[0]]
+
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            if len(missing) < len(keys):
+                self._dirty = True
+            return out, missing
+
+    def put_many(self, keys: list[str], vectors: np.ndarray) -> None:
+        vecs = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vecs.ndim != 2 or vecs.shape[0] != len(keys):
+            raise ValueError(f"vectors shape {vecs.shape} does not match {len(keys)} keys")
+        if not keys:
+            return
+
+        with self._lock, self._file_lock():
+            # 分配行号前先合并别的进程写入的条目，从磁盘上的 n_rows 往后分配；释放锁前写回 index.json
+            self._refresh_locked()
+            if self._dim is None:
+                self._dim = int(vecs.shape[1])
+            elif vecs.shape[1] != self._dim:
+                raise ValueError(f"Embedding dim changed ({self._dim} -> {vecs.shape[1]}) for model {self.model_name}")
+
+            # 同一批里重复的 key 只占一行
+            new_keys: dict[str, int] = {}
+            for i, k in enumerate(keys):
+                if k not in self._entries and k not in new_keys:
+                    new_keys[k] = i
+            self._ensure_capacity(self._n_rows + len(new_keys))
+
+            for k, i in new_keys.items():
+                row = self._n_rows
+                self._mm[row] = vecs[i]
+                self._tick += 1
+                self._entries[k] = [row, self._tick]
+                self._n_rows += 1
+
+            self._maybe_evict()
+            self._write_index_locked()
+
+    def _maybe_evict(self) -> None:
+        row_bytes = self._dim * 4
+        if self._n_rows * row_bytes <= self.max_bytes:
+            return
+
+        # 淘汰到上限的 90%，避免每次写入都触发一次压缩
+        keep_rows = max(0, int(self.max_bytes * 0.9) // row_bytes)
+        by_recent = sorted(self._entries.items(), key=lambda kv: kv[1][1], reverse=True)
+        kept = by_recent[:keep_rows]
+        self.evictions += len(by_recent) - len(kept)
+
+        # 压缩：只保留存活的行，写到新文件后原子替换
+        old_rows = np.array([ent[0] for _k, ent in kept], dtype=np.int64)
+        compact = np.asarray(self._mm[old_rows]) if len(kept) else np.zeros((0, self._dim), dtype=np.float32)
+        self._mm = None
+
+        tmp = self.vectors_path.with_suffix(".f32.tmp")
+        compact.astype(np.float32, copy=False).tofile(tmp)
+        tmp.replace(self.vectors_path)
+
+        self._entries = {k: [new_row, ent[1]] for new_row, (k, ent) in enumerate(kept)}
+        self._n_rows = len(kept)
+        self._open_mm()
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "normalize": self.normalize,
+            "backend": self.backend,
+            "entries": len(self._entries),
+            "bytes": self._n_rows * (self._dim or 0) * 4,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+def open_embedding_cache(settings: Settings) -> EmbeddingCache | None:
+    if not settings.embed_cache_enabled:
+        return None
+    return EmbeddingCache(
+        cache_dir=settings.embed_cache_dir,
+        model_name=settings.embedding_model,
+        normalize=True,
+        max_bytes=settings.embed_cache_max_mb * 1024 * 1024,
+        backend=settings.embedding_backend,
+    )
+
+def normalize_query(query: str) -> str:
+    # NFKC 把全角字母/数字/标点统一成半角，再把连续空白压成一个空格
+    q = unicodedata.normalize("NFKC", query or "")
+    return " ".join(q.split())
+
+class QueryEmbeddingCache:
+    """
+    进程内的 query 向量 LRU + TTL 缓存。
+    key = (model_name, normalize_query(query))，value = 只读的 float32 一维向量。
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_s: float = 3600.0):
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        # OrderedDict 维护访问顺序：末尾是最近使用，开头是最久未用
+        self._data: OrderedDict[tuple[str, str], tuple[float, np.ndarray]] = OrderedDict()
+
+    def get(self, model_name: str, norm_query: str) -> np.ndarray | None:
+        key = (model_name, norm_query)
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            ts, vec = item
+            if self.ttl_s > 0 and now - ts > self.ttl_s:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model_name: str, norm_query: str, vec: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        v = np.ascontiguousarray(vec, dtype=np.float32)
+        v.flags.writeable = False
+        with self._lock:
+            self._data[(model_name, norm_query)] = (time.monotonic(), v)
+            self._data.move_to_end((model_name, norm_query))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
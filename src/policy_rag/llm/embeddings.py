@@ -11,24 +11,183 @@ from functools import lru_cache
 from typing import List
 
 import numpy as np
-# 用于把文本变成向量，Embedding 模型
-from sentence_transformers import SentenceTransformer
+
+from policy_rag.config.settings import Settings
+from policy_rag.llm.embedding_backends import EmbeddingBackend, load_backend
+from policy_rag.llm.embed_pool import EmbeddingPool
+from policy_rag.llm.query_batcher import QueryBatcher
+from policy_rag.llm.embedding_cache import EmbeddingCache, QueryEmbeddingCache, normalize_query, text_key
 
 # maxsize=1 表示只保留一组输入、输出的缓存
+# 推理后端（torch / onnx / onnx-int8）由 EMBEDDING_BACKEND 决定
 @lru_cache(maxsize=1)
-def _get_model(model_name: str) -> SentenceTransformer:
-    return SentenceTransformer(model_name)
-
-def embed_texts(texts: list[str], model_name: str, batch_size: int = 32) -> list[list[float]]:
-    model = _get_model(model_name)
-    # vecs默认输出为np.ndarray
-    vecs = model.encode(
-        texts,
-        batch_size=batch_size,
-        show_progress_bar=True,
-        normalize_embeddings=True,
+def _get_backend(model_name: str) -> EmbeddingBackend:
+    settings = Settings.from_repo_root()
+    return load_backend(
+        model_name,
+        backend=settings.embedding_backend,
+        onnx_dir=settings.onnx_dir,
+        num_threads=settings.embedding_threads,
     )
 
-    if isinstance(vecs, np.ndarray):
-        vecs.astype("float32").tolist()
-    return [v.astype("float32").tolist() for v in vecs]
\ No newline at end of file
+def _encode(texts: list[str], model_name: str, batch_size: int) -> np.ndarray:
+    # 各后端都直接返回一整块 (n, dim) 的 C 连续 float32 ndarray
+    return _get_backend(model_name).encode(texts, batch_size=batch_size, show_progress_bar=True)
+
+def embed_texts_np(
+    texts: list[str],
+    model_name: str,
+    batch_size: int = 32,
+    cache: EmbeddingCache | None = None,
+    pool: EmbeddingPool | None = None,
+) -> np.ndarray:
+    """
+    ndarray 版本的批量编码：返回 shape=(len(texts), dim) 的 C 连续 float32 矩阵，
+    可以直接交给 VectorStore.upsert，全程不生成 Python float 列表。
+    传入 pool 时由多进程 worker 编码（结果行序不变）。
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    if pool is not None and pool.model_name != model_name:
+        raise ValueError(f"EmbeddingPool is for model={pool.model_name}, got model={model_name}")
+
+    def _run(batch: list[str]) -> np.ndarray:
+        if pool is not None:
+            return pool.encode(batch, batch_size=batch_size)
+        return _encode(batch, model_name, batch_size)
+
+    if cache is None:
+        return _run(texts)
+
+    backend_name = pool.backend if pool is not None else _get_backend(model_name).name
+    if cache.model_name != model_name or not cache.normalize or cache.backend != backend_name:
+        raise ValueError(
+            f"EmbeddingCache is for model={cache.model_name} normalize={cache.normalize} backend={cache.backend}, "
+            f"but texts are being embedded with model={model_name} normalize=True backend={backend_name}"
+        )
+
+    # 先查缓存，只把未命中的文本送进模型
+    keys = [text_key(t) for t in texts]
+    vecs, missing = cache.get_many(keys)
+
+    if missing:
+        fresh = _run([texts[i] for i in missing])
+        if vecs is None:
+            vecs = fresh if len(missing) == len(texts) else np.zeros((len(texts), fresh.shape[1]), dtype=np.float32)
+        if vecs is not fresh:
+            vecs[missing] = fresh
+        cache.put_many([keys[i] for i in missing], fresh)
+        cache.flush()
+
+    return vecs
+
+def embed_texts(
+    texts: list[str],
+    model_name: str,
+    batch_size: int = 32,
+    cache: EmbeddingCache | None = None,
+) -> list[list[float]]:
+    # 兼容旧调用方的 list 接口；新代码请直接用 embed_texts_np
+    return embed_texts_np(texts, model_name=model_name, batch_size=batch_size, cache=cache).tolist()
+
+@lru_cache(maxsize=1)
+def get_query_cache() -> QueryEmbeddingCache:
+    settings = Settings.from_repo_root()
+    return QueryEmbeddingCache(max_entries=settings.query_cache_size, ttl_s=settings.query_cache_ttl_s)
+
+def warmup_embeddings(model_name: str) -> None:
+    # 加载模型并跑一次编码（不经过 query 缓存），首个请求不再承担模型加载与首次推理开销
+    _get_backend(model_name).encode(["预热"], batch_size=1, show_progress_bar=False)
+
+# 已启用的 query 微批器（按模型名），只有 API 进程会启用
+_query_batchers: dict[str, QueryBatcher] = {}
+
+def enable_query_batcher(model_name: str, max_batch: int = 16, max_wait_ms: float = 3.0) -> QueryBatcher:
+    batcher = _query_batchers.get(model_name)
+    if batcher is None:
+        backend = _get_backend(model_name)
+        batcher = QueryBatcher(
+            encode_fn=lambda texts: backend.encode(texts, batch_size=len(texts), show_progress_bar=False),
+            max_batch=max_batch,
+            max_wait_ms=max_wait_ms,
+        )
+        _query_batchers[model_name] = batcher
+    return batcher
+
+def disable_query_batchers() -> None:
+    for b in _query_batchers.values():
+        b.close()
+    _query_batchers.clear()
+
+def get_query_batcher(model_name: str) -> QueryBatcher | None:
+    return _query_batchers.get(model_name)
+
+def embed_query(query: str, model_name: str, cache: QueryEmbeddingCache | None = None) -> np.ndarray:
+    """
+    serving 热路径上的单条 query 编码：不显示进度条、不构造 Python list，
+    直接返回只读的 float32 一维向量；相同的（归一化后）问题命中进程内 LRU 缓存。
+    """
+    cache = cache if cache is not None else get_query_cache()
+    q = normalize_query(query)
+
+    backend = _get_backend(model_name)
+    # 不同后端的向量有细微数值差异，缓存 key 里带上后端名
+    model_key = f"{model_name}@{backend.name}"
+
+    vec = cache.get(model_key, q)
+    if vec is not None:
+        return vec
+
+    batcher = _query_batchers.get(model_name)
+    if batcher is not None:
+        # API 场景：和其他并发请求的 query 合成一批编码
+        vec = batcher.encode(q)
+    else:
+        out = backend.encode([q], batch_size=1, show_progress_bar=False)
+        vec = np.ascontiguousarray(out[0], dtype=np.float32)
+    cache.put(model_key, q, vec)
+    vec.flags.writeable = False
+    return vec
+
+def embed_queries(
+    queries: list[str],
+    model_name: str,
+    batch_size: int = 64,
+    cache: QueryEmbeddingCache | None = None,
+) -> np.ndarray:
+    """
+    批量版 embed_query（离线回归评测等场景）：先查 query 缓存，未命中的按 batch_size 一次性编码。
+    返回 shape=(len(queries), dim) 的 float32 矩阵，行序与输入一致。
+    """
+    if not queries:
+        return np.empty((0, 0), dtype=np.float32)
+
+    cache = cache if cache is not None else get_query_cache()
+    backend = _get_backend(model_name)
+    model_key = f"{model_name}@{backend.name}"
+
+    normed = [normalize_query(q) for q in queries]
+    found: dict[str, np.ndarray] = {}
+    todo: list[str] = []
+    pending: set[str] = set()
+    for q in normed:
+        if q in found or q in pending:
+            continue
+        vec = cache.get(model_key, q)
+        if vec is not None:
+            found[q] = vec
+        else:
+            todo.append(q)
+            pending.add(q)
+
+    if todo:
+        fresh = backend.encode(todo, batch_size=batch_size, show_progress_bar=False)
+        for q, row in zip(todo, fresh):
+            # 单独复制一行再放进缓存，避免缓存条目引用整个 batch 矩阵
+            vec = np.array(row, dtype=np.float32)
+            vec.flags.writeable = False
+            cache.put(model_key, q, vec)
+            found[q] = vec
+
+    return np.ascontiguousarray(np.stack([found[q] for q in normed]), dtype=np.float32)
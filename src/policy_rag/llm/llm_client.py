@@ -1,55 +1,360 @@
+# Ollama HTTP 客户端：基于 http.client 的 keep-alive 连接池
+# 每次调用都新建 opener + TCP 连接时，握手与慢启动会叠加在每个请求上；这里复用空闲连接，
+# 同一个实例可以在 FastAPI 线程池里被多个请求并发共享（池的大小限制了同时打开的连接数）。
 from __future__ import annotations
 
+import http.client
 import json
-import urllib.request
+import socket
+import threading
+import time
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Iterator, Optional
+from urllib.parse import urlsplit
+
+from policy_rag.config.settings import Settings
+from policy_rag.llm.completion_cache import CompletionCache, completion_key, open_completion_cache
 
 @dataclass(frozen=True)
 class ChatMessage:
     role: str # “system" | "user" | "assistant"
     content: str
 
-class OllamaClient:
-    def __init__(self, base_url: str, model: str, temperature: float = 0.2, num_predict: int = 800):
+# 复用的空闲连接可能已被服务端关闭（keep-alive 超时）：这些错误在“还没收到响应“时出现，换一条新连接重试一次
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+
+_JSON_HEADERS = {"Content-Type": "application/json", "Connection": "keep-alive"}
+
+class PoolExhaustedError(TimeoutError):
+    """所有连接都被占用、等满 pool_wait_timeout 也没空出来：是本进程的并发上限，不是 Ollama 出错。"""
+
+class _ConnectionPool:
+    """最多 max_size 条连接（含正在使用的）；归还时放回空闲栈，最近用过的优先复用。"""
+
+    def __init__(
+        self,
+        base_url: str,
+        max_size: int,
+        connect_timeout: float,
+        read_timeout: float,
+        wait_timeout: Optional[float] = None,
+    ):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if self.scheme == "https" else 80)
+        self.max_size = max(1, int(max_size))
+        self.connect_timeout = float(connect_timeout)
+        self.read_timeout = float(read_timeout)
+        # 等空闲连接的上限：占着连接的是正在生成的请求，一次生成可能要几十秒，默认按读超时等
+        self.wait_timeout = float(wait_timeout) if wait_timeout else self.read_timeout
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle: list[http.client.HTTPConnection] = []
+        self._in_use = 0
+
+        self.created = 0
+        self.reused = 0
+        self.stale_retries = 0
+        self.discarded = 0
+        self.exhausted = 0
+        self.wait_ms_total = 0.0
+
+    def _new_conn(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        conn = cls(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        # 连接建立后切换成读超时：生成长回答时单次读可能要等很久
+        conn.sock.settimeout(self.read_timeout)
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def acquire(self) -> tuple[http.client.HTTPConnection, bool]:
+        """返回 (连接, 是否复用的空闲连接)；池满时阻塞等待，最多等 wait_timeout 秒。"""
+        t0 = time.perf_counter()
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self.exhausted += 1
+            raise PoolExhaustedError(
+                f"Ollama connection pool exhausted: no free connection within {self.wait_timeout:g}s "
+                f"(pool size={self.max_size}); raise OLLAMA_POOL_SIZE or lower the concurrency"
+            )
+        with self._lock:
+            self.wait_ms_total += (time.perf_counter() - t0) * 1000
+            self._in_use += 1
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.reused += 1
+        if conn is not None:
+            return conn, True
+        try:
+            return self._new_conn(), False
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool, stale: bool = False) -> None:
+        if not reusable:
+            conn.close()
+        with self._lock:
+            if reusable:
+                self._idle.append(conn)
+            elif stale:
+                self.stale_retries += 1
+            else:
+                self.discarded += 1
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            idle, in_use = len(self._idle), self._in_use
+        requests = self.created + self.reused
+        return {
+            "pool_size": self.max_size,
+            "idle": idle,
+            "in_use": in_use,
+            "connections_created": self.created,
+            "connections_reused": self.reused,
+            "reuse_rate": (self.reused / requests) if requests else 0.0,
+            "stale_retries": self.stale_retries,
+            "discarded": self.discarded,
+            "exhausted": self.exhausted,
+            "mean_wait_ms": (self.wait_ms_total / requests) if requests else 0.0,
+        }
+
+def _keep_alive_value(raw: str) -> str | int:
+    # Ollama 接受时长字符串（"30m"）或秒数；纯数字按秒数传（"-1" = 常驻，"0" = 用完立即卸载）
+    try:
+        return int(raw)
+    except ValueError:
+        return raw
+
+class _OllamaChatBase:
+    """同步 / 异步客户端共用的请求体构造。"""
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        temperature: float,
+        num_predict: int,
+        num_ctx: Optional[int] = None,
+        keep_alive: Optional[str] = None,
+        completions: Optional[CompletionCache] = None,
+    ):
         self.base_url = base_url.rstrip("/")
         self.model = model
         self.temperature = temperature
         self.num_predict = num_predict
+        # num_ctx 每次都显式传同一个值：值一变 Ollama 就要重新加载模型、KV cache 也无法复用
+        self.num_ctx = num_ctx
+        # 模型空闲多久后卸载（如 "30m"、"-1" 表示常驻）；突发流量之间不被卸载，就不用重新加载权重
+        self.keep_alive = keep_alive
+        self.completions = completions
 
-    def chat(self, messages: list[ChatMessage], response_format=None) -> str:
-        url = f"{self.base_url}/api/chat"
+    def _chat_payload(self, messages: list[ChatMessage], response_format, stream: bool) -> dict[str, Any]:
         payload: dict[str, Any] = {
             "model": self.model,
             "messages": [{"role": m.role, "content": m.content} for m in messages],
-            "stream": False,
+            "stream": stream,
             "options": {
                 "temperature": self.temperature,
                 "num_predict": self.num_predict,
             }
         }
+        if self.num_ctx:
+            payload["options"]["num_ctx"] = int(self.num_ctx)
+        if self.keep_alive:
+            payload["keep_alive"] = _keep_alive_value(self.keep_alive)
 
         if response_format is not None:
             payload["format"] = response_format
+        return payload
+
+    def _completion_key(self, payload: dict[str, Any], use_cache: bool) -> Optional[str]:
+        """返回补全缓存的 key；缓存关闭、调用方要求绕过或调用不确定（有采样）时返回 None。"""
+        if self.completions is None or not use_cache or not self.completions.cacheable(payload):
+            return None
+        return completion_key(payload)
 
-        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-        req = urllib.request.Request(
-            url=url,
-            data=data,
-            headers={"Content-Type": "application/json"},
-            method="POST"
-        )
+    def completion_stats(self) -> Optional[dict[str, Any]]:
+        return self.completions.stats() if self.completions is not None else None
+
+class OllamaClient(_OllamaChatBase):
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        temperature: float = 0.2,
+        num_predict: int = 800,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 240.0,
+        pool_size: int = 8,
+        num_ctx: Optional[int] = None,
+        keep_alive: Optional[str] = None,
+        completions: Optional[CompletionCache] = None,
+        pool_wait_timeout: Optional[float] = None,
+    ):
+        super().__init__(base_url, model, temperature, num_predict, num_ctx, keep_alive, completions)
+        self._pool = _ConnectionPool(self.base_url, pool_size, connect_timeout, read_timeout, pool_wait_timeout)
+
+    def chat(
+        self,
+        messages: list[ChatMessage],
+        response_format=None,
+        endpoint: str = "default",
+        use_cache: bool = True,
+    ) -> str:
+        """endpoint 只用于补全缓存按调用方分别统计命中；use_cache=False 绕过补全缓存（不读也不写）。"""
+        payload = self._chat_payload(messages, response_format, stream=False)
+        key = self._completion_key(payload, use_cache)
+        if key is not None:
+            hit = self.completions.get(key, endpoint)
+            if hit is not None:
+                return hit
+
+        obj = self._post_json("/api/chat", payload)
+        msg = obj.get("message", {})
+        content = str(msg.get("content", ""))
+        if key is not None and content:
+            self.completions.put(key, content, endpoint)
+        return content
+
+    def chat_stream(
+        self,
+        messages: list[ChatMessage],
+        response_format=None,
+        endpoint: str = "default",
+        use_cache: bool = True,
+    ) -> Iterator[str]:
+        """
+        流式生成：逐条 yield 模型输出的增量文本。Ollama 以 NDJSON 逐行返回，最后一行 done=true。
+        调用方提前停止迭代（例如客户端断开）时，这条连接上还有未读完的数据，不会放回池里。
+        补全缓存命中时整段输出作为一条增量返回；完整读完的输出才会写入缓存。
+        """
+        payload = self._chat_payload(messages, response_format, stream=True)
+        key = self._completion_key(payload, use_cache)
+        if key is not None:
+            hit = self.completions.get(key, endpoint)
+            if hit is not None:
+                yield hit
+                return
+
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        try:
+            conn, resp = self._open("POST", "/api/chat", body, _JSON_HEADERS)
+        except PoolExhaustedError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Ollama request failed. Is Ollama running at {self.base_url}? Error: {e}") from e
+
+        ok = False
+        parts: list[str] = []
+        try:
+            if resp.status != 200:
+                raise RuntimeError(f"Ollama stream failed: HTTP {resp.status}: {resp.read()[:500].decode('utf-8', 'replace')}")
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                if obj.get("error"):
+                    raise RuntimeError(f"Ollama stream failed: {obj['error']}")
+                delta = str((obj.get("message") or {}).get("content", ""))
+                if delta:
+                    parts.append(delta)
+                    yield delta
+                if obj.get("done"):
+                    if key is not None and parts:
+                        self.completions.put(key, "".join(parts), endpoint)
+                    break
+            resp.read() # 读掉分块传输的结尾，连接才能复用
+            ok = not resp.will_close
+        finally:
+            self._pool.release(conn, reusable=ok)
+
+    def _post_json(self, path: str, payload: dict[str, Any]) -> dict[str, Any]:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
 
         try:
-            opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
-            with opener.open(req, timeout=240) as resp:
-                raw = resp.read().decode("utf-8")
+            status, raw = self._send("POST", path, body, _JSON_HEADERS)
+            if status != 200:
+                raise RuntimeError(f"HTTP {status}: {raw[:500].decode('utf-8', 'replace')}")
+            return json.loads(raw.decode("utf-8"))
+        except PoolExhaustedError:
+            raise # 本进程并发超过连接池：原样抛出，不要说成 Ollama 出错
         except Exception as e:
             raise RuntimeError(
                 f"Ollama request failed. Is Ollama running at {self.base_url}? "
                 f"Error: {e}"
             ) from e
-        
-        obj = json.loads(raw)
-        msg = obj.get("message", {})
-        return str(msg.get("content", ""))
\ No newline at end of file
+
+    def _open(
+        self, method: str, path: str, body: bytes, headers: dict[str, str]
+    ) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """发出请求并拿到响应头；调用方读完响应后负责 self._pool.release(conn, ...)。"""
+        retried = False
+        while True:
+            conn, reused = self._pool.acquire()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except _STALE_ERRORS:
+                stale = reused and not retried
+                self._pool.release(conn, reusable=False, stale=stale)
+                if not stale:
+                    raise
+            except BaseException:
+                self._pool.release(conn, reusable=False)
+                raise
+            retried = True
+
+    def _send(self, method: str, path: str, body: bytes, headers: dict[str, str]) -> tuple[int, bytes]:
+        conn, resp = self._open(method, path, body, headers)
+        ok = False
+        try:
+            raw = resp.read()
+            # 服务端声明要关闭连接（Connection: close / HTTP/1.0）时不放回池里
+            ok = not resp.will_close
+            return resp.status, raw
+        finally:
+            self._pool.release(conn, reusable=ok)
+
+    def stats(self) -> dict[str, Any]:
+        return self._pool.stats()
+
+    def close(self) -> None:
+        self._pool.close()
+        if self.completions is not None:
+            self.completions.close()
+
+def open_ollama_client(settings: Settings) -> OllamaClient:
+    return OllamaClient(
+        base_url=settings.ollama_base_url,
+        model=settings.ollama_model,
+        temperature=settings.ollama_temperature,
+        num_predict=settings.ollama_num_predict,
+        connect_timeout=settings.ollama_connect_timeout_s,
+        read_timeout=settings.ollama_read_timeout_s,
+        pool_size=settings.ollama_pool_size,
+        pool_wait_timeout=settings.ollama_pool_wait_s,
+        num_ctx=settings.ollama_num_ctx,
+        keep_alive=settings.ollama_keep_alive,
+        completions=open_completion_cache(settings),
+    )
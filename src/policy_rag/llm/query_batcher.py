@@ -0,0 +1,151 @@
+# API 里的 query embedding 动态微批（micro-batching）
+# 并发的 /chat 请求各自只编码 1 条 query；CPU 推理在 batch=8~32 时单条成本低得多。
+# 这里用一个后台线程收集并发请求：凑够 max_batch 条或最早一条等待超过 max_wait_ms 就一起编码，
+# 再把每条结果通过 Future 还给各自的调用方。
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+@dataclass
+class _Pending:
+    text: str
+    enqueued_at: float
+    future: Future = field(default_factory=Future)
+
+class QueryBatcher:
+    def __init__(
+        self,
+        encode_fn: Callable[[list[str]], np.ndarray],
+        max_batch: int = 16,
+        max_wait_ms: float = 3.0,
+        max_queue: int = 1024,
+    ):
+        # encode_fn: list[str] -> (n, dim) float32，行序与输入一致
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._q: queue.Queue[_Pending] = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.dedup_saved = 0
+        self.max_depth_seen = 0
+        self.overflow_direct = 0 # 队列满时绕过微批、直接单条编码的次数
+        self._wait_ms_total = 0.0
+        self._wait_ms_max = 0.0
+        self._encode_ms_total = 0.0
+        self._batch_size_hist: dict[int, int] = {}
+
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, text: str, timeout: Optional[float] = 30.0) -> np.ndarray:
+        if self._stop.is_set():
+            raise RuntimeError("QueryBatcher is closed")
+        p = _Pending(text=text, enqueued_at=time.perf_counter())
+        try:
+            self._q.put_nowait(p)
+        except queue.Full:
+            # 积压已经到上限：不在这里排队等位，直接单条编码（即没有微批时的行为）
+            with self._stats_lock:
+                self.overflow_direct += 1
+            return np.ascontiguousarray(self.encode_fn([text])[0], dtype=np.float32)
+        depth = self._q.qsize()
+        with self._stats_lock:
+            if depth > self.max_depth_seen:
+                self.max_depth_seen = depth
+        return p.future.result(timeout=timeout)
+
+    def _collect(self) -> list[_Pending]:
+        try:
+            first = self._q.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # 截止时间已过也把队列里现成的请求顺手带上，但不再等待
+                item = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+
+            # 同一批里的重复问题只编码一次
+            uniq: dict[str, int] = {}
+            for p in batch:
+                uniq.setdefault(p.text, len(uniq))
+            texts = list(uniq.keys())
+
+            t0 = time.perf_counter()
+            try:
+                vecs = self.encode_fn(texts)
+            except Exception as e:
+                for p in batch:
+                    p.future.set_exception(e)
+                continue
+            t1 = time.perf_counter()
+
+            for p in batch:
+                v = np.ascontiguousarray(vecs[uniq[p.text]], dtype=np.float32)
+                p.future.set_result(v)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.dedup_saved += len(batch) - len(texts)
+                self._encode_ms_total += (t1 - t0) * 1000
+                self._batch_size_hist[len(batch)] = self._batch_size_hist.get(len(batch), 0) + 1
+                for p in batch:
+                    w = (t0 - p.enqueued_at) * 1000
+                    self._wait_ms_total += w
+                    if w > self._wait_ms_max:
+                        self._wait_ms_max = w
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        # 把还没处理的请求都以异常结束，避免调用方永远阻塞
+        while True:
+            try:
+                p = self._q.get_nowait()
+            except queue.Empty:
+                break
+            p.future.set_exception(RuntimeError("QueryBatcher is closed"))
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._q.qsize(),
+                "max_queue_depth_seen": self.max_depth_seen,
+                "overflow_direct": self.overflow_direct,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_s * 1000,
+                "batches": self.batches,
+                "items": self.items,
+                "dedup_saved": self.dedup_saved,
+                "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+                "avg_wait_ms": (self._wait_ms_total / self.items) if self.items else 0.0,
+                "max_wait_ms_seen": self._wait_ms_max,
+                "avg_encode_ms": (self._encode_ms_total / self.batches) if self.batches else 0.0,
+                "batch_size_hist": dict(sorted(self._batch_size_hist.items())),
+            }
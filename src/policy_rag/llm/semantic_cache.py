@@ -0,0 +1,117 @@
+# 语义近重复问题缓存（/chat）：精确答案缓存查不到时，再看最近回答过的问题里有没有“换个说法的同一个问题”
+# （例如“国奖怎么申请”与“国家奖学金申请流程”）。
+#
+# - 最近的 query 向量放在一块 (max_entries, dim) 的 float32 矩阵里，一次矩阵乘得到与所有缓存问题的 cosine
+# - 只有 scope 完全一致（过滤条件、top_k、模型、prompt 版本、索引代数等，见 answer_scope_key）的条目才参与比较
+# - 容量满了按最近使用时间淘汰；进程内缓存，重启即清空
+from __future__ import annotations
+
+import threading
+from typing import Any, Optional
+
+import numpy as np
+
+from policy_rag.config.settings import Settings
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int = 2048, threshold: float = 0.92):
+        self.max_entries = int(max_entries)
+        self.threshold = float(threshold)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._hit_sim_sum = 0.0
+
+        self._lock = threading.Lock()
+        self._n = 0
+        self._tick = 0
+        self._vecs: Optional[np.ndarray] = None # (max_entries, dim)，首次写入时按维度分配
+        self._scopes = np.empty(self.max_entries, dtype=object)
+        self._last_used = np.zeros(self.max_entries, dtype=np.int64)
+        self._queries: list[str] = [""] * self.max_entries
+        self._payloads: list[Any] = [None] * self.max_entries
+
+    @staticmethod
+    def _unit(vec: np.ndarray) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32).reshape(-1)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def lookup(self, scope: str, query_embedding: np.ndarray) -> Optional[tuple[Any, dict[str, Any]]]:
+        """返回 (payload, {"matched_query", "similarity"})；没有足够相似的同 scope 问题时返回 None。"""
+        q = self._unit(query_embedding)
+        with self._lock:
+            best = self._best_locked(scope, q)
+            if best is None or best[1] < self.threshold:
+                self.misses += 1
+                return None
+            row, sim = best
+            self._tick += 1
+            self._last_used[row] = self._tick
+            self.hits += 1
+            self._hit_sim_sum += sim
+            return self._payloads[row], {"matched_query": self._queries[row], "similarity": sim}
+
+    def put(self, scope: str, query: str, query_embedding: np.ndarray, payload: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        q = self._unit(query_embedding)
+        with self._lock:
+            if self._vecs is None or self._vecs.shape[1] != q.shape[0]:
+                # 首次写入（或换了 embedding 模型）：按维度重新分配
+                self._vecs = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+                self._n = 0
+
+            best = self._best_locked(scope, q)
+            if best is not None and best[1] >= 0.999:
+                row = best[0] # 同一个问题（规范化后几乎相同）：原地更新
+            elif self._n < self.max_entries:
+                row = self._n
+                self._n += 1
+            else:
+                row = int(np.argmin(self._last_used[: self._n]))
+                self.evictions += 1
+
+            self._tick += 1
+            self._vecs[row] = q
+            self._scopes[row] = scope
+            self._last_used[row] = self._tick
+            self._queries[row] = query
+            self._payloads[row] = payload
+
+    def _best_locked(self, scope: str, q: np.ndarray) -> Optional[tuple[int, float]]:
+        if self._vecs is None or self._n == 0 or self._vecs.shape[1] != q.shape[0]:
+            return None
+        rows = np.nonzero(self._scopes[: self._n] == scope)[0]
+        if len(rows) == 0:
+            return None
+        sims = self._vecs[rows] @ q
+        i = int(np.argmax(sims))
+        return int(rows[i]), float(sims[i])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._n = 0
+            self._scopes[:] = None
+            self._payloads = [None] * self.max_entries
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": self._n,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "mean_hit_similarity": (self._hit_sim_sum / self.hits) if self.hits else None,
+        }
+
+def open_semantic_cache(settings: Settings) -> SemanticAnswerCache | None:
+    if not settings.semantic_cache_enabled:
+        return None
+    return SemanticAnswerCache(
+        max_entries=settings.semantic_cache_size,
+        threshold=settings.semantic_cache_threshold,
+    )
@@ -0,0 +1,103 @@
+# 相同问题的请求合并（single-flight）：截止日期通知一发，几十个学生几秒内问同一个问题，
+# 答案缓存只有在第一个回答生成完之后才能命中，这之前的每个请求都会各自检索、各自占用几秒的 LLM。
+# 这里让 key 相同（规范化后的问题、过滤条件、top_k、索引代数等，见 answer_cache_key）的并发请求
+# 只跑一次：第一个请求（leader）真正执行，其余请求（follower）等待同一个结果。
+#
+# - 共享的工作作为独立的 asyncio.Task 运行；每个等待者用 shield 等它，超时 / 断开只影响自己
+# - 所有等待者都离开（超时或断开）时才取消这次工作，避免无人需要的生成继续占用 Ollama
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from policy_rag.config.settings import Settings
+
+T = TypeVar("T")
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+
+        self.leaders = 0
+        self.followers = 0 # = 省下的检索 + LLM 调用次数
+        self.follower_timeouts = 0
+        self.abandoned = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None,
+    ) -> tuple[T, bool]:
+        """
+        执行（或等待正在执行的）fn()，返回 (结果, 是否与别的请求共享)。
+        timeout 是本次调用自己的等待上限（秒），超时抛 TimeoutError，不影响其他等待者。
+        """
+        flight = self._flights.get(key)
+        if flight is not None and flight.task.cancelled():
+            flight = None
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight.task), timeout=timeout)
+        except asyncio.TimeoutError:
+            if shared:
+                self.follower_timeouts += 1
+            self._leave(key, flight)
+            raise
+        except asyncio.CancelledError:
+            self._leave(key, flight)
+            raise
+        flight.waiters -= 1
+        return result, shared
+
+    def _leave(self, key: str, flight: _Flight) -> None:
+        flight.waiters -= 1
+        if flight.waiters <= 0 and not flight.task.done():
+            self.abandoned += 1
+            flight.task.cancel()
+            # 取消要等下一轮事件循环才生效（done 回调也才会触发）：这里立刻移出，之后的同 key 请求重新起一次，
+            # 而不是加入这个正在取消的任务并收到 CancelledError
+            self._forget_key(key, flight)
+
+    def _forget_key(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        self._forget_key(key, flight)
+        # 没有人等待时结果 / 异常不会被取走，这里取一下避免 "exception was never retrieved"
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> dict[str, Any]:
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "calls_saved": self.followers,
+            "saved_rate": (self.followers / total) if total else 0.0,
+            "follower_timeouts": self.follower_timeouts,
+            "abandoned": self.abandoned,
+        }
+
+def open_single_flight(settings: Settings) -> SingleFlight | None:
+    if not settings.coalesce_enabled:
+        return None
+    return SingleFlight()
@@ -0,0 +1,244 @@
+# 发给 LLM 的【SOURCES】组装（问答 /chat、ask 与文档总结共用）
+# 以前每条 source 按字符数截断、没有总预算：top_k=30 时一次要发 ~27k 字，7B 模型的 prefill 非常慢，
+# 超过 num_ctx 的部分还会被 Ollama 静默截掉。这里按 token 预算打包：
+# - 按调用方给定的顺序（检索结果即相关度顺序）依次放入，直到用完预算；单条另有上限
+# - 截断只发生在句子边界（。！？；换行等），一句都放不下时才硬截并以“…”结尾
+# - 相邻 / 重叠的 chunk（邻居扩展、滑窗重叠）里重复出现的句子只保留第一次，省下的预算留给后面的 source
+# - source 编号保持原始位置 [i]（被丢弃的 source 只是不出现），引用 source_id 仍然能对应到第 i 个命中
+#
+# token 计数：CONTEXT_TOKENIZER 指定 HuggingFace tokenizer（本地名称或路径）时用它精确计数，
+# 否则用按字符类别的估算（对 Qwen2.5 / Llama3 这类 BPE 词表略偏保守）。
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Optional, Sequence
+
+from rich.console import Console
+
+from policy_rag.config.settings import Settings
+
+console = Console()
+
+SOURCE_SEPARATOR = "\n\n---\n\n"
+
+# 估算系数：常用汉字约 1.3~1.5 字一个 token；数字逐位切分；英文单词约 4 个字母一个 token；
+# 其余标点 / 符号按 1 个 token 算，空白基本会并进相邻 token
+_CJK_TOKENS_PER_CHAR = 0.75
+_ASCII_LETTERS_PER_TOKEN = 4.0
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_DIGIT_RE = re.compile(r"[0-9]")
+_ALPHA_RE = re.compile(r"[A-Za-z]")
+_SPACE_RE = re.compile(r"\s")
+
+# 句子切分：保留句末标点；换行也视为边界（条款、列表项通常一行一条）
+_SENTENCE_RE = re.compile(r"[^。！？；!?;\n]*(?:[。！？；!?;]+[”’」』）)]*|\n+|$)")
+
+# 太短的句子（“第一条”“一、”之类）不参与跨 source 去重，避免误删
+_DEDUP_MIN_CHARS = 8
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    digits = len(_DIGIT_RE.findall(text))
+    alpha = len(_ALPHA_RE.findall(text))
+    spaces = len(_SPACE_RE.findall(text))
+    other = len(text) - cjk - digits - alpha - spaces
+    return int(cjk * _CJK_TOKENS_PER_CHAR + digits + alpha / _ASCII_LETTERS_PER_TOKEN + other + 0.999)
+
+@lru_cache(maxsize=4)
+def get_token_counter(tokenizer_name: str = "") -> tuple[str, Callable[[str], int]]:
+    """返回 (计数方式名称, 计数函数)。tokenizer 加载失败时退回估算，不影响服务。"""
+    if not tokenizer_name:
+        return "estimate", estimate_tokens
+    try:
+        from transformers import AutoTokenizer
+
+        tok = AutoTokenizer.from_pretrained(tokenizer_name, local_files_only=True)
+    except Exception as e:
+        console.print(f"[yellow]WARN[/yellow] CONTEXT_TOKENIZER={tokenizer_name!r} unavailable ({e}); using estimate")
+        return "estimate", estimate_tokens
+    return tokenizer_name, lambda s: len(tok.encode(s, add_special_tokens=False)) if s else 0
+
+def split_sentences(text: str) -> list[str]:
+    out: list[str] = []
+    for s in _SENTENCE_RE.findall(text):
+        if s.strip():
+            out.append(s)
+        elif s and out:
+            out[-1] += s # 句末标点后的换行并回上一句，保留原文排版
+    return out
+
+def _sentence_key(sentence: str) -> str:
+    return re.sub(r"\s+", "", sentence)
+
+def source_header(i: int, md: dict[str, Any]) -> str:
+    """第 i 条 source 在 SOURCES 里的标题行；map-reduce 分组时也用它估算每条 source 的 token 开销。"""
+    did = str(md.get("doc_id", "") or "")
+    title = str(md.get("title", "") or "")
+    page = md.get("page_number", "")
+    sec = str(md.get("section_path", "") or "")
+    return f"[{i}] doc_id={did} title={title} page={page} section={sec}".strip()
+
+@dataclass
+class PackedContext:
+    text: str
+    source_ids: list[int] # 实际放入的 source 编号（1-based，对应输入顺序）
+    tokens: int
+    budget: int
+    counter: str
+    n_input: int
+    truncated: int = 0
+    dropped: int = 0
+    deduped_sentences: int = 0
+    dropped_ids: list[int] = field(default_factory=list)
+
+    def info(self) -> dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "counter": self.counter,
+            "sources_in": self.n_input,
+            "sources_packed": len(self.source_ids),
+            "truncated": self.truncated,
+            "dropped": self.dropped,
+            "dropped_ids": self.dropped_ids,
+            "deduped_sentences": self.deduped_sentences,
+        }
+
+def _hard_cut(sentence: str, allowance: int, count: Callable[[str], int]) -> str:
+    # 一句都放不下：二分找能放下的最长前缀
+    lo, hi = 0, len(sentence)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(sentence[:mid].rstrip() + "…") <= allowance:
+            lo = mid
+        else:
+            hi = mid - 1
+    return sentence[:lo].rstrip() + "…" if lo else ""
+
+def pack_sources(
+    sources: Sequence[tuple[str, Optional[dict[str, Any]]]],
+    budget_tokens: int,
+    max_tokens_per_source: int,
+    min_tokens_per_source: int = 48,
+    count: Optional[Callable[[str], int]] = None,
+    counter_name: str = "estimate",
+) -> PackedContext:
+    """
+    sources: [(text, metadata), ...]，按相关度从高到低（或调用方希望的优先级）排列。
+    budget_tokens 是整个【SOURCES】段的预算（含每条的标题行与分隔符）。
+    """
+    count = count or estimate_tokens
+    sep_tokens = count(SOURCE_SEPARATOR)
+    seen: set[str] = set()
+
+    blocks: list[str] = []
+    packed = PackedContext(text="", source_ids=[], tokens=0, budget=int(budget_tokens), counter=counter_name, n_input=len(sources))
+    remaining = int(budget_tokens)
+
+    for i, (text, md) in enumerate(sources, start=1):
+        header = source_header(i, md or {})
+        overhead = count(header) + 1 + (sep_tokens if blocks else 0)
+        allowance = min(int(max_tokens_per_source), remaining - overhead)
+        if allowance < min_tokens_per_source:
+            packed.dropped += 1
+            packed.dropped_ids.append(i)
+            continue
+
+        kept: list[str] = []
+        used = 0
+        gap = False # 上一句因重复被跳过：用“…”标出不连续，避免模型把两段当成连续原文引用
+        cut = False
+        n_dup = 0
+        for sent in split_sentences((text or "").strip()):
+            key = _sentence_key(sent)
+            if len(key) >= _DEDUP_MIN_CHARS and key in seen:
+                n_dup += 1
+                gap = True
+                continue
+            piece = ("…" + sent) if gap and kept else sent
+            t = count(piece)
+            if used + t > allowance:
+                if not kept:
+                    piece = _hard_cut(piece, allowance, count)
+                    if piece:
+                        kept.append(piece)
+                        used += count(piece)
+                cut = True
+                break
+            kept.append(piece)
+            used += t
+            gap = False
+
+        if not kept:
+            # 全部是前面已经出现过的句子（或一字都放不下）
+            packed.dropped += 1
+            packed.dropped_ids.append(i)
+            packed.deduped_sentences += n_dup
+            continue
+
+        body = "".join(kept).strip()
+        if cut and not body.endswith("…"):
+            body += "…"
+        for sent in kept:
+            key = _sentence_key(sent.lstrip("…"))
+            if len(key) >= _DEDUP_MIN_CHARS:
+                seen.add(key)
+
+        block = header + "\n" + body
+        cost = count(block) + (sep_tokens if blocks else 0)
+        blocks.append(block)
+        remaining -= cost
+        packed.tokens += cost
+        packed.source_ids.append(i)
+        packed.truncated += int(cut)
+        packed.deduped_sentences += n_dup
+
+    packed.text = SOURCE_SEPARATOR.join(blocks)
+    return packed
+
+def output_reserve(settings: Settings) -> int:
+    """
+    为输出预留的 token：每次请求都允许模型生成 num_predict 个 token，预留少于它时
+    prompt + 输出会超过 num_ctx，Ollama 会截掉 prompt 开头，所以取两者的较大者。
+    """
+    return max(settings.context_reserve_output_tokens, settings.ollama_num_predict)
+
+def context_budget(settings: Settings, *prompt_parts: str, limit: Optional[int] = None) -> int:
+    """
+    【SOURCES】段可用的 token 数：不超过 limit（默认 CONTEXT_TOKEN_BUDGET），并且
+    prompt 其余部分 + SOURCES + 预留给输出的 token 要放得进 num_ctx。
+    """
+    _, count = get_token_counter(settings.context_tokenizer)
+    fixed = sum(count(p) for p in prompt_parts)
+    room = settings.ollama_num_ctx - output_reserve(settings) - fixed
+    return max(0, min(settings.context_token_budget if limit is None else limit, room))
+
+def pack_for_prompt(
+    settings: Settings,
+    sources: Sequence[tuple[str, Optional[dict[str, Any]]]],
+    *prompt_parts: str,
+) -> PackedContext:
+    """按 Settings 的预算打包；prompt_parts 是同一次调用里除 SOURCES 以外的 prompt 文本（system、模板等）。"""
+    name, count = get_token_counter(settings.context_tokenizer)
+    return pack_sources(
+        sources,
+        budget_tokens=context_budget(settings, *prompt_parts),
+        max_tokens_per_source=settings.context_max_tokens_per_source,
+        count=count,
+        counter_name=name,
+    )
+
+def context_signature(settings: Settings) -> dict[str, Any]:
+    """影响打包结果的配置项；答案缓存把它放进 key。"""
+    return {
+        "budget": settings.context_token_budget,
+        "per_source": settings.context_max_tokens_per_source,
+        "num_ctx": settings.ollama_num_ctx,
+        "reserve_output": output_reserve(settings),
+        "tokenizer": settings.context_tokenizer,
+    }
@@ -0,0 +1,295 @@
+# 长文档的 map-reduce 总结（/doc/{doc_id}/summary 与 summarize 命令共用）
+# 单次总结只取每页最长的一个 chunk、最多 max_sources 页，再按 token 预算截断：几十页的制度实际只看到前面一部分。
+# map-reduce 模式：
+# - 该文档的全部 chunk 按 (页码, 页内序号) 排好，顺序切成若干组，每组放得进一次调用的 SOURCES 预算
+# - 每组各调用一次 LLM 抽取速览卡片要点（调用方并发执行，同时在跑的数量由 SUMMARY_MAP_CONCURRENCY 限制）
+# - reduce 不再调用 LLM：各组的 StructuredAnswer 按字段合并，组内 source_id 换算成全文档统一的编号，
+#   文本相同或近似的要点合并成一条，citations 取并集
+# 覆盖率按 map 成功的组所含的 chunk / 页计算；失败的组不会让整个总结失败，只体现在覆盖率和 warnings 里。
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from policy_rag.config.settings import Settings
+from policy_rag.llm.llm_client import ChatMessage
+from policy_rag.prompts.context_packer import (
+    SOURCE_SEPARATOR,
+    PackedContext,
+    context_budget,
+    get_token_counter,
+    pack_sources,
+    source_header,
+)
+from policy_rag.prompts.policy_card_prompt import MAP_USER_TEMPLATE, SYSTEM_PROMPT
+from policy_rag.schemas.structured_answer import ITEM_SECTIONS, Citation, Item, StructuredAnswer
+from policy_rag.utils.json_extract import extract_first_json
+
+# 两条要点的字符 bigram Jaccard 达到这个值就视为同一条（不同组对同一条款的转述通常只差几个字）
+_NEAR_DUP_JACCARD = 0.75
+
+_CONFIDENCE_RANK = {"low": 0, "medium": 1, "high": 2}
+_NORM_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+def _page_of(md: dict[str, Any]) -> Optional[int]:
+    try:
+        return int(md.get("page_number"))
+    except Exception:
+        return None
+
+def _int_or(md: dict[str, Any], key: str, default: int) -> int:
+    try:
+        return int(md.get(key))
+    except Exception:
+        return default
+
+def order_chunks(ids: list[str], documents: list[str], metadatas: list[dict]) -> list[dict]:
+    """文档的全部 chunk，按 (页码, 页内序号, 起始字符) 排成原文顺序；空 chunk 与完全重复的 chunk 去掉。"""
+    seen: set[str] = set()
+    out: list[dict] = []
+    for cid, doc, md in zip(ids, documents, metadatas):
+        text = str(doc or "").strip()
+        if not text or text in seen:
+            continue
+        seen.add(text)
+        out.append({"chunk_id": cid, "text": text, "md": md or {}})
+
+    big = 1 << 30
+    out.sort(key=lambda it: (
+        _page_of(it["md"]) if _page_of(it["md"]) is not None else big,
+        _int_or(it["md"], "chunk_index", big),
+        _int_or(it["md"], "char_start", big),
+    ))
+    return out
+
+def _format_pages(pages: list[int]) -> str:
+    if not pages:
+        return "未知"
+    spans: list[str] = []
+    start = prev = pages[0]
+    for p in pages[1:] + [None]:
+        if p is not None and p == prev + 1:
+            prev = p
+            continue
+        spans.append(str(start) if start == prev else f"{start}-{prev}")
+        if p is not None:
+            start = prev = p
+    return ", ".join(spans)
+
+@dataclass
+class MapGroup:
+    index: int # 0-based
+    members: list[int] # 组内第 i 条 source（1-based）= chunks[members[i - 1]]
+    pages: list[int]
+    packed: PackedContext
+    messages: list[ChatMessage]
+
+    def info(self) -> dict[str, Any]:
+        return {"group": self.index + 1, "chunks": len(self.members), "pages": _format_pages(self.pages), **self.packed.info()}
+
+def plan_groups(settings: Settings, meta, chunks: list[dict]) -> list[MapGroup]:
+    """
+    按原文顺序把 chunk 贪心装进若干组：每组的 SOURCES 不超过 SUMMARY_MAP_TOKEN_BUDGET（且放得进 num_ctx）。
+    单条 chunk 自身超过预算时单独成组，由 pack_sources 在句子边界截断。
+    """
+    name, count = get_token_counter(settings.context_tokenizer)
+    budget = context_budget(settings, SYSTEM_PROMPT, MAP_USER_TEMPLATE, meta.title, limit=settings.summary_map_token_budget)
+    sep = count(SOURCE_SEPARATOR)
+
+    spans: list[list[int]] = []
+    cur: list[int] = []
+    used = 0
+    for pos, it in enumerate(chunks):
+        body = count(it["text"]) + 1
+        cost = count(source_header(len(cur) + 1, it["md"])) + body + (sep if cur else 0)
+        if cur and used + cost > budget:
+            spans.append(cur)
+            cur, used = [], 0
+            cost = count(source_header(1, it["md"])) + body
+        cur.append(pos)
+        used += cost
+    if cur:
+        spans.append(cur)
+
+    groups: list[MapGroup] = []
+    for gi, members in enumerate(spans):
+        srcs = [(chunks[p]["text"], chunks[p]["md"]) for p in members]
+        # 组已按预算切好，单条上限放开到整组预算：组内只会因为重叠句去重而变短
+        packed = pack_sources(srcs, budget_tokens=budget, max_tokens_per_source=budget, count=count, counter_name=name)
+        pages = sorted({p for p in (_page_of(md) for _, md in srcs) if p is not None})
+        user_prompt = MAP_USER_TEMPLATE.format(
+            doc_id=meta.doc_id,
+            title=meta.title,
+            category=meta.category,
+            publish_date=meta.publish_date,
+            effective_date=meta.effective_date,
+            status=meta.status,
+            part=gi + 1,
+            parts=len(spans),
+            pages=_format_pages(pages),
+            sources=packed.text,
+        )
+        messages = [
+            ChatMessage(role="system", content=SYSTEM_PROMPT),
+            ChatMessage(role="user", content=user_prompt),
+        ]
+        groups.append(MapGroup(index=gi, members=members, pages=pages, packed=packed, messages=messages))
+    return groups
+
+@dataclass
+class MapResult:
+    group: MapGroup
+    answer: Optional[StructuredAnswer] = None # 模型拒绝时是空的 StructuredAnswer
+    refused: bool = False
+    error: str = ""
+    elapsed_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.answer is not None
+
+    def info(self) -> dict[str, Any]:
+        out: dict[str, Any] = {"group": self.group.index + 1, "ok": self.ok, "refused": self.refused, "ms": self.elapsed_ms}
+        if self.error:
+            out["error"] = self.error
+        return out
+
+def parse_partial(raw: str, title: str) -> tuple[StructuredAnswer, bool]:
+    """解析一组的输出，返回 (要点, 是否拒绝)。格式不对时抛 ValueError（pydantic 的 ValidationError 也是）。"""
+    obj = extract_first_json(raw)
+    if isinstance(obj, dict) and obj.get("refusal") is True:
+        # 这一部分没有可总结的内容（目录、附件表格等），当作空结果
+        return StructuredAnswer(question=title), True
+    return StructuredAnswer.model_validate(obj), False
+
+def _norm(text: str) -> str:
+    return _NORM_RE.sub("", text).lower()
+
+def _bigrams(s: str) -> set[str]:
+    return {s[i:i + 2] for i in range(len(s) - 1)} if len(s) > 1 else {s}
+
+def _similar(a: tuple[str, set[str]], b: tuple[str, set[str]]) -> bool:
+    if a[0] == b[0]:
+        return True
+    inter = len(a[1] & b[1])
+    return inter / (len(a[1]) + len(b[1]) - inter) >= _NEAR_DUP_JACCARD
+
+def _merge_item(into: Item, other: Item) -> None:
+    seen = {(c.source_id, _norm(c.quote)) for c in into.citations}
+    for c in other.citations:
+        k = (c.source_id, _norm(c.quote))
+        if k not in seen:
+            seen.add(k)
+            into.citations.append(c)
+    # 保留置信度更高的表述；相同时保留更完整（更长）的一条
+    ra, rb = _CONFIDENCE_RANK[into.confidence], _CONFIDENCE_RANK[other.confidence]
+    if rb > ra or (rb == ra and len(other.text) > len(into.text)):
+        into.text = other.text
+        into.confidence = other.confidence
+
+def _union_strings(lists: list[list[str]]) -> list[str]:
+    out: list[str] = []
+    seen: set[str] = set()
+    for xs in lists:
+        for x in xs:
+            k = _norm(x)
+            if k and k not in seen:
+                seen.add(k)
+                out.append(x)
+    return out
+
+def merge_partials(results: list[MapResult], title: str) -> tuple[StructuredAnswer, dict[str, Any]]:
+    """
+    reduce：把各组的 StructuredAnswer 合并成一份。
+    citations 的 source_id 换算成 chunks 列表里的位置（1-based）；越界的引用丢掉，没有引用剩下的要点也丢掉。
+    """
+    merged = StructuredAnswer(question=title)
+    items_in = citations_dropped = items_dropped = 0
+
+    for section in ITEM_SECTIONS:
+        kept: list[tuple[Item, tuple[str, set[str]]]] = []
+        for r in results:
+            if r.answer is None:
+                continue
+            members = r.group.members
+            for it in getattr(r.answer, section):
+                items_in += 1
+                cits = []
+                for c in it.citations:
+                    if 1 <= c.source_id <= len(members):
+                        cits.append(Citation(source_id=members[c.source_id - 1] + 1, quote=c.quote))
+                    else:
+                        citations_dropped += 1
+                if not cits:
+                    items_dropped += 1
+                    continue
+                item = Item(text=it.text, citations=cits, confidence=it.confidence)
+                n = _norm(item.text)
+                sig = (n, _bigrams(n))
+                for prev, prev_sig in kept:
+                    if _similar(sig, prev_sig):
+                        _merge_item(prev, item)
+                        break
+                else:
+                    kept.append((item, sig))
+        setattr(merged, section, [it for it, _ in kept])
+
+    ok = [r.answer for r in results if r.answer is not None]
+    merged.uncertainties = _union_strings([a.uncertainties for a in ok])
+    merged.follow_up_questions = _union_strings([a.follow_up_questions for a in ok])
+    merged.warnings = _union_strings([a.warnings for a in ok])
+
+    items_out = sum(len(getattr(merged, s)) for s in ITEM_SECTIONS)
+    stats = {
+        "items_in": items_in,
+        "items_out": items_out,
+        "duplicates_merged": items_in - items_dropped - items_out,
+        "items_dropped": items_dropped,
+        "citations_dropped": citations_dropped,
+    }
+    return merged, stats
+
+def cited_positions(answer: StructuredAnswer) -> list[int]:
+    """合并结果里被引用到的 chunk 位置（0-based，升序）。"""
+    return sorted({c.source_id - 1 for s in ITEM_SECTIONS for it in getattr(answer, s) for c in it.citations})
+
+def coverage(chunks: list[dict], results: list[MapResult]) -> dict[str, Any]:
+    """map 成功的组覆盖了文档的多少（按 chunk 数、字符数、页码）。"""
+    covered = {p for r in results if r.ok for p in r.group.members}
+    all_pages = sorted({p for p in (_page_of(it["md"]) for it in chunks) if p is not None})
+    covered_pages = {p for r in results if r.ok for p in r.group.pages}
+    total_chars = sum(len(it["text"]) for it in chunks)
+    covered_chars = sum(len(chunks[p]["text"]) for p in covered)
+    return {
+        "chunks_total": len(chunks),
+        "chunks_covered": len(covered),
+        "pages_total": len(all_pages),
+        "pages_covered": len(covered_pages),
+        "missing_pages": _format_pages([p for p in all_pages if p not in covered_pages]) if len(covered_pages) < len(all_pages) else "",
+        "char_ratio": (covered_chars / total_chars) if total_chars else 0.0,
+        "groups_ok": sum(1 for r in results if r.ok),
+        "groups_failed": sum(1 for r in results if not r.ok),
+    }
+
+def stage_timings(
+    results: list[MapResult],
+    prepare_ms: float,
+    map_ms: float,
+    reduce_ms: float,
+    total_ms: float,
+    concurrency: int,
+) -> dict[str, Any]:
+    """各阶段耗时（毫秒）：map_ms 是整个 map 阶段的墙钟时间，map_call_ms_sum 是各组调用耗时之和。"""
+    calls = [r.elapsed_ms for r in results]
+    return {
+        "prepare_ms": prepare_ms,
+        "map_ms": map_ms,
+        "map_calls": len(calls),
+        "map_concurrency": concurrency,
+        "map_call_ms_max": max(calls) if calls else 0.0,
+        "map_call_ms_sum": sum(calls),
+        "reduce_ms": reduce_ms,
+        "total_ms": total_ms,
+        "per_group": [r.info() for r in results],
+    }
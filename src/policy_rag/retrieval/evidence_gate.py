@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 from dataclasses import dataclass
 from statistics import median
 from typing import Any, Optional
@@ -18,10 +19,12 @@ def assess_evidence(
     good_hit_max_dist: float,
     min_good_hits: int,
     min_gap: float,
+    min_fused_top1: Optional[float] = None,
 ) -> EvidenceDecision:
     """
     hits: list of RetrievedChunk (needs .distance and .metadata)
     distance: smaller is better
+    min_fused_top1: 混合检索时，top1 的归一化融合分达到该值即视为强命中（向量距离偏大也放行规则1）
     """
     reasons: list[str] = []
     suggestions: list[str] = []
@@ -38,7 +41,8 @@ def assess_evidence(
             stats={},
         )
     
-    dists = [float(h.distance) for h in hits if h.distance is not None]
+    # 混合检索里只被 BM25 召回的 chunk 没有向量距离（NaN），距离类规则只看有距离的命中
+    dists = [float(h.distance) for h in hits if h.distance is not None and not math.isnan(h.distance)]
     if not dists:
         return EvidenceDecision(
             ok=False,
@@ -50,7 +54,7 @@ def assess_evidence(
             stats={},
         )
     
-    top1 = dists[0]
+    top1 = min(dists)
     med = median(dists)
     gap = med - top1
 
@@ -72,8 +76,12 @@ def assess_evidence(
             except Exception:
                 pass
 
-    # 规则1：top1 必须足够近
-    if top1 > top1_max_dist:
+    # 混合检索：两路都把 top1 排在最前面，说明既语义相近又命中了精确术语
+    fused_top1 = getattr(hits[0], "fused_score", None)
+    fused_strong = min_fused_top1 is not None and fused_top1 is not None and fused_top1 >= min_fused_top1
+
+    # 规则1：top1 必须足够近（或混合检索下是强命中）
+    if top1 > top1_max_dist and not fused_strong:
         reasons.append(f"最相关证据的距离偏大（top1 distance={top1:.4f} > {top1_max_dist:.4f}），相关性可能不足")
         suggestions.append("尝试把问题改得更具体：加入制度名称/奖项名称/身份/年份/关键条件等")
 
@@ -106,16 +114,21 @@ def assess_evidence(
             seen.add(s)
             uniq_sugs.append(s)
 
+    stats: dict[str, Any] = {
+        "top1": top1,
+        "median": med,
+        "gap": gap,
+        "good_hits": good_hits,
+        "uniq_docs": len(uniq_docs),
+        "uniq_pages": len(uniq_pages),
+    }
+    if fused_top1 is not None:
+        stats["fused_top1"] = fused_top1
+        stats["lexical_hits"] = sum(1 for h in hits if getattr(h, "lexical_score", None) is not None)
+
     return EvidenceDecision(
         ok=ok,
         reasons=reasons,
         suggestions=uniq_sugs,
-        stats={
-            "top1": top1,
-            "median": med,
-            "gap": gap,
-            "good_hits": good_hits,
-            "uniq_docs": len(uniq_docs),
-            "uniq_pages": len(uniq_pages),
-        },
+        stats=stats,
     )
\ No newline at end of file
@@ -0,0 +1,126 @@
+# 邻居上下文扩展：命中把条款截成两半时，按邻接索引把前后 ±N 个 chunk 接到命中两侧
+# 邻居关系查 AdjacencyIndex（O(1)），正文用一次 store.get(ids=...) 批量取回，不做额外的向量查询
+from __future__ import annotations
+
+from dataclasses import replace
+from typing import Any
+
+from policy_rag.index.adjacency import AdjacencyIndex
+from policy_rag.index.base import VectorStore
+from policy_rag.retrieval.merge import join_overlapping
+from policy_rag.retrieval.retriever import RetrievedChunk
+
+def _member_ids(h: RetrievedChunk) -> list[str]:
+    # 合并过的命中（见 merge.py）按位置顺序记录了组成它的 chunk
+    return list((h.metadata or {}).get("merged_chunk_ids") or [h.chunk_id])
+
+def _join(pieces: list[tuple[int, int, int, str]]) -> str:
+    # pieces: (page, char_start, char_end, text)，已按文档顺序排列；同页相邻的按重叠拼接，跨页换行拼接
+    page, _, cur_end, text = pieces[0]
+    for p, s, e, t in pieces[1:]:
+        if p == page and e <= cur_end:
+            continue
+        text = join_overlapping(text, t, cur_end - s) if p == page else text + "\n" + t
+        page, cur_end = p, e
+    return text
+
+def expand_hits_with_neighbors(
+    hits: list[RetrievedChunk],
+    adjacency: AdjacencyIndex,
+    store: VectorStore,
+    n_neighbors: int = 1,
+    max_chars: int = 1800,
+) -> tuple[list[RetrievedChunk], dict[str, Any]]:
+    """
+    每个命中向前、向后交替各扩展最多 n_neighbors 个 chunk，扩展后单段文本不超过 max_chars。
+    已经出现在其它命中里的 chunk 不会重复接入。
+    """
+    used: set[str] = {cid for h in hits for cid in _member_ids(h)}
+    plans: list[tuple[list[str], list[str]]] = []
+    wanted: set[str] = set()
+    for h in hits:
+        members = _member_ids(h)
+        before, _ = adjacency.neighbors(members[0], n_neighbors)
+        _, after = adjacency.neighbors(members[-1], n_neighbors)
+        # 邻居已被别的命中占用时，这一侧就停在那里（保持文本连续）
+        before = _take_until_used(before, used)
+        after = _take_until_used(after, used)
+        plans.append((before, after))
+        wanted.update(before)
+        wanted.update(after)
+
+    texts: dict[str, str] = {}
+    if wanted:
+        got = store.get(ids=sorted(wanted), limit=len(wanted))
+        texts = {cid: str(doc or "") for cid, doc in zip(got.get("ids") or [], got.get("documents") or [])}
+
+    out: list[RetrievedChunk] = []
+    n_added = 0
+    for h, (before, after) in zip(hits, plans):
+        md = h.metadata or {}
+        try:
+            own = (int(md["page_number"]), int(md["char_start"]), int(md["char_end"]), h.text)
+        except (KeyError, TypeError, ValueError):
+            out.append(h)
+            continue
+
+        left: list[tuple[int, int, int, str]] = []
+        right: list[tuple[int, int, int, str]] = []
+        text = h.text
+        bi = ai = 0
+        # 前后交替扩展：前1、后1、前2、后2……某一侧超预算或断开就只扩另一侧
+        while bi < len(before) or ai < len(after):
+            progressed = False
+            for side in ("before", "after"):
+                ids, idx = (before, bi) if side == "before" else (after, ai)
+                if idx >= len(ids) or ids[idx] in used or ids[idx] not in texts:
+                    continue
+                pos = adjacency.position(ids[idx])
+                if pos is None:
+                    continue
+                piece = (pos["page_number"], pos["char_start"], pos["char_end"], texts[ids[idx]])
+                cand_left = [piece] + left if side == "before" else left
+                cand_right = right + [piece] if side == "after" else right
+                cand_text = _join(cand_left + [own] + cand_right)
+                if len(cand_text) > max_chars:
+                    # 这一侧超预算：停止这一侧
+                    if side == "before":
+                        bi = len(before)
+                    else:
+                        ai = len(after)
+                    continue
+                left, right, text = cand_left, cand_right, cand_text
+                used.add(ids[idx])
+                if side == "before":
+                    bi += 1
+                else:
+                    ai += 1
+                progressed = True
+            if not progressed:
+                break
+
+        if not left and not right:
+            out.append(h)
+            continue
+
+        n_added += len(left) + len(right)
+        pieces = left + [own] + right
+        new_md = dict(md)
+        new_md["expanded_chunk_ids"] = [cid for cid in before[: len(left)]][::-1] + after[: len(right)]
+        if all(p[0] == own[0] for p in pieces):
+            new_md["char_start"] = min(p[1] for p in pieces)
+            new_md["char_end"] = max(p[2] for p in pieces)
+        else:
+            new_md["pages"] = sorted({p[0] for p in pieces})
+        out.append(replace(h, text=text, metadata=new_md))
+
+    info = {"n_neighbors": n_neighbors, "max_chars": max_chars, "added_chunks": n_added}
+    return out, info
+
+def _take_until_used(ids: list[str], used: set[str]) -> list[str]:
+    out: list[str] = []
+    for cid in ids:
+        if cid in used:
+            break
+        out.append(cid)
+    return out
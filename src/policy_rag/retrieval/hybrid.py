@@ -0,0 +1,81 @@
+# 混合检索：稠密向量 top-N + BM25 词面 top-N，用 reciprocal-rank fusion（RRF）合并
+# RRF 只看名次、不看原始分数，两路分数量纲不同（L2 距离 vs BM25）也能直接融合
+from __future__ import annotations
+
+import math
+from typing import Any, Optional
+
+from policy_rag.index.base import VectorStore
+from policy_rag.index.lexical_index import LexicalIndex
+from policy_rag.retrieval.retriever import RetrievedChunk, retrieve_top_k
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> dict[str, float]:
+    """score(d) = Σ 1 / (k + rank_i(d))，rank 从 1 开始；没出现在某一路里的不计分。"""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    return scores
+
+def retrieve_hybrid(
+    store: VectorStore,
+    lexical: LexicalIndex,
+    query: str,
+    model_name: str,
+    top_k: int = 8,
+    where: Optional[dict[str, Any]] = None,
+    candidates: int = 50,
+    rrf_k: int = 60,
+) -> list[RetrievedChunk]:
+    """
+    两路各取 candidates 个候选，RRF 融合后取前 top_k。
+    fused_score 按“两路都排第一”的满分归一化到 0~1，证据门控可以直接设阈值。
+    """
+    n = max(top_k, candidates)
+    dense = retrieve_top_k(store, query, model_name, top_k=n, where=where)
+    lex = lexical.search(query, top_k=n, where=where)
+
+    fused = reciprocal_rank_fusion([[h.chunk_id for h in dense], [cid for cid, _ in lex]], k=rrf_k)
+    max_score = 2.0 / (rrf_k + 1)
+    ranking = sorted(fused, key=lambda cid: fused[cid], reverse=True)
+
+    by_id = {h.chunk_id: h for h in dense}
+    lex_scores = dict(lex)
+
+    out: list[RetrievedChunk] = []
+    pos = 0
+    while len(out) < top_k and pos < len(ranking):
+        # 每次按还差的条数往后取一段；词面索引比向量库新/旧（例如只重建了其中一个）时对不上的 chunk 被跳过，
+        # 由后面的候选补位，不会因此少于 top_k 条
+        window = ranking[pos : pos + top_k - len(out)]
+        pos += len(window)
+
+        # 只出现在词面通道里的 chunk 需要从向量库补回正文和 metadata
+        missing = [cid for cid in window if cid not in by_id]
+        extra: dict[str, tuple[str, dict[str, Any]]] = {}
+        if missing:
+            got = store.get(ids=missing, limit=len(missing))
+            for cid, doc, md in zip(got.get("ids") or [], got.get("documents") or [], got.get("metadatas") or []):
+                extra[cid] = (str(doc or ""), md or {})
+
+        for cid in window:
+            h = by_id.get(cid)
+            if h is not None:
+                text, md, dist = h.text, h.metadata, h.distance
+            elif cid in extra:
+                text, md = extra[cid]
+                dist = math.nan
+            else:
+                continue
+            out.append(
+                RetrievedChunk(
+                    rank=len(out) + 1,
+                    chunk_id=cid,
+                    distance=dist,
+                    text=text,
+                    metadata=md,
+                    fused_score=fused[cid] / max_score,
+                    lexical_score=lex_scores.get(cid),
+                )
+            )
+    return out
@@ -0,0 +1,157 @@
+# 检索后的去重与相邻 chunk 合并
+# chunk_text_by_chars 以 150 字重叠切块，top-k 里经常出现同一页相邻、内容大段重复的 chunk，
+# 直接拼进 prompt 既浪费 token，也挤掉了其它条款。这里按 metadata 里的 (doc_id, page_number, char_start/char_end)
+# 把重叠或首尾相接的命中合成一段连续文本，腾出来的名额按原排序由后续的不重复命中补上。
+from __future__ import annotations
+
+from dataclasses import dataclass, field, replace
+from typing import Any, Optional
+
+from policy_rag.retrieval.retriever import RetrievedChunk
+
+def _span_of(h: RetrievedChunk) -> Optional[tuple[str, Any, int, int]]:
+    md = h.metadata or {}
+    try:
+        return str(md["doc_id"]), md["page_number"], int(md["char_start"]), int(md["char_end"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def join_overlapping(left: str, right: str, overlap: int) -> str:
+    """
+    把两段在原页文本中重叠 overlap 个字符的 chunk 拼成一段。
+    chunk 文本做过 strip，实际重叠长度可能差一两个字符，先在 overlap 附近找首尾能对上的长度。
+    """
+    if overlap <= 0:
+        return left + "\n" + right
+    upper = min(len(left), len(right), overlap + 2)
+    for k in range(upper, max(0, overlap - 2) - 1, -1):
+        if k > 0 and left.endswith(right[:k]):
+            return left + right[k:]
+    # 对不上（例如文本被清洗过）就退回按偏移量裁掉 right 的重叠部分
+    return left + right[min(overlap, len(right)):]
+
+@dataclass
+class _Span:
+    key: tuple[str, Any]
+    start: int
+    end: int
+    members: list[RetrievedChunk] = field(default_factory=list)
+
+    def touches(self, start: int, end: int) -> bool:
+        # 重叠或首尾相接（end == start）都算连续
+        return start <= self.end and end >= self.start
+
+def _span_text(members: list[RetrievedChunk]) -> tuple[str, int, int]:
+    ordered = sorted(members, key=lambda h: int(h.metadata["char_start"]))
+    text = ordered[0].text
+    cur_end = int(ordered[0].metadata["char_end"])
+    start = int(ordered[0].metadata["char_start"])
+    for h in ordered[1:]:
+        s, e = int(h.metadata["char_start"]), int(h.metadata["char_end"])
+        if e <= cur_end:
+            continue  # 完全被已有文本覆盖
+        text = join_overlapping(text, h.text, cur_end - s)
+        cur_end = e
+    return text, start, cur_end
+
+def merge_overlapping_hits(
+    hits: list[RetrievedChunk],
+    top_k: int,
+    max_span_chars: int = 3000,
+) -> tuple[list[RetrievedChunk], dict[str, Any]]:
+    """
+    hits 按相关性从高到低排列（可以多于 top_k，多出来的用于补位）。
+    返回最多 top_k 个互不重叠的命中（合并后的 chunk 沿用组内最相关那条的 chunk_id/分数）与统计信息。
+    """
+    spans: list[_Span] = []
+    singles: list[RetrievedChunk] = []
+    # 输出顺序：按每个 span / 单条命中第一次出现的名次
+    order: list[tuple[str, int]] = []
+    seen_ids: set[str] = set()
+    seen_texts: set[str] = set()
+    n_merged = 0
+    n_dupes = 0
+
+    for h in hits:
+        if len(order) >= top_k:
+            # 名额已满：更靠后的相邻命中也不再并入，避免 prompt 反而变长
+            break
+        if h.chunk_id in seen_ids or h.text in seen_texts:
+            n_dupes += 1
+            continue
+
+        sp = _span_of(h)
+        target: Optional[_Span] = None
+        if sp is not None:
+            did, page, s, e = sp
+            for span in spans:
+                if span.members and span.key == (did, page) and span.touches(s, e):
+                    if max(span.end, e) - min(span.start, s) <= max_span_chars:
+                        target = span
+                    break
+
+        if target is not None:
+            # 命中与已选中的片段重叠：并进去，不占新名额
+            target.members.append(h)
+            target.start = min(target.start, sp[2])
+            target.end = max(target.end, sp[3])
+            n_merged += 1
+            # 新命中可能把两个原本不相连的片段接上：把其它相连片段也并进来，并让出它们的名额；
+            # 按累积后的总跨度检查上限，链式合并 A∪B∪C 也不会超过 max_span_chars
+            changed = True
+            while changed:
+                changed = False
+                for j, other in enumerate(spans):
+                    if other is target or not other.members or other.key != target.key:
+                        continue
+                    if not other.touches(target.start, target.end):
+                        continue
+                    start, end = min(target.start, other.start), max(target.end, other.end)
+                    if end - start > max_span_chars:
+                        continue  # 并进来会超出上限：保持为独立片段
+                    target.members.extend(other.members)
+                    target.start, target.end = start, end
+                    other.members = []
+                    order.remove(("span", j))
+                    changed = True
+        elif sp is not None:
+            spans.append(_Span(key=(sp[0], sp[1]), start=sp[2], end=sp[3], members=[h]))
+            order.append(("span", len(spans) - 1))
+        else:
+            singles.append(h)
+            order.append(("single", len(singles) - 1))
+
+        seen_ids.add(h.chunk_id)
+        seen_texts.add(h.text)
+
+    out: list[RetrievedChunk] = []
+    for kind, i in order:
+        if kind == "single":
+            h = singles[i]
+        else:
+            members = spans[i].members
+            best = members[0]
+            if len(members) == 1:
+                h = best
+            else:
+                text, start, end = _span_text(members)
+                md = dict(best.metadata)
+                md.update(
+                    {
+                        "char_start": start,
+                        "char_end": end,
+                        "chunk_index": min(int(m.metadata.get("chunk_index", 0)) for m in members),
+                        "merged_chunk_ids": [m.chunk_id for m in sorted(members, key=lambda m: int(m.metadata["char_start"]))],
+                    }
+                )
+                finite = [m.distance for m in members if m.distance == m.distance]
+                h = replace(best, text=text, metadata=md, distance=min(finite) if finite else best.distance)
+        out.append(replace(h, rank=len(out) + 1))
+
+    info = {
+        "candidates": len(hits),
+        "merged": n_merged,
+        "duplicates": n_dupes,
+        "returned": len(out),
+    }
+    return out, info
@@ -0,0 +1,173 @@
+# 检索入口：按 Settings 组合检索阶段（可选文档路由 → 纯向量 / 混合检索 → 可选 cross-encoder 重排 → 重叠命中合并 → 邻居上下文扩展），CLI 与 API 共用
+from __future__ import annotations
+
+import time
+from dataclasses import fields
+from typing import Any, Optional
+
+from policy_rag.config.settings import Settings
+from policy_rag.index.adjacency import AdjacencyIndex, open_adjacency_index
+from policy_rag.index.base import VectorStore
+from policy_rag.index.doc_router import DocRouter, open_doc_router, route_documents
+from policy_rag.index.lexical_index import LexicalIndex, open_lexical_index
+from policy_rag.llm.embeddings import embed_query
+from policy_rag.retrieval.expand import expand_hits_with_neighbors
+from policy_rag.retrieval.hybrid import retrieve_hybrid
+from policy_rag.retrieval.merge import merge_overlapping_hits
+from policy_rag.retrieval.rerank import get_reranker
+from policy_rag.retrieval.retriever import RetrievedChunk, retrieve_top_k
+
+RETRIEVAL_MODES = ("dense", "hybrid")
+
+def _first_stage(
+    settings: Settings,
+    store: VectorStore,
+    query: str,
+    top_k: int,
+    where: Optional[dict[str, Any]],
+    lexical: LexicalIndex | None,
+) -> list[RetrievedChunk]:
+    if settings.retrieval_mode == "dense":
+        return retrieve_top_k(store, query, settings.embedding_model, top_k, where)
+    if settings.retrieval_mode == "hybrid":
+        return retrieve_hybrid(
+            store,
+            lexical if lexical is not None else open_lexical_index(settings),
+            query,
+            settings.embedding_model,
+            top_k=top_k,
+            where=where,
+            candidates=settings.hybrid_candidates,
+            rrf_k=settings.hybrid_rrf_k,
+        )
+    raise ValueError(f"Unknown RETRIEVAL_MODE={settings.retrieval_mode!r}. Allowed: {list(RETRIEVAL_MODES)}")
+
+# 检索各阶段与证据门槛读取的配置项按前缀归组：以后新增的同类参数自动进入 retrieval_signature，不会漏掉
+_SIGNATURE_PREFIXES = ("retrieval_", "hybrid_", "doc_routing_", "rerank_", "dedup_", "merge_", "neighbor_", "evidence_")
+# 只影响速度 / 内存、不改变命中结果的项
+_SIGNATURE_EXCLUDE = frozenset({"rerank_batch_size", "rerank_cache_size"})
+
+def retrieval_signature(settings: Settings) -> dict[str, Any]:
+    """
+    影响检索结果与拒答判断的配置项；答案缓存把它放进 key，调了任何检索 / 门槛参数后不会复用旧回答。
+    """
+    sig: dict[str, Any] = {"embedding_model": settings.embedding_model, "vector_store": settings.vector_store}
+    for f in fields(settings):
+        if f.name.startswith(_SIGNATURE_PREFIXES) and f.name not in _SIGNATURE_EXCLUDE:
+            sig[f.name] = getattr(settings, f.name)
+    return sig
+
+def _has_doc_filter(where: Optional[dict[str, Any]]) -> bool:
+    if not where:
+        return False
+    if "doc_id" in where:
+        return True
+    return any(_has_doc_filter(w) for w in where.get("$and", []))
+
+def _route(
+    settings: Settings,
+    query: str,
+    where: Optional[dict[str, Any]],
+    router: DocRouter,
+) -> tuple[Optional[dict[str, Any]], dict[str, Any]]:
+    """文档路由：置信度足够时在 where 上追加 doc_id $in 过滤，否则原样返回（全局检索）。"""
+    t0 = time.perf_counter()
+    # embed_query 有进程内缓存，随后的 chunk 检索不会重复编码
+    scored = router.scores(embed_query(query, settings.embedding_model))
+    picked, info = route_documents(
+        scored,
+        top_m=settings.doc_routing_top_m,
+        min_score=settings.doc_routing_min_score,
+        min_margin=settings.doc_routing_min_margin,
+    )
+    info["elapsed_ms"] = (time.perf_counter() - t0) * 1000
+    if picked is None:
+        return where, info
+    doc_filter = {"doc_id": {"$in": picked}}
+    return ({"$and": [where, doc_filter]} if where else doc_filter), info
+
+def retrieve_traced(
+    settings: Settings,
+    store: VectorStore,
+    query: str,
+    top_k: int = 8,
+    where: Optional[dict[str, Any]] = None,
+    lexical: LexicalIndex | None = None,
+    adjacency: AdjacencyIndex | None = None,
+    expand_neighbors: Optional[int] = None,
+    router: DocRouter | None = None,
+) -> tuple[list[RetrievedChunk], dict[str, Any]]:
+    """
+    返回 (命中列表, 各阶段耗时信息)；API 把耗时信息放进响应，便于观察每个阶段的成本。
+    expand_neighbors 为 None 时使用 Settings.neighbor_expand。
+    """
+    trace: dict[str, Any] = {"mode": settings.retrieval_mode}
+
+    # 合并重叠命中会腾出名额，需要多取一些候选用来补位
+    n_ranked = top_k * max(1, settings.dedup_overfetch) if settings.dedup_merge_enabled else top_k
+    n_first = max(n_ranked, settings.rerank_candidates) if settings.rerank_enabled else n_ranked
+
+    routed_where = where
+    routing = settings.doc_routing_enabled and not _has_doc_filter(where)
+    if routing:
+        router = router if router is not None else open_doc_router(settings)
+        routed_where, trace["routing"] = _route(settings, query, where, router)
+
+    t0 = time.perf_counter()
+    hits = _first_stage(settings, store, query, n_first, routed_where, lexical)
+    if routed_where is not where:
+        # n_first 是为重排 / 去重补位多取的候选数，少数几个文档里通常凑不满；
+        # 只有连最终需要的条数（DOC_ROUTING_MIN_HITS，默认 top_k）都不够时才退回全局检索，避免因为路由而丢证据
+        min_hits = min(settings.doc_routing_min_hits or top_k, n_first)
+        trace["routing"].update({"routed_hits": len(hits), "min_hits": min_hits})
+        if len(hits) < min_hits:
+            trace["routing"]["fallback"] = "few_hits"
+            hits = _first_stage(settings, store, query, n_first, where, lexical)
+    if routing:
+        router.record_decision(trace["routing"].get("fallback"))
+    trace["retrieve_ms"] = (time.perf_counter() - t0) * 1000
+
+    if settings.rerank_enabled:
+        hits, trace["rerank"] = get_reranker(settings).rerank(
+            query, hits, top_k=n_ranked, budget_ms=settings.rerank_budget_ms
+        )
+
+    if settings.dedup_merge_enabled:
+        hits, trace["dedup"] = merge_overlapping_hits(hits, top_k, max_span_chars=settings.merge_max_span_chars)
+
+    n_expand = settings.neighbor_expand if expand_neighbors is None else expand_neighbors
+    if n_expand > 0:
+        t1 = time.perf_counter()
+        hits, trace["expand"] = expand_hits_with_neighbors(
+            hits,
+            adjacency if adjacency is not None else open_adjacency_index(settings),
+            store,
+            n_neighbors=n_expand,
+            max_chars=settings.neighbor_max_chars,
+        )
+        trace["expand"]["elapsed_ms"] = (time.perf_counter() - t1) * 1000
+    return hits, trace
+
+def retrieve(
+    settings: Settings,
+    store: VectorStore,
+    query: str,
+    top_k: int = 8,
+    where: Optional[dict[str, Any]] = None,
+    lexical: LexicalIndex | None = None,
+    adjacency: AdjacencyIndex | None = None,
+    expand_neighbors: Optional[int] = None,
+    router: DocRouter | None = None,
+) -> list[RetrievedChunk]:
+    hits, _ = retrieve_traced(
+        settings,
+        store,
+        query,
+        top_k=top_k,
+        where=where,
+        lexical=lexical,
+        adjacency=adjacency,
+        expand_neighbors=expand_neighbors,
+        router=router,
+    )
+    return hits
@@ -0,0 +1,152 @@
+# Cross-encoder 重排序（RERANK_ENABLED=1）
+# 向量检索多取一些候选（例如 50 个），再用本地 CPU cross-encoder（bge-reranker）对 (query, chunk) 逐对打分，
+# 留下更少、更准的证据，LLM 的 prompt 也随之变短。
+# - (query 哈希, chunk_id) -> 分数 做进程内 LRU 缓存，热门问题重复提问时不再重算
+# - 每个请求有时间预算：预算内打不完所有候选就放弃重排，退回向量检索的原始顺序
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from policy_rag.config.settings import Settings
+from policy_rag.llm.embedding_cache import normalize_query
+from policy_rag.retrieval.retriever import RetrievedChunk
+
+def query_hash(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+class PairScoreCache:
+    """(query_hash, chunk_id) -> cross-encoder 分数 的 LRU 缓存。"""
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data: OrderedDict[tuple[str, str], float] = OrderedDict()
+
+    def get_many(self, qh: str, chunk_ids: list[str]) -> dict[str, float]:
+        out: dict[str, float] = {}
+        with self._lock:
+            for cid in chunk_ids:
+                v = self._data.get((qh, cid))
+                if v is None:
+                    self.misses += 1
+                    continue
+                self._data.move_to_end((qh, cid))
+                self.hits += 1
+                out[cid] = v
+        return out
+
+    def put_many(self, qh: str, scores: dict[str, float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for cid, v in scores.items():
+                self._data[(qh, cid)] = v
+                self._data.move_to_end((qh, cid))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+class Reranker:
+    def __init__(self, model_name: str, batch_size: int = 16, cache_size: int = 20000, max_length: int = 512):
+        self.model_name = model_name
+        self.batch_size = max(1, int(batch_size))
+        self.max_length = int(max_length)
+        self.cache = PairScoreCache(cache_size)
+        self._model: Any = None
+        self._load_lock = threading.Lock()
+
+    def _get_model(self) -> Any:
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self._model
+
+    def warmup(self) -> None:
+        self._get_model().predict([("预热", "预热")], batch_size=1, show_progress_bar=False)
+
+    def rerank(
+        self,
+        query: str,
+        hits: list[RetrievedChunk],
+        top_k: int,
+        budget_ms: float = 300.0,
+    ) -> tuple[list[RetrievedChunk], dict[str, Any]]:
+        """
+        返回 (重排后的前 top_k 个命中, 耗时/缓存信息)。
+        超出 budget_ms 仍未打完分时退回向量顺序（info["applied"]=False, info["timed_out"]=True）。
+        """
+        t0 = time.perf_counter()
+        deadline = t0 + max(0.0, budget_ms) / 1000.0
+        qh = query_hash(query)
+
+        scores = self.cache.get_many(qh, [h.chunk_id for h in hits])
+        cache_hits = len(scores)
+        todo = [h for h in hits if h.chunk_id not in scores]
+
+        timed_out = False
+        last_batch_s = 0.0
+        for i in range(0, len(todo), self.batch_size):
+            now = time.perf_counter()
+            # 按上一批的耗时预估，这一批肯定超预算就不再开始
+            if now >= deadline or now + last_batch_s > deadline:
+                timed_out = True
+                break
+            batch = todo[i:i + self.batch_size]
+            pred = self._get_model().predict(
+                [(query, h.text) for h in batch],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            fresh = {h.chunk_id: float(s) for h, s in zip(batch, np.asarray(pred).reshape(-1))}
+            # 超时放弃重排时，已算出的分数也留在缓存里，下一次同样的问题可以直接用
+            self.cache.put_many(qh, fresh)
+            scores.update(fresh)
+            last_batch_s = time.perf_counter() - now
+
+        if timed_out:
+            out = hits[:top_k]
+        else:
+            ranked = sorted(hits, key=lambda h: scores[h.chunk_id], reverse=True)[:top_k]
+            out = [replace(h, rank=i, rerank_score=scores[h.chunk_id]) for i, h in enumerate(ranked, start=1)]
+
+        info = {
+            "model": self.model_name,
+            "candidates": len(hits),
+            "scored": len(scores) - cache_hits,
+            "cache_hits": cache_hits,
+            "budget_ms": budget_ms,
+            "elapsed_ms": (time.perf_counter() - t0) * 1000,
+            "timed_out": timed_out,
+            "applied": not timed_out,
+        }
+        return out, info
+
+@lru_cache(maxsize=1)
+def _get_reranker(model_name: str, batch_size: int, cache_size: int) -> Reranker:
+    return Reranker(model_name, batch_size=batch_size, cache_size=cache_size)
+
+def get_reranker(settings: Settings) -> Reranker:
+    """进程级共享的 reranker（模型与分数缓存只各有一份）。"""
+    return _get_reranker(settings.rerank_model, settings.rerank_batch_size, settings.rerank_cache_size)
@@ -3,8 +3,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Optional
 
-from policy_rag.index.chroma_store import ChromaStore
-from policy_rag.llm.embeddings import embed_texts
+from policy_rag.index.base import VectorStore
+from policy_rag.llm.embeddings import embed_queries, embed_query
 
 @dataclass
 class RetrievedChunk:
@@ -13,21 +13,27 @@ class RetrievedChunk:
     distance: float
     text: str
     metadata: dict[str, Any]
+    # 混合检索时才有：归一化后的 RRF 融合分（0~1，越大越相关）与 BM25 分；纯词面命中的 chunk distance 为 NaN
+    fused_score: Optional[float] = None
+    lexical_score: Optional[float] = None
+    # 开启 cross-encoder 重排时的 (query, chunk) 相关性分数（越大越相关）
+    rerank_score: Optional[float] = None
 
-def retrieve_top_k(
-    store: ChromaStore,
-    query: str,
-    model_name: str,
-    top_k: int = 8,
-    where: Optional[dict[str, Any]] = None,
-) -> list[RetrievedChunk]:
-    q_emb = embed_texts([query], model_name=model_name, batch_size=1)
-    res = store.query(q_emb, top_k, where)
+def build_where(doc_id: Optional[str], category: Optional[str]) -> Optional[dict[str, Any]]:
+    if doc_id and category:
+        return {"$and": [{"doc_id": doc_id}, {"category": category}]}
+    if doc_id:
+        return {"doc_id": doc_id}
+    if category:
+        return {"category": category}
+    return None
 
-    ids = (res.get("ids") or [[]])[0]
-    docs = (res.get("documents") or [[]])[0]
-    metas = (res.get("metadatas") or [[]])[0]
-    dists = (res.get("distances") or [[]])[0]
+def _hits_from_result(res: dict[str, Any], qi: int) -> list[RetrievedChunk]:
+    # store.query 的结果按 query 分组（嵌套 list），qi 是第几条 query
+    ids = (res.get("ids") or [[]])[qi]
+    docs = (res.get("documents") or [[]])[qi]
+    metas = (res.get("metadatas") or [[]])[qi]
+    dists = (res.get("distances") or [[]])[qi]
 
     out: list[RetrievedChunk] = []
     for i in range(len(ids)):
@@ -35,13 +41,45 @@ def retrieve_top_k(
             RetrievedChunk(
                 rank=i + 1,
                 chunk_id=ids[i],
-                distance=float(dists[i]) if dists[i] and dists[i] is not None else float("nan"),
+                # 注意 distance=0.0（完全相同的文本）也是合法值，不能当成缺失
+                distance=float(dists[i]) if dists[i] is not None else float("nan"),
                 text=str(docs[i] or ""),
                 metadata=metas[i],
             )
         )
     return out
 
+def retrieve_top_k(
+    store: VectorStore,
+    query: str,
+    model_name: str,
+    top_k: int = 8,
+    where: Optional[dict[str, Any]] = None,
+) -> list[RetrievedChunk]:
+    q_emb = embed_query(query, model_name=model_name)
+    res = store.query(q_emb.reshape(1, -1), top_k, where)
+    return _hits_from_result(res, 0)
+
+def retrieve_top_k_batch(
+    store: VectorStore,
+    queries: list[str],
+    model_name: str,
+    top_k: int = 8,
+    where: Optional[dict[str, Any]] = None,
+    batch_size: int = 64,
+) -> list[list[RetrievedChunk]]:
+    """
+    批量检索：所有 query 分批编码，每批只发一次多向量 store.query。
+    返回与 queries 一一对应的 RetrievedChunk 列表。
+    """
+    out: list[list[RetrievedChunk]] = []
+    step = max(1, batch_size)
+    for i in range(0, len(queries), step):
+        q_emb = embed_queries(queries[i:i + step], model_name=model_name, batch_size=step)
+        res = store.query(q_emb, top_k, where)
+        out.extend(_hits_from_result(res, qi) for qi in range(q_emb.shape[0]))
+    return out
+
 def make_snippet(text: str, max_chars: int = 140) -> str:
     s = (text or "").replace("\n", "").strip()
     if len(s) <= max_chars:
@@ -31,4 +31,9 @@ class StructuredAnswer(BaseModel):
     # 不确定性与追问（允许无引用，但必须明确“缺证据“）
     uncertainties: list[str] = Field(default_factory=list, description="证据不足但用户常关心的信息点（明确写不确定）")
     follow_up_questions: list[str] = Field(default_factory=list, description="为了得到确定答案，需要用户补充的问题")
-    warnings: list[str] = Field(default_factory=list, description="免责声明/核对最新版提醒")
\ No newline at end of file
+    warnings: list[str] = Field(default_factory=list, description="免责声明/核对最新版提醒")
+
+# 所有“要点列表“字段：流式输出时每条 Item 一闭合就可以单独下发（见 IncrementalJSONParser）
+ITEM_SECTIONS: tuple[str, ...] = tuple(
+    name for name, f in StructuredAnswer.model_fields.items() if f.annotation == list[Item]
+)
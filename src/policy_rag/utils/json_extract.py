@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+from typing import Any, Iterable, Optional
 
 import re
 
@@ -93,3 +93,137 @@ def extract_first_json(text: str) -> Any:
                 f"Invalid JSON from LLM even after sanitization: {e}. "
                 f"Context around pos {e.pos}: {context}"
             ) from e
+
+
+def _loads_repaired(payload: str) -> Any:
+    try:
+        return json.loads(payload)
+    except json.JSONDecodeError:
+        return json.loads(_quote_unquoted_keys(_escape_control_chars_inside_json_strings(payload)))
+
+
+_KEY_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
+
+
+class IncrementalJSONParser:
+    """
+    流式 LLM 输出的增量 JSON 解析：逐块 feed 模型输出，根对象里 sections 指定的数组中
+    每个元素对象一闭合（收到对应的 '}'）就立即解析并返回，UI 可以边生成边渲染清单条目。
+
+    - 单遍扫描、可跨 chunk 续接：字符串 / 转义 / 括号栈状态都保存在实例上，每个字符只看一次
+    - 条目切片解析时沿用 extract_first_json 的修复（裸 key、字符串里的原始换行等控制字符）
+    - 根对象之前的前缀文本（模型的开场白等）会被跳过
+    - 最终结果仍以 close()（= extract_first_json(完整文本)）为准
+    """
+
+    def __init__(self, sections: Optional[Iterable[str]] = None):
+        # None 表示根对象下所有数组里的对象元素都返回
+        self.sections = frozenset(sections) if sections is not None else None
+        self._chunks: list[str] = []
+        self._stack: list[str] = []
+        self._in_str = False
+        self._escaped = False
+        self._done = False
+
+        # 根对象这一层的 key 识别（支持带引号与裸 key）
+        self._expect_key = False
+        self._key_mode: Optional[str] = None # None | "quoted" | "bare"
+        self._key_chars: list[str] = []
+        self._section: Optional[str] = None
+
+        self._item_parts: Optional[list[str]] = None
+        self._counts: dict[str, int] = {}
+
+    def feed(self, chunk: str) -> list[tuple[str, int, Any]]:
+        """返回本块里闭合的条目：[(section, 该 section 内的序号, 解析后的对象), ...]"""
+        if not chunk:
+            return []
+        self._chunks.append(chunk)
+        if self._done:
+            return []
+
+        out: list[tuple[str, int, Any]] = []
+        item_start = 0 if self._item_parts is not None else -1
+        stack = self._stack
+
+        for i, ch in enumerate(chunk):
+            if not stack:
+                # 还没进入根节点：跳过前缀文本
+                if ch == "{" or ch == "[":
+                    stack.append(ch)
+                    self._expect_key = ch == "{"
+                continue
+
+            if self._in_str:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_str = False
+                    continue
+                if self._key_mode == "quoted":
+                    self._key_chars.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_str = True
+                if len(stack) == 1 and self._expect_key:
+                    self._key_mode, self._key_chars = "quoted", []
+            elif len(stack) == 1 and self._expect_key and ch in _KEY_CHARS:
+                if self._key_mode is None:
+                    self._key_mode, self._key_chars = "bare", []
+                self._key_chars.append(ch)
+            elif ch == ":":
+                if len(stack) == 1 and self._expect_key:
+                    self._section = "".join(self._key_chars)
+                    self._expect_key, self._key_mode = False, None
+            elif ch == ",":
+                if len(stack) == 1 and stack[0] == "{":
+                    self._expect_key, self._key_mode = True, None
+            elif ch == "{" or ch == "[":
+                stack.append(ch)
+                if (
+                    ch == "{"
+                    and len(stack) == 3
+                    and stack[0] == "{"
+                    and stack[1] == "["
+                    and (self.sections is None or self._section in self.sections)
+                ):
+                    self._item_parts, item_start = [], i
+            elif ch == "}" or ch == "]":
+                stack.pop()
+                if self._item_parts is not None and len(stack) == 2:
+                    self._item_parts.append(chunk[item_start : i + 1])
+                    item = self._emit("".join(self._item_parts))
+                    if item is not None:
+                        out.append(item)
+                    self._item_parts, item_start = None, -1
+                if not stack:
+                    self._done = True
+                    break
+
+        if self._item_parts is not None and item_start >= 0:
+            self._item_parts.append(chunk[item_start:])
+        return out
+
+    def _emit(self, payload: str) -> Optional[tuple[str, int, Any]]:
+        section = self._section or ""
+        try:
+            obj = _loads_repaired(payload)
+        except json.JSONDecodeError:
+            # 单个条目修不好就跳过，整体是否合法由 close() 判定
+            return None
+        idx = self._counts.get(section, 0)
+        self._counts[section] = idx + 1
+        return section, idx, obj
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def close(self) -> Any:
+        return extract_first_json(self.text())